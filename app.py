@@ -1,39 +1,482 @@
-from flask import Flask, request, jsonify
+import hmac
+import os
+import time
+from functools import wraps
+
+from flask import Flask, Response, abort, g, make_response, request, jsonify, send_file
 from flask_cors import CORS
 
-from ml.recommendation import get_crop_recommendations
+from ml.admission import AdmissionController
+from ml.metrics import (CONTENT_TYPE, METRICS_DIR, METRICS_SNAPSHOT_INTERVAL, degraded_responses, exceptions,
+                        http_request_seconds, http_requests, metrics, render_all, shed_requests, stage_span)
+from ml.model_registry import ModelLoadError
+from ml.profiling import RequestProfiler
+from ml.worker_broadcast import WorkerBroadcast
+from ml.recommendation import (MockRecommendations, get_crop_recommendations, get_crop_recommendations_batch,
+                               get_degraded_recommendations, get_farm_index, get_suitability_surface, model_registry,
+                               parse_flag, recommendation_cache, request_batcher, similar_farms_k)
 
 app = Flask(__name__)
 CORS(app)
 
+# Shared secret for admin endpoints, sent as X-Admin-Token; without it the
+# admin endpoints are disabled (the peer address is never trusted, since
+# behind a local reverse proxy every client looks like localhost)
+ADMIN_TOKEN = os.environ.get('AGROVIA_ADMIN_TOKEN')
+
+# Poll for newly published model bundles every N seconds (0 disables the watcher)
+MODEL_WATCH_INTERVAL = float(os.environ.get('AGROVIA_MODEL_WATCH_INTERVAL', '0'))
+
+# At most AGROVIA_MAX_IN_FLIGHT requests run the models at once (0 disables
+# admission control) and AGROVIA_MAX_QUEUED more may wait; a request that
+# cannot start within its deadline gets a degraded, model-free answer. Keep
+# the in-flight limit at or above AGROVIA_BATCH_MAX_SIZE when batching.
+admission = AdmissionController(
+    max_in_flight=int(os.environ.get('AGROVIA_MAX_IN_FLIGHT', '8')),
+    max_queued=int(os.environ.get('AGROVIA_MAX_QUEUED', '32')),
+    deadline_ms=float(os.environ.get('AGROVIA_REQUEST_DEADLINE_MS', '1000'))
+)
+
+# Header a client may send to ask for a tighter deadline than the server's
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+# Header an admin sends to have one request profiled
+PROFILE_HEADER = 'X-Profile'
+
+# Saved request profiles (armed through /admin/profiling)
+request_profiler = RequestProfiler(os.environ.get(
+    'AGROVIA_PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ml', 'profiles')))
+
+# Admin actions that change per-process state; serve.py points
+# AGROVIA_BROADCAST_LOG at a file shared by its workers so they reach all of them
+admin_broadcast = WorkerBroadcast(os.environ.get('AGROVIA_BROADCAST_LOG'))
+admin_broadcast.register('reload_models', lambda params: model_registry.reload(params.get('version')))
+admin_broadcast.register('clear_cache', lambda params: recommendation_cache.clear())
+admin_broadcast.register('enable_profiling', lambda params: request_profiler.enable(
+    count=params.get('count'), sample_rate=params.get('sampleRate')))
+admin_broadcast.register('disable_profiling', lambda params: request_profiler.disable())
+
+def is_admin_request():
+    """True if an admin token is configured and the request carries it."""
+    if not ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), ADMIN_TOKEN.encode())
+
+def admin_required(view):
+    """Restrict an endpoint to holders of the admin token; 404 when none is configured."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            abort(404)
+        if not is_admin_request():
+            return jsonify({"error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+def profiled(view):
+    """
+    Profile the endpoint when an admin armed profiling or sends X-Profile.
+
+    Profiles hold other users' request inputs, so without an admin token
+    nothing is ever captured, and only the admin who asked for a profile is
+    told its name.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return view(*args, **kwargs)
+        requested = PROFILE_HEADER in request.headers and is_admin_request()
+        if not (request_profiler.active or requested):
+            return view(*args, **kwargs)
+
+        response, profile_name = request_profiler.run(
+            request.path, request.get_json(silent=True), view, *args, requested=requested, **kwargs)
+        if profile_name and requested:
+            response = make_response(response)
+            response.headers['X-Profile-Name'] = profile_name
+        return response
+    return wrapper
+
+def request_deadline_ms():
+    """The server's deadline, tightened by the client's deadline header if it sent one."""
+    deadline = admission.deadline_ms
+    try:
+        return min(deadline, float(request.headers[DEADLINE_HEADER]))
+    except (KeyError, ValueError):
+        return deadline
+
+def admission_controlled(degraded):
+    """
+    Run the endpoint only once admission control lets it in; otherwise
+    answer right away with ``degraded()``, marked by an X-Degraded header.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not admission.enabled:
+                return view(*args, **kwargs)
+
+            # Time already spent in this request counts against its deadline
+            elapsed_ms = (time.perf_counter() - g.get('request_started', time.perf_counter())) * 1000
+            reason = admission.acquire((request_deadline_ms() - elapsed_ms) / 1000)
+            if reason is not None:
+                shed_requests.labels(request.url_rule.rule, reason).inc()
+                response = make_response(degraded())
+                response.headers['X-Degraded'] = reason
+                return response
+            try:
+                return view(*args, **kwargs)
+            finally:
+                admission.release()
+        return wrapper
+    return decorator
+
+def degraded_recommendation():
+    data = request.get_json(silent=True)
+    data = data if isinstance(data, dict) else {}
+    degraded_responses.labels('/recommend').inc()
+    return jsonify(get_degraded_recommendations(
+        data.get('rainfall'), data.get('temperature'), data.get('fertilizerUsed'), data.get('irrigationUsed')
+    ))
+
+def degraded_batch():
+    data = request.get_json(silent=True)
+    farms = data.get('farms') if isinstance(data, dict) else data
+    if not isinstance(farms, list):
+        return jsonify({"error": "Request body must contain a list of farms"}), 400
+    degraded_responses.labels('/recommend/batch').inc()
+    results = [
+        {'recommendations': get_degraded_recommendations(
+            farm.get('rainfall'), farm.get('temperature'), farm.get('fertilizerUsed'), farm.get('irrigationUsed'))}
+        if isinstance(farm, dict) else {'error': "Invalid input: Each farm must be a JSON object"}
+        for farm in farms
+    ]
+    return jsonify({"results": results, "degraded": True})
+
+def overloaded():
+    # Surfaces and similar farms have no cheap stand-in; ask the client to come back
+    response = jsonify({"error": "Service overloaded, try again shortly"})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+def model_version_of(bundle):
+    """Version string reported to clients; 'mock' when no models are loaded."""
+    return bundle.version if bundle else 'mock'
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_request_seconds.labels(endpoint, request.method).observe(time.perf_counter() - started)
+        http_requests.labels(endpoint, request.method, str(response.status_code)).inc()
+    return response
+
 @app.route('/test', methods=['GET'])
 def test():
     return jsonify({"message": "Server is running!"})
 
 @app.route('/recommend', methods=['POST'])
+@admission_controlled(degraded_recommendation)
+@profiled
 def recommend_crop():
     try:
         # Extract data from the request
-        data = request.get_json()
-        region = data.get('region')
-        soil_type = data.get('soilType')
-        rainfall = data.get('rainfall')
-        temperature = data.get('temperature')
-        fertilizer_used = data.get('fertilizerUsed')
-        irrigation_used = data.get('irrigationUsed')
-        weather_condition = data.get('weatherCondition')
-        days_to_harvest = data.get('daysToHarvest')
+        with stage_span('parse_json'):
+            data = request.get_json()
+            region = data.get('region')
+            soil_type = data.get('soilType')
+            rainfall = data.get('rainfall')
+            temperature = data.get('temperature')
+            fertilizer_used = data.get('fertilizerUsed')
+            irrigation_used = data.get('irrigationUsed')
+            weather_condition = data.get('weatherCondition')
+            days_to_harvest = data.get('daysToHarvest')
+            # Optional yield and harvest-day intervals from the per-tree spread
+            prediction_intervals = parse_flag(data.get('predictionIntervals'))
+
+        # Pin one model bundle for the whole request so a hot reload cannot
+        # change models halfway through
+        bundle = model_registry.get()
 
         # Get recommendations using the ML module
         recommendations = get_crop_recommendations(
             region, soil_type, rainfall, temperature,
             fertilizer_used, irrigation_used,
-            weather_condition, days_to_harvest
+            weather_condition, days_to_harvest,
+            bundle=bundle, prediction_intervals=prediction_intervals
         )
                 
-        return jsonify(recommendations)
+        with stage_span('jsonify'):
+            response = jsonify(recommendations)
+        # A fallback to mock recommendations was not produced by the bundle
+        is_mock = isinstance(recommendations, MockRecommendations)
+        response.headers['X-Model-Version'] = 'mock' if is_mock else model_version_of(bundle)
+        return response
+    except Exception as e:
+        exceptions.labels('recommend').inc()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/recommend/batch', methods=['POST'])
+@admission_controlled(degraded_batch)
+@profiled
+def recommend_crop_batch():
+    try:
+        # Accept either {"farms": [...]} or a bare list of farm inputs
+        data = request.get_json()
+        farms = data.get('farms') if isinstance(data, dict) else data
+        if not isinstance(farms, list):
+            return jsonify({"error": "Request body must contain a list of farms"}), 400
+
+        # Map request fields onto the ML module's argument names
+        farm_inputs = [
+            {
+                'region': farm.get('region'),
+                'soil_type': farm.get('soilType'),
+                'rainfall': farm.get('rainfall'),
+                'temperature': farm.get('temperature'),
+                'fertilizer_used': farm.get('fertilizerUsed'),
+                'irrigation_used': farm.get('irrigationUsed'),
+                'weather_condition': farm.get('weatherCondition'),
+                'days_to_harvest': farm.get('daysToHarvest')
+            } if isinstance(farm, dict) else farm
+            for farm in farms
+        ]
+
+        # Score every farm in one vectorized call
+        bundle = model_registry.get()
+        prediction_intervals = parse_flag(data.get('predictionIntervals')) if isinstance(data, dict) else 0
+        results = get_crop_recommendations_batch(farm_inputs, bundle=bundle, prediction_intervals=prediction_intervals)
+
+        with stage_span('jsonify'):
+            response = jsonify({"results": results, "model_version": model_version_of(bundle)})
+        response.headers['X-Model-Version'] = model_version_of(bundle)
+        return response
     except Exception as e:
+        exceptions.labels('recommend_batch').inc()
         return jsonify({"error": str(e)}), 500
 
+@app.route('/recommend/surface', methods=['POST'])
+@admission_controlled(overloaded)
+@profiled
+def recommend_surface():
+    # Suitability, yield and harvest days over a rainfall x temperature grid,
+    # e.g. {"region": ..., "rainfall": {"min": 100, "max": 1000, "step": 25}, ...}
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+
+    bundle = model_registry.get()
+    try:
+        surface = get_suitability_surface(
+            data.get('region'), data.get('soilType'), data.get('weatherCondition'),
+            data.get('rainfall'), data.get('temperature'),
+            data.get('fertilizerUsed'), data.get('irrigationUsed'),
+            bundle=bundle
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except ModelLoadError as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        exceptions.labels('recommend_surface').inc()
+        return jsonify({"error": str(e)}), 500
+
+    with stage_span('jsonify'):
+        response = jsonify({**surface, "model_version": model_version_of(bundle)})
+    response.headers['X-Model-Version'] = model_version_of(bundle)
+    return response
+
+@app.route('/similar-farms', methods=['POST'])
+@admission_controlled(overloaded)
+@profiled
+def similar_farms():
+    # The k real farms from the dataset closest to this one in rainfall and
+    # temperature, within its region, soil type and weather condition
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+
+    index = get_farm_index()
+    if index is None:
+        return jsonify({"error": "Farm index is not available"}), 503
+    try:
+        with stage_span('similar_farms'):
+            farms = index.nearest(
+                data.get('region'), data.get('soilType'), data.get('weatherCondition'),
+                data.get('rainfall'), data.get('temperature'), similar_farms_k(data.get('k'))
+            )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        exceptions.labels('similar_farms').inc()
+        return jsonify({"error": str(e)}), 500
+
+    with stage_span('jsonify'):
+        return jsonify({"farms": farms})
+
+@app.route('/similar-farms/batch', methods=['POST'])
+@admission_controlled(overloaded)
+@profiled
+def similar_farms_batch():
+    # Accept either {"farms": [...], "k": 5} or a bare list of farm inputs
+    data = request.get_json(silent=True)
+    farms = data.get('farms') if isinstance(data, dict) else data
+    if not isinstance(farms, list):
+        return jsonify({"error": "Request body must contain a list of farms"}), 400
+
+    index = get_farm_index()
+    if index is None:
+        return jsonify({"error": "Farm index is not available"}), 503
+    try:
+        k = similar_farms_k(data.get('k') if isinstance(data, dict) else None)
+        farm_inputs = [
+            {
+                'region': farm.get('region'),
+                'soil_type': farm.get('soilType'),
+                'rainfall': farm.get('rainfall'),
+                'temperature': farm.get('temperature'),
+                'weather_condition': farm.get('weatherCondition')
+            } if isinstance(farm, dict) else farm
+            for farm in farms
+        ]
+        with stage_span('similar_farms'):
+            results = index.nearest_batch(farm_inputs, k)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        exceptions.labels('similar_farms_batch').inc()
+        return jsonify({"error": str(e)}), 500
+
+    with stage_span('jsonify'):
+        return jsonify({"results": results})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Under serve.py this covers every worker, not just the one scraped
+    return Response(render_all(), content_type=CONTENT_TYPE)
+
+@app.route('/admin/models', methods=['GET'])
+@admin_required
+def model_status():
+    return jsonify(model_registry.status())
+
+@app.route('/admin/models/reload', methods=['POST'])
+@admin_required
+def reload_models():
+    # Reload CURRENT, or switch to an explicit {"version": "..."}; an explicit
+    # version stays pinned (the watcher leaves it alone) until a reload without one
+    data = request.get_json(silent=True) or {}
+    try:
+        bundle = admin_broadcast.run('reload_models', {'version': data.get('version')})
+    except ModelLoadError as e:
+        return jsonify({"error": str(e), **model_registry.status()}), 409
+    return jsonify({"message": f"Model bundle {bundle.version} is now serving", **model_registry.status()})
+
+@app.route('/admin/cache', methods=['GET'])
+@admin_required
+def cache_status():
+    return jsonify(recommendation_cache.stats())
+
+@app.route('/admin/cache', methods=['DELETE'])
+@admin_required
+def clear_cache():
+    admin_broadcast.run('clear_cache')
+    return jsonify({"message": "Recommendation cache cleared", **recommendation_cache.stats()})
+
+@app.route('/admin/batcher', methods=['GET'])
+@admin_required
+def batcher_status():
+    return jsonify(request_batcher.stats())
+
+@app.route('/admin/lookup-table', methods=['GET'])
+@admin_required
+def lookup_table_status():
+    bundle = model_registry.get()
+    lookup_table = getattr(bundle, 'lookup_table', None)
+    if lookup_table is None:
+        return jsonify({"loaded": False, "model_version": model_version_of(bundle)})
+    return jsonify({"loaded": True, **lookup_table.describe()})
+
+@app.route('/admin/admission', methods=['GET'])
+@admin_required
+def admission_status():
+    return jsonify(admission.stats())
+
+@app.route('/admin/profiling', methods=['GET'])
+@admin_required
+def profiling_status():
+    return jsonify(request_profiler.status())
+
+@app.route('/admin/profiling', methods=['POST'])
+@admin_required
+def enable_profiling():
+    # {"count": N} profiles the next N requests, {"sampleRate": 0.01} one in a
+    # hundred; under serve.py the count applies in each worker
+    data = request.get_json(silent=True) or {}
+    try:
+        admin_broadcast.run('enable_profiling', {'count': data.get('count'), 'sampleRate': data.get('sampleRate')})
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid profiling settings: {e}"}), 400
+    return jsonify(request_profiler.status())
+
+@app.route('/admin/profiling', methods=['DELETE'])
+@admin_required
+def disable_profiling():
+    admin_broadcast.run('disable_profiling')
+    return jsonify(request_profiler.status())
+
+@app.route('/admin/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    return jsonify({"profiles": request_profiler.list_profiles()})
+
+@app.route('/admin/profiles/<name>', methods=['GET'])
+@admin_required
+def download_profile(name):
+    # ?format=json returns the inputs and top functions instead of the .prof file
+    if request.args.get('format') == 'json':
+        path = request_profiler.profile_path(name, '.json')
+        if path is None:
+            abort(404)
+        response = send_file(path, mimetype='application/json')
+    else:
+        path = request_profiler.profile_path(name)
+        if path is None:
+            abort(404)
+        response = send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                             download_name=f"{name}.prof")
+    # Profiles carry request inputs; keep them out of shared caches
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def collect_admission_metrics():
+    """Scrape-time gauges of the admission controller's current load."""
+    stats = admission.stats()
+    return [
+        ('agrovia_requests_in_flight', 'gauge', 'Requests currently running the models',
+         [('agrovia_requests_in_flight', {}, stats['in_flight'])]),
+        ('agrovia_requests_waiting', 'gauge', 'Requests waiting for admission',
+         [('agrovia_requests_waiting', {}, stats['waiting'])])
+    ]
+
+metrics.register_collector(collect_admission_metrics)
+
+def start_background_tasks():
+    """Start this process's background threads (the model bundle watcher and metrics snapshots)."""
+    if MODEL_WATCH_INTERVAL > 0:
+        model_registry.start_watcher(MODEL_WATCH_INTERVAL)
+    if METRICS_DIR is not None and METRICS_SNAPSHOT_INTERVAL > 0:
+        metrics.start_snapshot_writer(METRICS_DIR, METRICS_SNAPSHOT_INTERVAL)
+
+# serve.py imports the app before forking and starts these in each worker
+if os.environ.get('AGROVIA_PREFORK') != '1':
+    start_background_tasks()
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Parity and timing check for the vectorized analyze_crop_data.
+
+Runs the original per-crop implementation and the grouped pipeline on the
+same synthetic file, fails if their crop_insights differ, and reports the
+speedup.
+
+Usage:
+    python -m benchmarks.analyzer_parity --rows 1000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.generate_dataset import write_dataset
+from ml.data_analyzer import analyze_crop_data, analyze_crop_frame, CATEGORY_COLUMNS
+
+def reference_analyze_crop_frame(data):
+    """
+    The original per-crop implementation of analyze_crop_data, kept here as
+    the parity reference.
+    """
+    crop_insights = {}
+
+    for crop in data['Crop'].unique():
+        crop_data = data[data['Crop'] == crop]
+
+        high_yield_threshold = crop_data['Yield_tons_per_hectare'].quantile(0.75)
+        high_yield_data = crop_data[crop_data['Yield_tons_per_hectare'] >= high_yield_threshold]
+
+        if len(high_yield_data) > 0:
+            crop_insights[crop.lower()] = {
+                'optimal_rainfall_min': round(high_yield_data['Rainfall_mm'].quantile(0.25), 0),
+                'optimal_rainfall_max': round(high_yield_data['Rainfall_mm'].quantile(0.75), 0),
+                'optimal_temp_min': round(high_yield_data['Temperature_Celsius'].quantile(0.25), 1),
+                'optimal_temp_max': round(high_yield_data['Temperature_Celsius'].quantile(0.75), 1),
+                'avg_yield': round(crop_data['Yield_tons_per_hectare'].mean(), 1),
+                'max_yield': round(crop_data['Yield_tons_per_hectare'].max(), 1),
+                'min_yield': round(crop_data['Yield_tons_per_hectare'].min(), 1),
+                'avg_harvest_days': round(crop_data['Days_to_Harvest'].mean(), 0),
+                'min_harvest_days': round(crop_data['Days_to_Harvest'].min(), 0),
+                'max_harvest_days': round(crop_data['Days_to_Harvest'].max(), 0),
+                'fertilizer_usage_rate': round((crop_data['Fertilizer_Used'].sum() / len(crop_data)) * 100, 1),
+                'irrigation_usage_rate': round((crop_data['Irrigation_Used'].sum() / len(crop_data)) * 100, 1),
+                'best_weather': crop_data.groupby('Weather_Condition')['Yield_tons_per_hectare'].mean().idxmax(),
+                'best_soil': crop_data.groupby('Soil_Type')['Yield_tons_per_hectare'].mean().idxmax(),
+                'best_region': crop_data.groupby('Region')['Yield_tons_per_hectare'].mean().idxmax(),
+                'total_samples': len(crop_data),
+                'high_yield_samples': len(high_yield_data)
+            }
+
+    return crop_insights
+
+def reference_analyze_crop_data(csv_file_path):
+    """The original analyze_crop_data: default dtypes plus the per-crop loop."""
+    return reference_analyze_crop_frame(pd.read_csv(csv_file_path))
+
+def best_of(func, argument, repeats):
+    """Return the result and the fastest wall time of several runs."""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = func(argument)
+        timings.append(time.perf_counter() - started)
+    return result, min(timings)
+
+def compare(expected, actual):
+    """List every field where the two crop_insights dicts disagree."""
+    mismatches = []
+    for crop in sorted(set(expected) | set(actual)):
+        for key in sorted(set(expected.get(crop, {})) | set(actual.get(crop, {}))):
+            left = expected.get(crop, {}).get(key)
+            right = actual.get(crop, {}).get(key)
+            if left != right:
+                mismatches.append(f"{crop}.{key}: reference={left!r} vectorized={right!r}")
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the vectorized analyzer with the per-crop reference')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Rows in the synthetic dataset')
+    parser.add_argument('--csv', help='Use an existing CSV instead of generating one')
+    parser.add_argument('--repeats', type=int, default=3, help='Timing repeats per implementation')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        csv_path = args.csv or write_dataset(os.path.join(temp_dir, 'crop_yield.csv'), args.rows)
+
+        # End to end from the CSV file, as the service calls it
+        expected, reference_time = best_of(reference_analyze_crop_data, csv_path, args.repeats)
+        actual, vectorized_time = best_of(analyze_crop_data, csv_path, args.repeats)
+
+        # Analysis only, on frames already in memory
+        object_frame = pd.read_csv(csv_path)
+        category_frame = pd.read_csv(csv_path, dtype={column: 'category' for column in CATEGORY_COLUMNS})
+
+    _, reference_frame_time = best_of(reference_analyze_crop_frame, object_frame, args.repeats)
+    frame_result, vectorized_frame_time = best_of(analyze_crop_frame, category_frame, args.repeats)
+
+    mismatches = compare(expected, actual) + compare(expected, frame_result)
+    print(f"Rows: {len(object_frame)}  Crops: {len(actual)}")
+    print(f"From CSV    reference: {reference_time * 1000:8.1f} ms   vectorized: {vectorized_time * 1000:8.1f} ms "
+          f"({reference_time / vectorized_time:.1f}x)")
+    print(f"Frame only  reference: {reference_frame_time * 1000:8.1f} ms   vectorized: {vectorized_frame_time * 1000:8.1f} ms "
+          f"({reference_frame_time / vectorized_frame_time:.1f}x)")
+
+    if mismatches:
+        print("❌ Parity check failed:")
+        for mismatch in mismatches:
+            print(f"   {mismatch}")
+        raise SystemExit(1)
+    print("✅ Parity check passed: identical crop_insights")
+
+if __name__ == '__main__':
+    main()
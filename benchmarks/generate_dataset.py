@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Synthetic crop_yield.csv generator matching the schema of the real dataset.
+
+Usage:
+    python -m benchmarks.generate_dataset --rows 1000000 --output /tmp/crop_yield.csv
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+REGIONS = ['West', 'South', 'North', 'East']
+SOIL_TYPES = ['Sandy', 'Clay', 'Loam', 'Silt', 'Peaty', 'Chalky']
+CROPS = ['Cotton', 'Rice', 'Barley', 'Soybean', 'Wheat', 'Maize']
+WEATHER_CONDITIONS = ['Sunny', 'Rainy', 'Cloudy']
+
+# Column order of the real crop_yield.csv
+COLUMNS = [
+    'Region', 'Soil_Type', 'Crop', 'Rainfall_mm', 'Temperature_Celsius',
+    'Fertilizer_Used', 'Irrigation_Used', 'Weather_Condition',
+    'Days_to_Harvest', 'Yield_tons_per_hectare'
+]
+
+def generate_frame(rows, seed=42):
+    """
+    Generate a synthetic crop dataset with the same columns and value ranges
+    as the real data. Yield depends on rainfall, fertilizer, irrigation and
+    crop so the models and analyzer have real signal to work with.
+    """
+    rng = np.random.default_rng(seed)
+
+    crop_codes = rng.integers(0, len(CROPS), rows)
+    rainfall = rng.uniform(100, 1000, rows)
+    temperature = rng.uniform(15, 40, rows)
+    fertilizer = rng.random(rows) < 0.5
+    irrigation = rng.random(rows) < 0.5
+    crop_bonus = np.array([0.2, 0.6, -0.1, 0.0, 0.3, 0.4])[crop_codes]
+
+    crop_yield = (
+        rainfall * 0.005
+        + fertilizer * 1.5
+        + irrigation * 1.2
+        + crop_bonus
+        + rng.normal(0, 0.5, rows)
+    )
+
+    return pd.DataFrame({
+        'Region': np.array(REGIONS)[rng.integers(0, len(REGIONS), rows)],
+        'Soil_Type': np.array(SOIL_TYPES)[rng.integers(0, len(SOIL_TYPES), rows)],
+        'Crop': np.array(CROPS)[crop_codes],
+        'Rainfall_mm': rainfall,
+        'Temperature_Celsius': temperature,
+        'Fertilizer_Used': fertilizer,
+        'Irrigation_Used': irrigation,
+        'Weather_Condition': np.array(WEATHER_CONDITIONS)[rng.integers(0, len(WEATHER_CONDITIONS), rows)],
+        'Days_to_Harvest': rng.integers(60, 150, rows),
+        'Yield_tons_per_hectare': crop_yield
+    }, columns=COLUMNS)
+
+def write_dataset(output_path, rows, seed=42, chunk_rows=1_000_000):
+    """
+    Write a synthetic dataset to CSV in chunks so even 10M rows stay within
+    a modest memory budget.
+    """
+    written = 0
+    chunk_index = 0
+    while written < rows:
+        size = min(chunk_rows, rows - written)
+        frame = generate_frame(size, seed=seed + chunk_index)
+        frame.to_csv(output_path, mode='w' if written == 0 else 'a', header=written == 0, index=False)
+        written += size
+        chunk_index += 1
+    return output_path
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic crop_yield.csv')
+    parser.add_argument('--rows', type=int, default=100_000, help='Number of rows to generate')
+    parser.add_argument('--output', default='crop_yield.csv', help='Output CSV path')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    args = parser.parse_args()
+
+    write_dataset(args.output, args.rows, seed=args.seed)
+    print(f"✓ Wrote {args.rows} rows to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Compare the compiled forest engine with sklearn on the currently served
+model bundle: checks that predictions are bit-identical and reports
+single-row latency percentiles and batch throughput.
+
+Usage:
+    python -m benchmarks.inference_latency --rows 5000 --repeats 300
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from ml.forest_engine import compile_forest
+from ml.model_registry import ModelRegistry
+
+ML_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ml')
+
+def random_inputs(model, rows, seed=0):
+    """Random feature rows spanning the ranges of the real dataset."""
+    rng = np.random.default_rng(seed)
+    columns = {
+        'Region': rng.integers(0, 4, rows),
+        'Soil_Type': rng.integers(0, 6, rows),
+        'Rainfall_mm': rng.uniform(100, 1000, rows),
+        'Temperature_Celsius': rng.uniform(15, 40, rows),
+        'Fertilizer_Used': rng.integers(0, 2, rows),
+        'Irrigation_Used': rng.integers(0, 2, rows),
+        'Weather_Condition': rng.integers(0, 3, rows),
+        'Crop': rng.integers(0, 6, rows)
+    }
+    names = list(model.feature_names_in_)
+    return pd.DataFrame({name: columns[name].astype(float) for name in names}, columns=names)
+
+def percentiles(func, repeats):
+    """Latency percentiles in milliseconds over repeated calls."""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    p50, p99 = np.percentile(timings, [50, 99]) * 1000
+    return p50, p99
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark compiled forest inference against sklearn')
+    parser.add_argument('--rows', type=int, default=5000, help='Rows for the parity check and batch timing')
+    parser.add_argument('--repeats', type=int, default=300, help='Single-row calls per model and engine')
+    args = parser.parse_args()
+
+    bundle = ModelRegistry(ML_DIR, engine='sklearn').reload()
+    print(f"Model bundle: {bundle.version}")
+
+    failed = False
+    for name, model in (('crop', bundle.crop_model), ('yield', bundle.yield_model), ('harvest', bundle.harvest_model)):
+        started = time.perf_counter()
+        compiled = compile_forest(model)
+        compile_time = time.perf_counter() - started
+
+        method = 'predict_proba' if compiled.kind == 'classifier' else 'predict'
+        sklearn_predict = getattr(model, method)
+        compiled_predict = getattr(compiled, method)
+
+        data = random_inputs(model, args.rows)
+        matrix = data.to_numpy()
+        identical = np.array_equal(sklearn_predict(data), compiled_predict(matrix))
+        failed |= not identical
+
+        single_frame, single_matrix = data.iloc[:1], matrix[:1]
+        sk_p50, sk_p99 = percentiles(lambda: sklearn_predict(single_frame), args.repeats)
+        c_p50, c_p99 = percentiles(lambda: compiled_predict(single_matrix), args.repeats)
+        sk_batch = min(percentiles(lambda: sklearn_predict(data), 3))
+        c_batch = min(percentiles(lambda: compiled_predict(matrix), 3))
+
+        print(f"\n{name} model: {compiled.n_estimators} trees, {compiled.n_nodes} nodes, "
+              f"depth {compiled.max_depth}, compiled in {compile_time * 1000:.1f} ms")
+        print(f"   bit-identical {method}: {'yes' if identical else 'NO'}")
+        print(f"   single row p50/p99  sklearn {sk_p50:7.3f}/{sk_p99:7.3f} ms   "
+              f"compiled {c_p50:7.3f}/{c_p99:7.3f} ms   ({sk_p50 / c_p50:.1f}x at p50)")
+        print(f"   {args.rows} rows         sklearn {sk_batch:7.1f} ms           compiled {c_batch:7.1f} ms")
+
+    if failed:
+        raise SystemExit("❌ Compiled predictions differ from sklearn")
+    print("\n✅ Compiled engine matches sklearn bit for bit")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Accuracy and cost of the incremental insights sketch.
+
+Sketches a synthetic dataset in batches spread over several shards, merges
+the shards, and compares the merged insights with a one-pass sketch (must be
+identical) and with analyze_crop_data (must stay within the documented
+error bound).
+
+Usage:
+    python -m benchmarks.insights_sketch --rows 1000000 --batch-rows 10000 --shards 4
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from benchmarks.generate_dataset import write_dataset
+from ml.data_analyzer import ANALYZER_COLUMNS, analyze_crop_data
+from ml.dataset_store import read_dataset
+from ml.insights_sketch import RAINFALL_BINS, TEMPERATURE_BINS, InsightsSketch
+
+# Allowed absolute deviation per approximate field: one bin, plus the output rounding
+TOLERANCES = {
+    'optimal_rainfall_min': RAINFALL_BINS[2] + 1.0,
+    'optimal_rainfall_max': RAINFALL_BINS[2] + 1.0,
+    'optimal_temp_min': TEMPERATURE_BINS[2] + 0.1,
+    'optimal_temp_max': TEMPERATURE_BINS[2] + 0.1
+}
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the insights sketch against analyze_crop_data')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Rows in the synthetic dataset')
+    parser.add_argument('--csv', help='Use an existing CSV instead of generating one')
+    parser.add_argument('--batch-rows', type=int, default=10_000, help='Records per folded batch')
+    parser.add_argument('--shards', type=int, default=4, help='Sketches the batches are spread over')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        csv_path = args.csv or write_dataset(os.path.join(temp_dir, 'crop_yield.csv'), args.rows)
+        with contextlib.redirect_stdout(io.StringIO()):
+            exact = analyze_crop_data(csv_path)
+        data = read_dataset(csv_path, ANALYZER_COLUMNS)
+
+    one_pass = InsightsSketch().update(data).insights()
+
+    shards = [InsightsSketch() for _ in range(args.shards)]
+    batches = range(0, len(data), args.batch_rows)
+    started = time.perf_counter()
+    for index, start in enumerate(batches):
+        shards[index % args.shards].update(data.iloc[start:start + args.batch_rows])
+    fold_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    merged = InsightsSketch()
+    for shard in shards:
+        merged.merge(shard)
+    merge_seconds = time.perf_counter() - started
+    approximate = merged.insights()
+
+    print(f"Rows: {len(data)}  batches: {len(batches)}  shards: {args.shards}")
+    print(f"Fold  {fold_seconds / len(batches) * 1000:8.2f} ms per {args.batch_rows}-row batch "
+          f"({len(data) / fold_seconds:,.0f} rows/s)")
+    print(f"Merge {merge_seconds * 1000:8.2f} ms for {args.shards} shards")
+
+    failures = []
+    if approximate != one_pass:
+        failures.append("merged shards differ from the one-pass sketch")
+    if list(approximate) != list(exact):
+        failures.append(f"crops {list(approximate)} differ from {list(exact)}")
+
+    for crop, expected in exact.items():
+        actual = approximate.get(crop, {})
+        for key, value in expected.items():
+            if key == 'high_yield_samples':
+                print(f"   {crop:<10}{key:<24}exact {value:>10}  sketch {actual.get(key):>10}")
+                continue
+            if key in TOLERANCES:
+                deviation = abs(actual.get(key) - value)
+                if deviation > TOLERANCES[key] + 1e-9:
+                    failures.append(f"{crop}.{key}: exact={value} sketch={actual.get(key)}")
+                elif deviation:
+                    print(f"   {crop:<10}{key:<24}exact {value:>10}  sketch {actual.get(key):>10}")
+            elif actual.get(key) != value:
+                failures.append(f"{crop}.{key}: exact={value!r} sketch={actual.get(key)!r}")
+
+    if failures:
+        print("❌ Sketch check failed:")
+        for failure in failures:
+            print(f"   {failure}")
+        raise SystemExit(1)
+    print("✅ Sketch insights match analyze_crop_data within the documented error bound")
+
+if __name__ == '__main__':
+    main()
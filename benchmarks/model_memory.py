@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Measure the resident memory each serving worker pays for the model bundle,
+loading it the old way (unpickled sklearn forests compiled in-process) and
+from memory-mapped compiled artifacts, plain and compacted.
+
+Every mode starts N worker processes that load the same bundle and serve a
+few hundred single-row predictions, then reports per-worker RSS, PSS
+(shared pages split between the processes mapping them) and private memory
+while all workers are alive.
+
+Usage:
+    python -m benchmarks.model_memory --workers 4 [--version VERSION]
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from benchmarks.inference_latency import ML_DIR, random_inputs
+from ml.model_registry import (FOREST_MODELS, MODEL_FILES, ModelRegistry, export_compiled_model, load_bundle)
+
+MODES = {
+    'pickle': {'mmap': False, 'compact': False},
+    'mmap': {'mmap': True, 'compact': False},
+    'mmap-compact': {'mmap': True, 'compact': True}
+}
+
+def memory_kb():
+    """Rss, Pss and private memory of this process in kB (Linux only)."""
+    fields = {}
+    with open('/proc/self/smaps_rollup', 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':'):
+                fields[parts[0][:-1]] = int(parts[1])
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'private': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    }
+
+def prepare_bundles(source_path, work_dir):
+    """Copy a bundle's pickles into one bundle per mode, with the compiled artifacts each mode needs."""
+    source = load_bundle(source_path, 'source', engine='sklearn')
+    for mode, options in MODES.items():
+        bundle_dir = os.path.join(work_dir, mode)
+        os.makedirs(bundle_dir)
+        for file_name in MODEL_FILES.values():
+            os.symlink(os.path.join(source_path, file_name), os.path.join(bundle_dir, file_name))
+        if options['mmap']:
+            for name in FOREST_MODELS:
+                export_compiled_model(bundle_dir, name, getattr(source, name), compact=options['compact'])
+
+def worker(models_dir, mode, requests, barrier, results):
+    # Keep the registry's load messages from interleaving with the report
+    sys.stdout = open(os.devnull, 'w')
+    before = memory_kb()
+    bundle = ModelRegistry(ML_DIR, models_dir=models_dir, mmap=MODES[mode]['mmap']).reload(mode)
+
+    # Serve single-row requests so the pages inference touches are resident
+    for predictor in (bundle.crop_predictor, bundle.yield_predictor, bundle.harvest_predictor):
+        rows = random_inputs(predictor, requests, seed=os.getpid()).to_numpy()
+        for row in rows:
+            predictor.predict(row.reshape(1, -1))
+
+    # Measure once every worker has loaded, so shared pages are split between them
+    barrier.wait()
+    results.put((os.getpid(), before, memory_kb()))
+    barrier.wait()
+
+def run_mode(models_dir, mode, workers, requests):
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(models_dir, mode, requests, barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    measurements = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return measurements
+
+def main():
+    parser = argparse.ArgumentParser(description='Report per-worker memory for each model artifact layout')
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes per mode')
+    parser.add_argument('--requests', type=int, default=300, help='Single-row predictions per model and worker')
+    parser.add_argument('--version', help='Bundle to measure (defaults to the one being served)')
+    args = parser.parse_args()
+
+    version, source_path = ModelRegistry(ML_DIR).resolve(args.version)
+    print(f"Model bundle: {version}, {args.workers} workers per mode")
+
+    work_dir = tempfile.mkdtemp(prefix='agrovia-model-memory-')
+    try:
+        prepare_bundles(source_path, work_dir)
+        print(f"{'mode':<14}{'RSS before':>12}{'RSS after':>12}{'PSS after':>12}{'private':>12}   (MB per worker, mean)")
+        for mode in MODES:
+            measurements = run_mode(work_dir, mode, args.workers, args.requests)
+            before = np.mean([m[1]['rss'] for m in measurements]) / 1024
+            after = {key: np.mean([m[2][key] for m in measurements]) / 1024 for key in ('rss', 'pss', 'private')}
+            print(f"{mode:<14}{before:>12.1f}{after['rss']:>12.1f}{after['pss']:>12.1f}{after['private']:>12.1f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
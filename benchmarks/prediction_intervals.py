@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Cost of prediction intervals against today's point predictions.
+
+For the currently served bundle, times the yield and harvest forests the way
+the request path runs them today (one ``predict`` each) and with intervals
+(one ``predict_with_trees`` each plus the spread summary), for a single
+request's candidates and for batches. Also checks that the interval path's
+means are bit-identical to ``predict`` and times the whole model step of a
+request with and without intervals.
+
+Usage:
+    python -m benchmarks.prediction_intervals --repeats 300
+"""
+
+import argparse
+import os
+import time
+
+# Every request must reach the models
+os.environ['AGROVIA_CACHE_SIZE'] = '0'
+
+import numpy as np
+
+from benchmarks.inference_latency import random_inputs
+from ml.forest_engine import tree_spread
+from ml.recommendation import (PREDICTION_QUANTILES, encode_request, model_registry, predict_feature_rows,
+                               predict_feature_rows_with_intervals)
+
+# Candidate rows of a single request (top 3 crops) and typical batch sizes
+ROW_COUNTS = (3, 30, 300, 1000)
+
+def best_of(func, repeats):
+    """Median and best wall time of repeated calls, in milliseconds."""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return np.median(timings) * 1000, min(timings) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-tree prediction intervals against point predictions')
+    parser.add_argument('--repeats', type=int, default=300, help='Calls per measurement')
+    args = parser.parse_args()
+
+    bundle = model_registry.get()
+    print(f"Model bundle: {bundle.version}, quantiles {PREDICTION_QUANTILES}")
+    yield_predictor, harvest_predictor = bundle.yield_predictor, bundle.harvest_predictor
+
+    def current(yield_matrix, harvest_matrix):
+        yield_predictor.predict(yield_matrix)
+        harvest_predictor.predict(harvest_matrix)
+
+    def with_intervals(yield_matrix, harvest_matrix):
+        _, yield_trees = yield_predictor.predict_with_trees(yield_matrix)
+        _, harvest_trees = harvest_predictor.predict_with_trees(harvest_matrix)
+        tree_spread(yield_trees, PREDICTION_QUANTILES)
+        tree_spread(harvest_trees, PREDICTION_QUANTILES)
+
+    failed = False
+    print(f"\n{'rows':>6}{'predict ms':>14}{'intervals ms':>16}{'ratio':>9}")
+    for rows in ROW_COUNTS:
+        yield_matrix = random_inputs(yield_predictor, rows).to_numpy()
+        harvest_matrix = random_inputs(harvest_predictor, rows, seed=1).to_numpy()
+        for predictor, matrix in ((yield_predictor, yield_matrix), (harvest_predictor, harvest_matrix)):
+            mean, _ = predictor.predict_with_trees(matrix)
+            failed |= not np.array_equal(mean, predictor.predict(matrix))
+
+        repeats = max(3, args.repeats * 3 // rows)
+        current_ms, _ = best_of(lambda: current(yield_matrix, harvest_matrix), repeats)
+        intervals_ms, _ = best_of(lambda: with_intervals(yield_matrix, harvest_matrix), repeats)
+        print(f"{rows:>6}{current_ms:>14.3f}{intervals_ms:>16.3f}{intervals_ms / current_ms:>9.2f}")
+
+    # The whole model step of one request: crop model, then both regressors
+    features = encode_request(bundle, 'North', 'Loam', 512.3, 25.7, 'true', 'false', 'Sunny', None)[0]
+    request_ms, _ = best_of(lambda: predict_feature_rows(bundle, [features]), args.repeats)
+    request_intervals_ms, _ = best_of(lambda: predict_feature_rows_with_intervals(bundle, [features]), args.repeats)
+    print(f"\nOne request's model step: {request_ms:.3f} ms, with intervals {request_intervals_ms:.3f} ms "
+          f"({request_intervals_ms / request_ms:.2f}x)")
+
+    print("\n✅ Interval means identical to predict" if not failed else "\n❌ Interval means differ from predict")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
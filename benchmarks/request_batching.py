@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Measure what micro-batching does to concurrent single-farm requests.
+
+Runs the same random requests from N client threads through
+``get_crop_recommendations`` with the batcher off and on (the response
+cache is disabled so every request reaches the models), checks that the
+responses are identical and reports throughput, latency percentiles and the
+batcher's own statistics.
+
+Usage:
+    python -m benchmarks.request_batching --threads 16 --requests 2000
+"""
+
+import argparse
+import os
+import threading
+import time
+
+os.environ['AGROVIA_CACHE_SIZE'] = '0'
+
+import numpy as np
+
+from ml.recommendation import get_crop_recommendations, model_registry, request_batcher
+
+REGIONS = ['North', 'South', 'East', 'West']
+SOIL_TYPES = ['Clay', 'Sandy', 'Loam', 'Silt', 'Peaty', 'Chalky']
+WEATHER_CONDITIONS = ['Sunny', 'Rainy', 'Cloudy']
+FLAGS = ['true', 'false']
+
+def random_requests(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        (REGIONS[rng.integers(4)], SOIL_TYPES[rng.integers(6)],
+         round(float(rng.uniform(100, 1000)), 1), round(float(rng.uniform(15, 40)), 1),
+         FLAGS[rng.integers(2)], FLAGS[rng.integers(2)], WEATHER_CONDITIONS[rng.integers(3)], None)
+        for _ in range(count)
+    ]
+
+def run(requests, threads, bundle):
+    """Serve every request from ``threads`` client threads; returns responses, latencies, seconds."""
+    responses = [None] * len(requests)
+    latencies = [0.0] * len(requests)
+    next_index = iter(range(len(requests)))
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                index = next(next_index, None)
+            if index is None:
+                return
+            started = time.perf_counter()
+            responses[index] = get_crop_recommendations(*requests[index], bundle=bundle)
+            latencies[index] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=client) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return responses, np.array(latencies) * 1000, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark request micro-batching')
+    parser.add_argument('--threads', type=int, default=16, help='Concurrent client threads')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per run')
+    parser.add_argument('--max-batch-size', type=int, default=32, help='Batcher max batch size')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0, help='Batcher max wait')
+    args = parser.parse_args()
+
+    bundle = model_registry.get()
+    if bundle is None:
+        raise SystemExit("No model bundle could be loaded")
+    requests = random_requests(args.requests)
+
+    results = {}
+    for label, batch_size in (('unbatched', 1), ('batched', args.max_batch_size)):
+        request_batcher.max_batch_size = batch_size
+        request_batcher.max_wait_ms = args.max_wait_ms
+        run(requests[:50], args.threads, bundle)
+        results[label] = run(requests, args.threads, bundle)
+        responses, latencies, seconds = results[label]
+        p50, p99 = np.percentile(latencies, [50, 99])
+        print(f"{label:<10} {len(requests) / seconds:8.0f} req/s   p50 {p50:7.2f} ms   p99 {p99:7.2f} ms")
+
+    identical = results['unbatched'][0] == results['batched'][0]
+    stats = request_batcher.stats()
+    print(f"   mean batch size {stats['mean_batch_size']}, added wait p50/p99 "
+          f"{stats['added_wait_ms']['p50']}/{stats['added_wait_ms']['p99']} ms")
+    print(f"   batch sizes {stats['batch_size_buckets']}")
+    print(f"{'✅' if identical else '❌'} Batched responses {'match' if identical else 'differ from'} unbatched ones")
+    if not identical:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
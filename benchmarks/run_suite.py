@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Performance suite for the ML service.
+
+Covers the cold import of ``ml.recommendation`` (insights and model bundle
+loading included), analyze_crop_data throughput on a synthetic dataset,
+single-request and batch latency percentiles, and training wall time.
+Results are written to JSON; with ``--baseline`` every metric is compared
+against a stored run and the suite fails if any regressed by more than
+``--tolerance``.
+
+Usage:
+    python -m benchmarks.run_suite --rows 1000000 --output results.json
+    python -m benchmarks.run_suite --baseline benchmarks/baseline.json
+    python -m benchmarks.run_suite --save-baseline benchmarks/baseline.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Every request must reach the models
+os.environ['AGROVIA_CACHE_SIZE'] = '0'
+
+import numpy as np
+
+from benchmarks.generate_dataset import write_dataset
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SECTIONS = ('import', 'analyzer', 'latency', 'training')
+
+# Metrics where a bigger number is better; everything else is a duration
+HIGHER_IS_BETTER_SUFFIXES = ('_per_second',)
+
+COLD_IMPORT_SCRIPT = """
+import time
+started = time.perf_counter()
+import ml.recommendation as recommendation
+imported = time.perf_counter()
+recommendation.model_registry.get()
+print(imported - started, time.perf_counter() - imported)
+"""
+
+def latency_summary(prefix, timings):
+    """p50/p90/p99 in milliseconds for a list of durations in seconds."""
+    p50, p90, p99 = np.percentile(np.array(timings) * 1000, [50, 90, 99])
+    return {f"{prefix}_p50_ms": round(p50, 3), f"{prefix}_p90_ms": round(p90, 3), f"{prefix}_p99_ms": round(p99, 3)}
+
+def bench_import(args, work_dir):
+    """Wall time of a cold ``import ml.recommendation`` and the first model load, in fresh interpreters."""
+    import_times, load_times = [], []
+    for _ in range(args.import_repeats):
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_IMPORT_SCRIPT], cwd=REPO_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.split()
+        import_times.append(float(output[-2]))
+        load_times.append(float(output[-1]))
+    return {
+        'import_recommendation_seconds': round(float(np.median(import_times)), 3),
+        'model_bundle_load_seconds': round(float(np.median(load_times)), 3)
+    }
+
+def best_analyzer_seconds(path, repeats):
+    from ml.data_analyzer import analyze_crop_data
+
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            analyze_crop_data(path)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def bench_analyzer(args, work_dir):
+    """analyze_crop_data throughput on a synthetic dataset of ``--rows`` rows, from CSV and from its columnar store."""
+    from ml.dataset_store import convert_csv
+
+    csv_path = os.path.join(work_dir, 'analyzer.csv')
+    write_dataset(csv_path, args.rows)
+    best = best_analyzer_seconds(csv_path, args.repeats)
+
+    started = time.perf_counter()
+    store_path = os.path.join(work_dir, 'analyzer.columns')
+    convert_csv(csv_path, store_path)
+    convert_seconds = time.perf_counter() - started
+    store_best = best_analyzer_seconds(store_path, args.repeats)
+    return {
+        'analyzer_rows': args.rows,
+        'analyzer_seconds': round(best, 3),
+        'analyzer_rows_per_second': round(args.rows / best),
+        'dataset_store_convert_seconds': round(convert_seconds, 3),
+        'analyzer_store_seconds': round(store_best, 3),
+        'analyzer_store_rows_per_second': round(args.rows / store_best)
+    }
+
+def bench_latency(args, work_dir):
+    """Single-request and batch latency percentiles through the public functions."""
+    from benchmarks.request_batching import random_requests
+    from ml.recommendation import get_crop_recommendations, get_crop_recommendations_batch, model_registry
+
+    bundle = model_registry.get()
+    if bundle is None:
+        raise RuntimeError("No model bundle could be loaded")
+
+    requests = random_requests(args.latency_requests)
+    for request in requests[:20]:
+        get_crop_recommendations(*request, bundle=bundle)
+
+    single = []
+    for request in requests:
+        started = time.perf_counter()
+        get_crop_recommendations(*request, bundle=bundle)
+        single.append(time.perf_counter() - started)
+
+    keys = ('region', 'soil_type', 'rainfall', 'temperature', 'fertilizer_used', 'irrigation_used',
+            'weather_condition', 'days_to_harvest')
+    farms = [dict(zip(keys, request)) for request in requests]
+    batches = []
+    for start in range(0, len(farms) - args.batch_size + 1, args.batch_size):
+        started = time.perf_counter()
+        get_crop_recommendations_batch(farms[start:start + args.batch_size], bundle=bundle)
+        batches.append(time.perf_counter() - started)
+
+    metrics = latency_summary('single_request', single)
+    metrics.update(latency_summary(f"batch_{args.batch_size}", batches))
+    metrics['single_requests_per_second'] = round(len(single) / sum(single))
+    return metrics
+
+def bench_training(args, work_dir):
+    """Wall time of train_models.py on a synthetic dataset, without publishing."""
+    from ml import train_models
+
+    csv_path = os.path.join(work_dir, 'training.csv')
+    write_dataset(csv_path, args.train_rows)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        train_models.main([
+            '--data', csv_path, '--models-dir', os.path.join(work_dir, 'models'),
+            '--version', 'benchmark', '--no-publish', '--n-estimators', str(args.train_estimators)
+        ])
+    return {
+        'training_rows': args.train_rows,
+        'training_seconds': round(time.perf_counter() - started, 2)
+    }
+
+BENCHMARKS = {
+    'import': bench_import,
+    'analyzer': bench_analyzer,
+    'latency': bench_latency,
+    'training': bench_training
+}
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    import pandas
+    import sklearn
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pandas.__version__,
+        'scikit_learn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+def higher_is_better(metric):
+    return metric.endswith(HIGHER_IS_BETTER_SUFFIXES)
+
+def compare(results, baseline, tolerance):
+    """
+    Compare every metric present in both runs.
+
+    Returns:
+        list: Names of the metrics that regressed by more than ``tolerance``
+    """
+    regressions = []
+    print(f"\n{'metric':<36}{'baseline':>14}{'current':>14}{'change':>10}")
+    for metric, value in results['metrics'].items():
+        previous = baseline.get('metrics', {}).get(metric)
+        if not isinstance(previous, (int, float)) or not previous or metric.endswith('_rows'):
+            continue
+        change = (value - previous) / previous
+        worse = -change if higher_is_better(metric) else change
+        regressed = worse > tolerance
+        if regressed:
+            regressions.append(metric)
+        print(f"{metric:<36}{previous:>14}{value:>14}{change:>+9.1%}{'  ❌' if regressed else ''}")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run the ML service benchmark suite')
+    parser.add_argument('--only', help=f"Comma-separated sections to run ({', '.join(SECTIONS)})")
+    parser.add_argument('--rows', type=int, default=100_000, help='Synthetic rows for the analyzer benchmark (10K to 10M)')
+    parser.add_argument('--repeats', type=int, default=3, help='Analyzer runs; the best is reported')
+    parser.add_argument('--import-repeats', type=int, default=3, help='Cold imports; the median is reported')
+    parser.add_argument('--latency-requests', type=int, default=500, help='Single requests for the latency percentiles')
+    parser.add_argument('--batch-size', type=int, default=100, help='Farms per batch request')
+    parser.add_argument('--train-rows', type=int, default=20_000, help='Synthetic rows for the training benchmark')
+    parser.add_argument('--train-estimators', type=int, default=20, help='Trees per forest in the training benchmark')
+    parser.add_argument('--output', help='Write the results JSON here')
+    parser.add_argument('--baseline', help='Compare against this stored results JSON')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed relative regression per metric')
+    parser.add_argument('--save-baseline', help='Also store the results as the baseline at this path')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sections = args.only.split(',') if args.only else list(SECTIONS)
+    unknown = [section for section in sections if section not in BENCHMARKS]
+    if unknown:
+        raise SystemExit(f"Unknown sections: {', '.join(unknown)}")
+
+    results = {'environment': environment(), 'parameters': vars(args), 'metrics': {}}
+    with tempfile.TemporaryDirectory(prefix='agrovia-bench-') as work_dir:
+        for section in sections:
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()) if section == 'latency' else contextlib.nullcontext():
+                metrics = BENCHMARKS[section](args, work_dir)
+            results['metrics'].update(metrics)
+            print(f"✓ {section} ({time.perf_counter() - started:.1f}s)")
+            for metric, value in metrics.items():
+                print(f"   {metric:<36}{value}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+            print(f"✓ Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            return 1
+        print(f"\n✅ No metric regressed by more than {args.tolerance:.0%}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
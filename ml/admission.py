@@ -0,0 +1,89 @@
+"""
+Admission control for the recommendation endpoints.
+
+At most ``max_in_flight`` requests run the models at once and at most
+``max_queued`` more wait for a slot. A request that finds the queue full,
+or cannot get a slot before its deadline, is shed at once so the caller can
+answer it with a cheap degraded response instead of adding to the backlog
+every other request is stuck behind.
+"""
+
+import threading
+import time
+
+# Reasons a request is not admitted
+QUEUE_FULL = 'queue_full'
+DEADLINE = 'deadline'
+
+class AdmissionController:
+    """
+    A bounded in-flight limit with a bounded wait queue.
+
+    ``max_in_flight`` of 0 or less admits everything.
+    """
+
+    def __init__(self, max_in_flight=8, max_queued=32, deadline_ms=1000.0):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.deadline_ms = deadline_ms
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = {QUEUE_FULL: 0, DEADLINE: 0}
+        self._condition = threading.Condition()
+
+    @property
+    def enabled(self):
+        return self.max_in_flight > 0
+
+    def acquire(self, timeout):
+        """
+        Wait up to ``timeout`` seconds for an in-flight slot.
+
+        Returns:
+            str: None once admitted, otherwise why the request was shed
+                (QUEUE_FULL or DEADLINE); admitted requests must ``release``
+        """
+        with self._condition:
+            if self.in_flight < self.max_in_flight:
+                self.in_flight += 1
+                self.admitted += 1
+                return None
+            if self.waiting >= self.max_queued or timeout <= 0:
+                reason = QUEUE_FULL if self.waiting >= self.max_queued else DEADLINE
+                self.shed[reason] += 1
+                return reason
+
+            self.waiting += 1
+            give_up_at = time.monotonic() + timeout
+            try:
+                while self.in_flight >= self.max_in_flight:
+                    remaining = give_up_at - time.monotonic()
+                    if remaining <= 0:
+                        self.shed[DEADLINE] += 1
+                        return DEADLINE
+                    self._condition.wait(remaining)
+                self.in_flight += 1
+                self.admitted += 1
+                return None
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'enabled': self.enabled,
+                'max_in_flight': self.max_in_flight,
+                'max_queued': self.max_queued,
+                'deadline_ms': self.deadline_ms,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'shed': dict(self.shed)
+            }
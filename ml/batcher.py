@@ -0,0 +1,141 @@
+"""
+Micro-batching for concurrent single-farm recommendation requests.
+
+Requests that reach the models within ``max_wait_ms`` of each other are
+coalesced into one batch, up to ``max_batch_size``, so each forest runs once
+for the whole batch instead of once per request. The first request of a
+batch leads it: it waits for others to join, runs the batch and hands every
+caller its own result. There is no background thread, so the batcher works
+unchanged in forked server workers.
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Upper bounds of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.results = None
+        self.error = None
+        self.run_seconds = 0.0
+        self.closed = threading.Event()
+        self.done = threading.Event()
+
+class MicroBatcher:
+    """
+    Coalesces concurrent calls into batched calls of ``run_batch``.
+
+    ``run_batch(key, items)`` must return one result per item, in order.
+    Only calls with the same key (the model bundle) are batched together.
+    """
+
+    def __init__(self, run_batch, max_batch_size=32, max_wait_ms=2.0, latency_window=1000):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._open = {}
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.batch_sizes = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        self.batch_sizes['+Inf'] = 0
+        # Recent added waits (seconds) for latency percentiles
+        self._waits = deque(maxlen=latency_window)
+        self._total_wait = 0.0
+
+    @property
+    def enabled(self):
+        return self.max_batch_size > 1
+
+    def submit(self, key, item):
+        """
+        Run ``item`` as part of a batch and return its result.
+
+        Exceptions raised by ``run_batch`` are re-raised in every caller of
+        the failed batch.
+        """
+        submitted = time.perf_counter()
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = _Batch()
+                self._open[key] = batch
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_batch_size:
+                # Full: nobody else may join
+                del self._open[key]
+                batch.closed.set()
+
+        if leader:
+            batch.closed.wait(self.max_wait_ms / 1000)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            self._run(key, batch)
+        else:
+            batch.done.wait()
+
+        self._record_wait(time.perf_counter() - submitted - batch.run_seconds)
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
+
+    def _run(self, key, batch):
+        started = time.perf_counter()
+        try:
+            results = self.run_batch(key, batch.items)
+            if len(results) != len(batch.items):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(batch.items)} requests")
+            batch.results = results
+        except Exception as e:
+            batch.error = e
+        batch.run_seconds = time.perf_counter() - started
+        self._record_batch(len(batch.items), batch.error is not None)
+        batch.done.set()
+
+    def _record_batch(self, size, failed):
+        bucket = next((bound for bound in BATCH_SIZE_BUCKETS if size <= bound), '+Inf')
+        with self._lock:
+            self.requests += size
+            self.batches += 1
+            self.errors += int(failed)
+            self.batch_sizes[bucket] += 1
+
+    def _record_wait(self, seconds):
+        # Time a request spent waiting for its batch, excluding the model call
+        seconds = max(seconds, 0.0)
+        with self._lock:
+            self._waits.append(seconds)
+            self._total_wait += seconds
+
+    def stats(self):
+        """Counters, batch-size distribution and added latency for status endpoints."""
+        with self._lock:
+            waits = np.array(self._waits) * 1000
+            return {
+                'enabled': self.enabled,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait_ms,
+                'requests': self.requests,
+                'batches': self.batches,
+                'errors': self.errors,
+                'mean_batch_size': round(self.requests / self.batches, 2) if self.batches else 0.0,
+                'batch_size_buckets': {str(bound): count for bound, count in self.batch_sizes.items()},
+                'added_wait_ms': {
+                    'mean': round(self._total_wait * 1000 / self.requests, 3) if self.requests else 0.0,
+                    'p50': round(float(np.percentile(waits, 50)), 3) if waits.size else 0.0,
+                    'p99': round(float(np.percentile(waits, 99)), 3) if waits.size else 0.0,
+                    'max': round(float(waits.max()), 3) if waits.size else 0.0
+                }
+            }
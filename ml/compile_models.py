@@ -0,0 +1,63 @@
+"""
+Write the memory-mapped compiled form of an existing model bundle.
+
+Bundles trained before compiled artifacts existed (including the legacy flat
+``*.pkl`` files, which are imported as a new bundle) gain a ``compiled/``
+directory that the model registry maps instead of unpickling the forests.
+
+Usage:
+    python -m ml.compile_models [--version VERSION] [--compact] [--publish]
+"""
+
+import argparse
+import os
+
+from .model_registry import (COMPILED_DIR, FOREST_MODELS, ModelRegistry, export_compiled_model, load_bundle,
+                             save_bundle, set_current_version)
+from .train_models import format_mb
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def directory_bytes(path):
+    return sum(
+        os.path.getsize(os.path.join(root, file_name))
+        for root, _, file_names in os.walk(path)
+        for file_name in file_names
+    )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Export memory-mappable compiled forests for a model bundle')
+    parser.add_argument('--models-dir', default=os.path.join(ML_DIR, 'models'), help='Versioned bundle directory')
+    parser.add_argument('--version', help='Bundle to export (defaults to the one being served)')
+    parser.add_argument('--compact', action='store_true', help='Shrink the compiled forests (exact)')
+    parser.add_argument('--publish', action='store_true', help='Make the bundle current afterwards')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    registry = ModelRegistry(ML_DIR, models_dir=args.models_dir, engine='sklearn')
+    version, path = registry.resolve(args.version)
+    bundle = load_bundle(path, version, engine='sklearn')
+    models = {name: getattr(bundle, name) for name in FOREST_MODELS}
+
+    if path == registry.base_dir:
+        # Legacy flat files have no bundle directory to write into
+        version = save_bundle(args.models_dir, label_encoders=bundle.label_encoders,
+                              make_current=args.publish, compact=args.compact, **models)
+        path = os.path.join(args.models_dir, version)
+        print(f"✓ Imported legacy models as bundle {version}")
+    else:
+        for name, model in models.items():
+            export_compiled_model(path, name, model, compact=args.compact)
+        if args.publish:
+            set_current_version(args.models_dir, version)
+
+    for name in FOREST_MODELS:
+        compiled_path = os.path.join(path, COMPILED_DIR, name)
+        print(f"   {name:<14} {format_mb(directory_bytes(compiled_path))} compiled")
+    print(f"✓ Compiled artifacts for bundle {version}{' (compacted)' if args.compact else ''} in "
+          f"{os.path.join(path, COMPILED_DIR)}")
+    return version
+
+if __name__ == '__main__':
+    main()
@@ -2,66 +2,261 @@
 Data-driven insights module to extract optimal conditions from actual crop data.
 """
 
+import json
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
+from .dataset_store import compute_file_hash, read_dataset
+
+# Bump when the crop_insights structure changes so stale artifacts are rebuilt
+INSIGHTS_ARTIFACT_VERSION = 1
+
+# Categorical columns of crop_yield.csv, parsed as pandas categoricals
+CATEGORY_COLUMNS = ['Region', 'Soil_Type', 'Crop', 'Weather_Condition']
+
+# Columns analyze_crop_frame reads; nothing else is loaded
+ANALYZER_COLUMNS = CATEGORY_COLUMNS + [
+    'Rainfall_mm', 'Temperature_Celsius', 'Fertilizer_Used', 'Irrigation_Used',
+    'Days_to_Harvest', 'Yield_tons_per_hectare'
+]
+
 def analyze_crop_data(csv_file_path='crop_yield.csv'):
     """
     Analyze actual crop data to derive optimal conditions for each crop.
     """
     try:
-        # Load the dataset
-        data = pd.read_csv(csv_file_path)
-        
-        # Initialize results dictionary
-        crop_insights = {}
-        
-        # Get unique crops
-        crops = data['Crop'].unique()
-        
-        for crop in crops:
-            crop_data = data[data['Crop'] == crop]
-            
-            # Calculate optimal ranges based on high-yield samples (top 25%)
-            high_yield_threshold = crop_data['Yield_tons_per_hectare'].quantile(0.75)
-            high_yield_data = crop_data[crop_data['Yield_tons_per_hectare'] >= high_yield_threshold]
-            
-            if len(high_yield_data) > 0:
-                # Use interquartile range (25th to 75th percentile) for more realistic optimal ranges
-                rainfall_q25 = high_yield_data['Rainfall_mm'].quantile(0.25)
-                rainfall_q75 = high_yield_data['Rainfall_mm'].quantile(0.75)
-                temp_q25 = high_yield_data['Temperature_Celsius'].quantile(0.25)
-                temp_q75 = high_yield_data['Temperature_Celsius'].quantile(0.75)
-                
-                # Calculate optimal conditions from high-yield samples
-                insights = {
-                    'optimal_rainfall_min': round(rainfall_q25, 0),
-                    'optimal_rainfall_max': round(rainfall_q75, 0),
-                    'optimal_temp_min': round(temp_q25, 1),
-                    'optimal_temp_max': round(temp_q75, 1),
-                    'avg_yield': round(crop_data['Yield_tons_per_hectare'].mean(), 1),
-                    'max_yield': round(crop_data['Yield_tons_per_hectare'].max(), 1),
-                    'min_yield': round(crop_data['Yield_tons_per_hectare'].min(), 1),
-                    'avg_harvest_days': round(crop_data['Days_to_Harvest'].mean(), 0),
-                    'min_harvest_days': round(crop_data['Days_to_Harvest'].min(), 0),
-                    'max_harvest_days': round(crop_data['Days_to_Harvest'].max(), 0),
-                    'fertilizer_usage_rate': round((crop_data['Fertilizer_Used'].sum() / len(crop_data)) * 100, 1),
-                    'irrigation_usage_rate': round((crop_data['Irrigation_Used'].sum() / len(crop_data)) * 100, 1),
-                    'best_weather': crop_data.groupby('Weather_Condition')['Yield_tons_per_hectare'].mean().idxmax(),
-                    'best_soil': crop_data.groupby('Soil_Type')['Yield_tons_per_hectare'].mean().idxmax(),
-                    'best_region': crop_data.groupby('Region')['Yield_tons_per_hectare'].mean().idxmax(),
-                    'total_samples': len(crop_data),
-                    'high_yield_samples': len(high_yield_data)
-                }
-                
-                crop_insights[crop.lower()] = insights
-        
-        return crop_insights
+        # Load the dataset from its columnar store when one is up to date,
+        # otherwise parse the text columns straight into categoricals
+        data = read_dataset(csv_file_path, ANALYZER_COLUMNS, {column: 'category' for column in CATEGORY_COLUMNS})
+        return analyze_crop_frame(data)
     
     except Exception as e:
         print(f"Error analyzing crop data: {e}")
         return {}
 
+def category_codes(column):
+    """
+    Return integer codes and sorted category labels for a categorical column.
+
+    Sorted labels keep ties in the best-category lookups resolved the same way
+    as a pandas groupby would.
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        categories = column.cat.categories
+        if not categories.is_monotonic_increasing:
+            column = column.cat.reorder_categories(categories.sort_values())
+        return column.cat.codes.to_numpy(), column.cat.categories
+    codes, categories = pd.factorize(column, sort=True)
+    return codes, categories
+
+def flag_values(column):
+    """A True/False column as 1.0/0.0, with NaN for blank cells."""
+    if column.dtype == bool:
+        return column.to_numpy(dtype=float)
+    return column.astype('string').str.lower().map({'true': 1.0, 'false': 0.0}).to_numpy(dtype=float)
+
+def _best_category(cell_sums, cell_counts, axis, names):
+    """
+    Return the category with the highest mean yield along one axis of the
+    (weather, soil, region) cell grid, ignoring categories with no samples.
+    """
+    other_axes = tuple(i for i in range(cell_sums.ndim) if i != axis)
+    # The last slot of each axis collects rows with a blank value; like a
+    # pandas groupby, they never win but still count on the other axes
+    counts = cell_counts.sum(axis=other_axes)[:len(names)]
+    sums = cell_sums.sum(axis=other_axes)[:len(names)]
+    means = np.where(counts > 0, sums / np.maximum(counts, 1), -np.inf)
+    return names[int(np.argmax(means))]
+
+def _with_blank_slot(codes, names):
+    """Category codes with blanks (-1) moved to an extra slot after the last category."""
+    return np.where(codes >= 0, codes, len(names))
+
+def _present(values):
+    """The non-missing values of a numeric array."""
+    return values[~np.isnan(values)]
+
+def _quantiles(values, quantiles):
+    # pandas returns NaN for the quantiles of no values, numpy raises
+    if len(values) == 0:
+        return [np.nan] * len(quantiles)
+    return np.quantile(values, quantiles)
+
+def _mean_min_max(values):
+    if len(values) == 0:
+        return np.nan, np.nan, np.nan
+    return values.mean(), values.min(), values.max()
+
+def analyze_crop_frame(data):
+    """
+    Build the crop_insights dict from an already loaded crop dataset.
+
+    The frame is sorted by crop once; every per-crop statistic is then taken
+    from a contiguous slice of the reordered columns, so the full frame is
+    never filtered or grouped again per crop.
+    """
+    crop_codes, crop_names = category_codes(data['Crop'])
+    weather_codes, weather_names = category_codes(data['Weather_Condition'])
+    soil_codes, soil_names = category_codes(data['Soil_Type'])
+    region_codes, region_names = category_codes(data['Region'])
+
+    # Group rows by crop with a single stable sort so each crop keeps its
+    # original row order
+    order = np.argsort(crop_codes, kind='stable')
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(crop_codes[crop_codes >= 0], minlength=len(crop_names)))))
+    order = order[np.count_nonzero(crop_codes < 0):]
+
+    yields = data['Yield_tons_per_hectare'].to_numpy(dtype=float)[order]
+    rainfall = data['Rainfall_mm'].to_numpy(dtype=float)[order]
+    temperature = data['Temperature_Celsius'].to_numpy(dtype=float)[order]
+    harvest_days = data['Days_to_Harvest'].to_numpy()[order]
+    fertilizer = flag_values(data['Fertilizer_Used'])[order]
+    irrigation = flag_values(data['Irrigation_Used'])[order]
+
+    # One (weather, soil, region) cell code per row; per-crop yield sums and
+    # counts over these cells give all three best-category lookups at once
+    cell_shape = (len(weather_names) + 1, len(soil_names) + 1, len(region_names) + 1)
+    cells = np.ravel_multi_index((
+        _with_blank_slot(weather_codes, weather_names),
+        _with_blank_slot(soil_codes, soil_names),
+        _with_blank_slot(region_codes, region_names)
+    ), cell_shape)[order]
+
+    # Initialize results dictionary
+    crop_insights = {}
+
+    # Report crops in the order they first appear in the data
+    for code in pd.unique(crop_codes[crop_codes >= 0]):
+        start, end = bounds[code], bounds[code + 1]
+        crop_yields = yields[start:end]
+        has_yield = ~np.isnan(crop_yields)
+        if not has_yield.any():
+            continue
+
+        # Calculate optimal ranges based on high-yield samples (top 25%)
+        high_yield_threshold = np.quantile(crop_yields[has_yield], 0.75)
+        is_high_yield = crop_yields >= high_yield_threshold
+        high_rainfall = rainfall[start:end][is_high_yield]
+        high_temperature = temperature[start:end][is_high_yield]
+
+        # Use interquartile range (25th to 75th percentile) for more realistic optimal ranges
+        rainfall_q25, rainfall_q75 = _quantiles(_present(high_rainfall), [0.25, 0.75])
+        temp_q25, temp_q75 = _quantiles(_present(high_temperature), [0.25, 0.75])
+
+        # Mean yield per (weather, soil, region) cell, collapsed per category
+        crop_cells = cells[start:end][has_yield]
+        cell_sums = np.bincount(crop_cells, weights=crop_yields[has_yield], minlength=np.prod(cell_shape)).reshape(cell_shape)
+        cell_counts = np.bincount(crop_cells, minlength=np.prod(cell_shape)).reshape(cell_shape)
+
+        total_samples = int(end - start)
+        avg_harvest_days, min_harvest_days, max_harvest_days = _mean_min_max(_present(harvest_days[start:end]))
+
+        # Calculate optimal conditions from high-yield samples
+        crop_insights[str(crop_names[code]).lower()] = {
+            'optimal_rainfall_min': round(rainfall_q25, 0),
+            'optimal_rainfall_max': round(rainfall_q75, 0),
+            'optimal_temp_min': round(temp_q25, 1),
+            'optimal_temp_max': round(temp_q75, 1),
+            'avg_yield': round(crop_yields[has_yield].mean(), 1),
+            'max_yield': round(crop_yields[has_yield].max(), 1),
+            'min_yield': round(crop_yields[has_yield].min(), 1),
+            'avg_harvest_days': round(avg_harvest_days, 0),
+            'min_harvest_days': round(min_harvest_days, 0),
+            'max_harvest_days': round(max_harvest_days, 0),
+            'fertilizer_usage_rate': round((np.nansum(fertilizer[start:end]) / total_samples) * 100, 1),
+            'irrigation_usage_rate': round((np.nansum(irrigation[start:end]) / total_samples) * 100, 1),
+            'best_weather': _best_category(cell_sums, cell_counts, 0, weather_names),
+            'best_soil': _best_category(cell_sums, cell_counts, 1, soil_names),
+            'best_region': _best_category(cell_sums, cell_counts, 2, region_names),
+            'total_samples': total_samples,
+            'high_yield_samples': int(np.count_nonzero(is_high_yield))
+        }
+
+    return crop_insights
+
+def default_insights_artifact_path(csv_file_path):
+    """Place the insights artifact next to the CSV it was built from."""
+    return os.path.splitext(csv_file_path)[0] + '.insights.json'
+
+def _to_native(value):
+    """Convert numpy scalars to plain Python values so they serialize to JSON."""
+    if isinstance(value, dict):
+        return {key: _to_native(item) for key, item in value.items()}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def build_crop_insights_artifact(csv_file_path='crop_yield.csv', artifact_path=None):
+    """
+    Analyze the CSV and write the resulting crop_insights to a JSON artifact.
+
+    The artifact records the CSV's content hash so that loaders can tell
+    whether it is still current.
+    """
+    artifact_path = artifact_path or default_insights_artifact_path(csv_file_path)
+    source_hash = compute_file_hash(csv_file_path)
+    crop_insights = _to_native(analyze_crop_data(csv_file_path))
+
+    if crop_insights:
+        artifact = {
+            'format_version': INSIGHTS_ARTIFACT_VERSION,
+            'source_hash': source_hash,
+            'crop_insights': crop_insights
+        }
+        # Write to a temporary file first so readers never see a partial artifact
+        temp_path = f"{artifact_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(artifact, f)
+        os.replace(temp_path, artifact_path)
+
+    return crop_insights
+
+def load_crop_insights(csv_file_path='crop_yield.csv', artifact_path=None):
+    """
+    Load crop_insights from the precomputed artifact, rebuilding it if stale.
+
+    The artifact is reused when its recorded hash matches the CSV's current
+    content hash. An artifact written from an insights sketch
+    (``source: 'sketch'``) is reused when the CSV is one of the files the
+    sketch ingested; otherwise the CSV wins and the artifact is rebuilt from
+    it. If the CSV is not available the artifact is trusted as-is, which
+    lets deployments ship only the small artifact.
+    """
+    artifact_path = artifact_path or default_insights_artifact_path(csv_file_path)
+
+    artifact = None
+    try:
+        with open(artifact_path, 'r', encoding='utf-8') as f:
+            artifact = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    if artifact and artifact.get('format_version') == INSIGHTS_ARTIFACT_VERSION:
+        if not os.path.exists(csv_file_path):
+            return artifact['crop_insights']
+        csv_hash = compute_file_hash(csv_file_path)
+        if artifact.get('source') == 'sketch':
+            if csv_hash in artifact.get('source_hashes', []):
+                return artifact['crop_insights']
+            print(f"⚠️ Sketch insights artifact has not ingested the current {csv_file_path}; "
+                  f"rebuilding from the CSV")
+        elif artifact.get('source_hash') == csv_hash:
+            return artifact['crop_insights']
+
+    if not os.path.exists(csv_file_path):
+        print(f"Error analyzing crop data: {csv_file_path} not found and no insights artifact available")
+        return {}
+
+    print("Crop insights artifact missing or stale, rebuilding...")
+    try:
+        return build_crop_insights_artifact(csv_file_path, artifact_path)
+    except OSError as e:
+        print(f"Error writing crop insights artifact: {e}")
+        return _to_native(analyze_crop_data(csv_file_path))
+
 def get_data_driven_optimal_conditions(crop_name, crop_insights):
     """
     Get optimal conditions based on actual data analysis.
@@ -133,8 +328,17 @@ def evaluate_user_conditions(crop_name, user_rainfall, user_temp, crop_insights)
     }
 
 if __name__ == "__main__":
+    # Offline build step: `python -m ml.data_analyzer --build [path/to/crop_yield.csv]`
+    default_csv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'crop_yield.csv')
+    if '--build' in sys.argv[1:]:
+        paths = [arg for arg in sys.argv[1:] if arg != '--build']
+        csv_path = paths[0] if paths else default_csv_path
+        built = build_crop_insights_artifact(csv_path)
+        print(f"✅ Wrote {default_insights_artifact_path(csv_path)} with insights for {len(built)} crops.")
+        sys.exit(0)
+
     # Test the analysis
-    insights = analyze_crop_data()
+    insights = load_crop_insights(default_csv_path)
     print("🌾 DATA-DRIVEN CROP INSIGHTS FROM YOUR DATASET")
     print("=" * 60)
     
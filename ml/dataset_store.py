@@ -0,0 +1,252 @@
+"""
+Columnar binary store for crop_yield.csv.
+
+The CSV is converted once into a directory of ``.npy`` files, one per
+column, plus ``meta.json`` describing them:
+
+* text columns become narrow integer codes into a sorted category list
+  (the same codes ``category_codes`` and LabelEncoder produce),
+* True/False columns become ``bool``,
+* integer columns use the narrowest integer type that holds them,
+* float columns become ``float32`` when that is lossless, ``float64`` otherwise.
+
+Columns are memory-mapped on load and only the requested ones are read, so a
+reader pays for the columns it uses rather than for parsing every line of
+text. ``read_dataset`` accepts either a CSV or a store; for a CSV it uses the
+sibling ``<name>.columns`` store when that was built from the CSV's current
+contents (the store records the CSV's SHA-256 content hash, as the insights
+artifact does) and falls back to parsing the text otherwise.
+
+Usage:
+    python -m ml.dataset_store [crop_yield.csv] [--output crop_yield.columns]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+STORE_FORMAT_VERSION = 1
+STORE_META_FILE = 'meta.json'
+
+# Rows parsed per CSV chunk while converting
+CONVERT_CHUNK_ROWS = 1_000_000
+
+def default_store_path(csv_path):
+    """Place the store next to the CSV it was built from."""
+    return os.path.splitext(csv_path)[0] + '.columns'
+
+def is_store(path):
+    """True if ``path`` is a store directory (it holds a meta.json) rather than a CSV."""
+    return os.path.isfile(os.path.join(path, STORE_META_FILE))
+
+def compute_file_hash(file_path, chunk_size=1024 * 1024):
+    """
+    Compute the SHA-256 content hash of a file without loading it all at once.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _smallest_int_dtype(min_value, max_value):
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= min_value and max_value <= info.max:
+            return dtype
+    return np.int64
+
+def _narrow_numeric(values):
+    """The column in its narrowest lossless numeric dtype."""
+    if values.dtype.kind in 'iu':
+        if len(values) == 0:
+            return values.astype(np.int8)
+        return values.astype(_smallest_int_dtype(values.min(), values.max()))
+    as_float32 = values.astype(np.float32)
+    if np.array_equal(as_float32.astype(values.dtype), values, equal_nan=True):
+        return as_float32
+    return values.astype(np.float64)
+
+class _CategoryColumn:
+    """Accumulates the codes of one text column across CSV chunks."""
+
+    def __init__(self):
+        self.categories = {}
+        self.chunks = []
+
+    def add(self, series):
+        codes, uniques = pd.factorize(series)
+        mapping = np.array([self.categories.setdefault(value, len(self.categories)) for value in uniques], dtype=np.int64)
+        self.chunks.append(np.where(codes >= 0, mapping[codes] if len(mapping) else codes, -1))
+
+    def finish(self):
+        # Renumber so codes follow the sorted category order
+        labels = np.array(list(self.categories), dtype=object)
+        order = np.argsort(labels, kind='stable')
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        codes = np.concatenate(self.chunks) if self.chunks else np.empty(0, dtype=np.int64)
+        codes = np.where(codes >= 0, rank[np.maximum(codes, 0)] if len(rank) else codes, -1)
+        return codes.astype(_smallest_int_dtype(-1, len(labels))), [str(label) for label in labels[order]]
+
+def convert_csv(csv_path, store_path=None, chunk_rows=CONVERT_CHUNK_ROWS):
+    """
+    Convert a CSV into a columnar store directory.
+
+    The CSV is parsed in chunks, so memory stays around the size of the
+    finished (compact) columns. The store is written to a temporary
+    directory and moved into place, so readers never see a partial store.
+
+    Returns:
+        dict: The store's metadata
+    """
+    store_path = store_path or default_store_path(csv_path)
+    source_hash = compute_file_hash(csv_path)
+
+    column_names = None
+    text_columns = {}
+    chunks = {}
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        if column_names is None:
+            column_names = list(chunk.columns)
+        for name in column_names:
+            series = chunk[name]
+            if name in text_columns:
+                text_columns[name].add(series)
+            elif name not in chunks and pd.api.types.is_string_dtype(series.dtype):
+                # Text columns are recognised from the first chunk
+                text_columns[name] = _CategoryColumn()
+                text_columns[name].add(series)
+            else:
+                chunks.setdefault(name, []).append(series.to_numpy())
+
+    if column_names is None:
+        raise ValueError(f"{csv_path} has no rows")
+
+    temp_path = f"{store_path}.tmp-{os.getpid()}"
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+
+    columns = {}
+    rows = 0
+    for name in column_names:
+        if name in text_columns:
+            values, categories = text_columns[name].finish()
+            entry = {'kind': 'category', 'categories': categories}
+        else:
+            values = np.concatenate(chunks[name])
+            if values.dtype == bool:
+                entry = {'kind': 'bool'}
+            else:
+                values = _narrow_numeric(values)
+                entry = {'kind': 'numeric'}
+        rows = len(values)
+        file_name = f"{len(columns):02d}.npy"
+        np.save(os.path.join(temp_path, file_name), values)
+        columns[name] = {**entry, 'file': file_name, 'dtype': values.dtype.str}
+
+    meta = {
+        'format_version': STORE_FORMAT_VERSION,
+        'rows': rows,
+        'source': os.path.basename(csv_path),
+        'source_sha256': source_hash,
+        'columns': columns
+    }
+    with open(os.path.join(temp_path, STORE_META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    # Swap the finished store in, then drop the one it replaces
+    old_path = f"{store_path}.old-{os.getpid()}"
+    if os.path.exists(store_path):
+        os.replace(store_path, old_path)
+    os.replace(temp_path, store_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return meta
+
+def read_store_meta(store_path):
+    with open(os.path.join(store_path, STORE_META_FILE), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('format_version') != STORE_FORMAT_VERSION:
+        raise ValueError(f"{store_path} has store format {meta.get('format_version')}, expected {STORE_FORMAT_VERSION}")
+    return meta
+
+def load_store(store_path, columns=None, mmap=True):
+    """
+    Load columns of a store as a DataFrame.
+
+    Text columns come back as categoricals with sorted categories; the other
+    columns keep their stored dtypes. ``columns`` limits which column files
+    are read at all.
+    """
+    meta = read_store_meta(store_path)
+    names = list(meta['columns']) if columns is None else list(columns)
+    missing = [name for name in names if name not in meta['columns']]
+    if missing:
+        raise KeyError(f"{store_path} has no column(s) {', '.join(missing)}")
+
+    frame = {}
+    for name in names:
+        entry = meta['columns'][name]
+        values = np.load(os.path.join(store_path, entry['file']), mmap_mode='r' if mmap else None)
+        if entry['kind'] == 'category':
+            frame[name] = pd.Categorical.from_codes(np.asarray(values), categories=entry['categories'])
+        else:
+            frame[name] = np.asarray(values)
+    return pd.DataFrame(frame, columns=names)
+
+def fresh_store_for(csv_path):
+    """The sibling store of a CSV if it was built from the CSV's current contents, else None."""
+    store_path = default_store_path(csv_path)
+    if not is_store(store_path) or not os.path.exists(csv_path):
+        return None
+    try:
+        meta = read_store_meta(store_path)
+    except (OSError, ValueError):
+        return None
+    if meta.get('source_sha256') == compute_file_hash(csv_path):
+        return store_path
+    return None
+
+def read_dataset(path, columns=None, dtypes=None):
+    """
+    Load the crop dataset from a store directory or a CSV.
+
+    Only ``columns`` are read (all of them by default). ``dtypes`` maps
+    column names to the dtypes the caller works in; text columns are always
+    categoricals. CSVs are read through their fresh sibling store when one
+    exists.
+    """
+    dtypes = dict(dtypes or {})
+    store_path = path if is_store(path) else fresh_store_for(path)
+    if store_path is None:
+        data = pd.read_csv(path, usecols=columns, dtype=dtypes)
+        return data[list(columns)] if columns else data
+
+    data = load_store(store_path, columns)
+    for name, dtype in dtypes.items():
+        if name in data.columns and dtype != 'category' and data[name].dtype != dtype:
+            data[name] = data[name].to_numpy().astype(dtype)
+    return data
+
+def store_nbytes(store_path):
+    meta = read_store_meta(store_path)
+    return sum(os.path.getsize(os.path.join(store_path, entry['file'])) for entry in meta['columns'].values())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert crop_yield.csv into a columnar binary store')
+    parser.add_argument('csv', nargs='?', help='CSV to convert (defaults to ml/crop_yield.csv)',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'crop_yield.csv'))
+    parser.add_argument('--output', help='Store directory (defaults to <csv name>.columns)')
+    args = parser.parse_args()
+
+    meta = convert_csv(args.csv, args.output)
+    output = args.output or default_store_path(args.csv)
+    print(f"✅ Wrote {output}: {meta['rows']} rows, {len(meta['columns'])} columns, "
+          f"{store_nbytes(output) / 1024 / 1024:.1f} MB (CSV {os.path.getsize(args.csv) / 1024 / 1024:.1f} MB)")
+    for name, entry in meta['columns'].items():
+        print(f"   {name:<24}{entry['kind']:<10}{np.dtype(entry['dtype']).name}")
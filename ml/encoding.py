@@ -0,0 +1,120 @@
+"""
+Precomputed lookup tables for the categorical model inputs.
+
+``CategoryEncoder`` turns the fitted LabelEncoders from label_encoders.pkl
+into plain dicts once, at load time, so encoding a request is a dict lookup
+instead of a ``LabelEncoder.transform`` call. Common alternative spellings
+(``North``/``Northern``, ``Loam``/``Loamy``, ...) resolve to whichever form
+the encoder was trained on. Unknown values fall back to a fixed code and are
+counted rather than raising.
+"""
+
+import threading
+
+import numpy as np
+
+# Alternative spellings that refer to the same category; every member of a
+# group encodes like the member the LabelEncoder actually knows
+CATEGORY_ALIASES = {
+    'Region': [
+        ('North', 'Northern'),
+        ('South', 'Southern'),
+        ('East', 'Eastern'),
+        ('West', 'Western')
+    ],
+    'Soil_Type': [
+        ('Loam', 'Loamy'),
+        ('Silt', 'Silty'),
+        ('Sand', 'Sandy'),
+        ('Peat', 'Peaty'),
+        ('Chalk', 'Chalky')
+    ],
+    'Weather_Condition': []
+}
+
+# Code used for values the encoder has never seen
+FALLBACK_CODE = 0
+
+class CategoryEncoder:
+    """
+    Constant-time encoding of categorical inputs with a counted fallback.
+    """
+
+    def __init__(self, label_encoders, aliases=CATEGORY_ALIASES, fallback_code=FALLBACK_CODE):
+        self.fallback_code = fallback_code
+        self.tables = {
+            column: build_lookup_table(encoder.classes_, aliases.get(column, ()))
+            for column, encoder in label_encoders.items()
+        }
+        self.unknown_counts = {column: 0 for column in self.tables}
+        self._lock = threading.Lock()
+
+    def _count_unknown(self, column, count=1):
+        with self._lock:
+            self.unknown_counts[column] += count
+
+    def encode(self, column, value):
+        """Encode a single value, using the fallback code if it is unknown."""
+        code = self.tables[column].get(value)
+        if code is None:
+            self._count_unknown(column)
+            return self.fallback_code
+        return code
+
+    def encode_row(self, region, soil_type, weather_condition):
+        """Encode the three categorical request inputs."""
+        return (
+            self.encode('Region', region),
+            self.encode('Soil_Type', soil_type),
+            self.encode('Weather_Condition', weather_condition)
+        )
+
+    def encode_batch(self, column, values, unknown_code=None):
+        """
+        Encode a whole column of values at once.
+
+        Each distinct value is looked up once, so the cost is dominated by a
+        single ``np.unique`` over the column. Unknown values get the fallback
+        code and are counted, or get ``unknown_code`` uncounted when given.
+
+        Returns:
+            ndarray: int64 codes, one per value
+        """
+        values = np.asarray(values, dtype=object)
+        if values.size == 0:
+            return np.empty(0, dtype=np.int64)
+
+        uniques, inverse = np.unique(values.astype(str), return_inverse=True)
+        table = self.tables[column]
+        unique_codes = np.array([table.get(value, -1) for value in uniques], dtype=np.int64)
+
+        codes = unique_codes[inverse.ravel()]
+        unknown = codes < 0
+        if unknown.any():
+            if unknown_code is not None:
+                codes[unknown] = unknown_code
+            else:
+                self._count_unknown(column, int(np.count_nonzero(unknown)))
+                codes[unknown] = self.fallback_code
+        return codes
+
+    def stats(self):
+        """Unknown-value counts per column for status endpoints."""
+        with self._lock:
+            return dict(self.unknown_counts)
+
+def build_lookup_table(classes, alias_groups=()):
+    """
+    Map every known label, and every alias of a known label, to its code.
+    """
+    table = {label: code for code, label in enumerate(classes)}
+
+    for group in alias_groups:
+        known = [label for label in group if label in table]
+        if not known:
+            continue
+        code = table[known[0]]
+        for label in group:
+            table.setdefault(label, code)
+
+    return table
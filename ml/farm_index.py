@@ -0,0 +1,312 @@
+"""
+Nearest-real-farm index over crop_yield.csv.
+
+Records are grouped by region, soil type and weather condition, and each
+group gets a KD-tree over its rainfall and temperature, both divided by
+their standard deviation across the dataset so a millimetre of rain and a
+degree Celsius are weighted alike. Finding the k farms most like a request
+is then one tree query in the request's group instead of a scan of every
+row.
+
+The index is built once from the CSV and saved next to it with joblib
+(``<name>.farms.joblib``). Like the insights artifact it records the CSV's
+content hash and is rebuilt when the CSV changes; without the CSV the saved
+index is trusted as-is.
+
+Usage:
+    python -m ml.farm_index [crop_yield.csv] [--output crop_yield.farms.joblib]
+"""
+
+import argparse
+import os
+import time
+
+import joblib
+import numpy as np
+from sklearn.neighbors import KDTree
+
+from .data_analyzer import compute_file_hash
+from .dataset_store import read_dataset
+from .encoding import CATEGORY_ALIASES, build_lookup_table
+
+# Bump when the saved structure changes so stale indexes are rebuilt
+FARM_INDEX_VERSION = 1
+
+# Columns that split the records into separately indexed groups, in key order
+PARTITION_COLUMNS = ('Region', 'Soil_Type', 'Weather_Condition')
+
+# Columns searched by distance within a group
+DISTANCE_COLUMNS = ('Rainfall_mm', 'Temperature_Celsius')
+
+INDEX_COLUMNS = list(PARTITION_COLUMNS) + list(DISTANCE_COLUMNS) + [
+    'Crop', 'Fertilizer_Used', 'Irrigation_Used', 'Days_to_Harvest', 'Yield_tons_per_hectare'
+]
+
+# Request fields naming each partition column
+PARTITION_FIELDS = {'Region': 'region', 'Soil_Type': 'soil_type', 'Weather_Condition': 'weather_condition'}
+
+# Points per KD-tree leaf; groups are small, so shallow trees query fastest
+LEAF_SIZE = 16
+
+def default_farm_index_path(csv_file_path):
+    """Place the index next to the CSV it was built from."""
+    return os.path.splitext(csv_file_path)[0] + '.farms.joblib'
+
+class FarmIndex:
+    """
+    k-nearest real farms within a region / soil / weather group.
+
+    ``records`` holds one array per column, sorted so that each group's rows
+    are contiguous; ``groups`` maps a group's category codes to the start of
+    its rows and the KD-tree over them.
+    """
+
+    def __init__(self, meta, records, groups):
+        self.meta = meta
+        self.records = records
+        self.groups = groups
+        self.scale = np.asarray(meta['scale'], dtype=np.float64)
+        self.category_tables = {
+            column: build_lookup_table(meta['categories'][column], CATEGORY_ALIASES.get(column, ()))
+            for column in PARTITION_COLUMNS
+        }
+
+    def category_code(self, column, value):
+        """The code of a partition value, or None (any) when it is missing."""
+        if value in (None, ''):
+            return None
+        if not isinstance(value, str):
+            raise ValueError(f"{PARTITION_FIELDS[column]} must be a string")
+        code = self.category_tables[column].get(value)
+        if code is None:
+            raise ValueError(f"Unknown {PARTITION_FIELDS[column]} '{value}'")
+        return code
+
+    def matching_groups(self, codes):
+        """Keys of the groups a partially specified (region, soil, weather) matches."""
+        if None not in codes:
+            return [codes] if codes in self.groups else []
+        return [key for key in self.groups
+                if all(code is None or code == part for code, part in zip(codes, key))]
+
+    def scaled_point(self, rainfall, temperature):
+        try:
+            point = np.array([float(rainfall), float(temperature)])
+        except (TypeError, ValueError):
+            raise ValueError("rainfall and temperature must be numbers")
+        if not np.all(np.isfinite(point)):
+            raise ValueError("rainfall and temperature must be finite")
+        return point / self.scale
+
+    def record(self, row, distance):
+        records = self.records
+        categories = self.meta['categories']
+        return {
+            'crop': self.meta['crops'][records['Crop'][row]],
+            'region': categories['Region'][records['Region'][row]],
+            'soilType': categories['Soil_Type'][records['Soil_Type'][row]],
+            'weatherCondition': categories['Weather_Condition'][records['Weather_Condition'][row]],
+            'rainfall': round(float(records['Rainfall_mm'][row]), 1),
+            'temperature': round(float(records['Temperature_Celsius'][row]), 1),
+            'fertilizerUsed': bool(records['Fertilizer_Used'][row]),
+            'irrigationUsed': bool(records['Irrigation_Used'][row]),
+            'daysToHarvest': int(records['Days_to_Harvest'][row]),
+            'yield': round(float(records['Yield_tons_per_hectare'][row]), 2),
+            'distance': round(float(distance), 4)
+        }
+
+    def _query_group(self, key, points, k):
+        start, tree = self.groups[key]
+        distances, rows = tree.query(points, k=min(k, tree.data.shape[0]))
+        return distances, rows + start
+
+    def nearest(self, region, soil_type, weather_condition, rainfall, temperature, k=5):
+        """
+        The k real farms closest in rainfall and temperature within the group.
+
+        A missing region, soil type or weather condition matches every value,
+        and the nearest farms across the matching groups are returned.
+
+        Returns:
+            list: Farm records, nearest first, each with its scaled ``distance``
+        """
+        codes = (
+            self.category_code('Region', region),
+            self.category_code('Soil_Type', soil_type),
+            self.category_code('Weather_Condition', weather_condition)
+        )
+        point = self.scaled_point(rainfall, temperature)[np.newaxis, :]
+
+        found_distances, found_rows = [], []
+        for key in self.matching_groups(codes):
+            distances, rows = self._query_group(key, point, k)
+            found_distances.append(distances[0])
+            found_rows.append(rows[0])
+        if not found_rows:
+            return []
+
+        distances, rows = np.concatenate(found_distances), np.concatenate(found_rows)
+        order = np.argsort(distances, kind='stable')[:k]
+        return [self.record(rows[i], distances[i]) for i in order]
+
+    def nearest_batch(self, farms, k=5):
+        """
+        ``nearest`` for many farms, with one tree query per group.
+
+        Farms naming a full region / soil / weather group are queried
+        together per group; partially specified farms fall back to
+        ``nearest``.
+
+        Returns:
+            list: One dict per farm, in input order, holding either
+                ``farms`` or an ``error`` message
+        """
+        results = [None] * len(farms)
+        pending = {}
+        for position, farm in enumerate(farms):
+            try:
+                if not isinstance(farm, dict):
+                    raise ValueError("Each farm must be a JSON object")
+                codes = tuple(self.category_code(column, farm.get(PARTITION_FIELDS[column]))
+                              for column in PARTITION_COLUMNS)
+                if None in codes:
+                    results[position] = {'farms': self.nearest(
+                        farm.get('region'), farm.get('soil_type'), farm.get('weather_condition'),
+                        farm.get('rainfall'), farm.get('temperature'), k
+                    )}
+                    continue
+                point = self.scaled_point(farm.get('rainfall'), farm.get('temperature'))
+            except ValueError as e:
+                results[position] = {'error': f"Invalid input: {e}"}
+                continue
+            pending.setdefault(codes, []).append((position, point))
+
+        for key, queries in pending.items():
+            if key not in self.groups:
+                for position, _ in queries:
+                    results[position] = {'farms': []}
+                continue
+            distances, rows = self._query_group(key, np.array([point for _, point in queries]), k)
+            for (position, _), farm_distances, farm_rows in zip(queries, distances, rows):
+                results[position] = {'farms': [self.record(row, distance)
+                                               for row, distance in zip(farm_rows, farm_distances)]}
+        return results
+
+    def describe(self):
+        sizes = [tree.data.shape[0] for _, tree in self.groups.values()]
+        return {
+            'rows': self.meta['rows'],
+            'groups': len(self.groups),
+            'largest_group': max(sizes, default=0),
+            'smallest_group': min(sizes, default=0),
+            'scale': dict(zip(DISTANCE_COLUMNS, self.meta['scale'])),
+            'built_at': self.meta.get('built_at')
+        }
+
+def build_farm_index(csv_file_path='crop_yield.csv'):
+    """
+    Build a FarmIndex over every row of the dataset.
+
+    Returns:
+        FarmIndex: The index, not yet saved
+    """
+    data = read_dataset(csv_file_path, INDEX_COLUMNS,
+                        {column: 'category' for column in list(PARTITION_COLUMNS) + ['Crop']})
+    data = data.dropna(subset=INDEX_COLUMNS)
+
+    categories = {}
+    codes = {}
+    for column in list(PARTITION_COLUMNS) + ['Crop']:
+        column_values = data[column].astype('category')
+        column_values = column_values.cat.reorder_categories(column_values.cat.categories.sort_values())
+        categories[column] = [str(label) for label in column_values.cat.categories]
+        codes[column] = column_values.cat.codes.to_numpy().astype(np.int8)
+
+    # Sort rows by group so every group is one contiguous slice
+    order = np.lexsort(tuple(codes[column] for column in reversed(PARTITION_COLUMNS)))
+    records = {column: codes[column][order] for column in codes}
+    records['Rainfall_mm'] = data['Rainfall_mm'].to_numpy(dtype=np.float64)[order]
+    records['Temperature_Celsius'] = data['Temperature_Celsius'].to_numpy(dtype=np.float64)[order]
+    records['Fertilizer_Used'] = data['Fertilizer_Used'].to_numpy(dtype=bool)[order]
+    records['Irrigation_Used'] = data['Irrigation_Used'].to_numpy(dtype=bool)[order]
+    records['Days_to_Harvest'] = data['Days_to_Harvest'].to_numpy().astype(np.int32)[order]
+    records['Yield_tons_per_hectare'] = data['Yield_tons_per_hectare'].to_numpy(dtype=np.float64)[order]
+
+    points = np.column_stack([records[column] for column in DISTANCE_COLUMNS])
+    scale = points.std(axis=0) if len(points) else np.ones(len(DISTANCE_COLUMNS))
+    scale[~(scale > 0)] = 1.0
+    points = points / scale
+
+    keys = np.column_stack([records[column] for column in PARTITION_COLUMNS]).astype(np.int64)
+    boundaries = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+    starts = np.concatenate([[0], boundaries]) if len(keys) else np.empty(0, dtype=np.int64)
+    stops = np.concatenate([boundaries, [len(keys)]]) if len(keys) else np.empty(0, dtype=np.int64)
+    groups = {
+        tuple(int(code) for code in keys[start]): (int(start), KDTree(points[start:stop], leaf_size=LEAF_SIZE))
+        for start, stop in zip(starts, stops)
+    }
+
+    crops = categories.pop('Crop')
+    meta = {
+        'format_version': FARM_INDEX_VERSION,
+        'rows': int(len(order)),
+        'categories': categories,
+        'crops': crops,
+        'scale': [float(value) for value in scale],
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    return FarmIndex(meta, records, groups)
+
+def save_farm_index(index, index_path, source_hash=None):
+    """Write the index with joblib, replacing any previous file atomically."""
+    temp_path = f"{index_path}.tmp-{os.getpid()}"
+    joblib.dump({'meta': {**index.meta, 'source_hash': source_hash},
+                 'records': index.records, 'groups': index.groups}, temp_path)
+    os.replace(temp_path, index_path)
+
+def load_farm_index(csv_file_path='crop_yield.csv', index_path=None):
+    """
+    Load the saved FarmIndex, rebuilding and saving it if missing or stale.
+
+    Returns:
+        FarmIndex: The index, or None if neither the CSV nor a saved index exists
+    """
+    index_path = index_path or default_farm_index_path(csv_file_path)
+
+    saved = None
+    try:
+        saved = joblib.load(index_path)
+    except (OSError, ValueError, EOFError, KeyError):
+        pass
+
+    if saved and saved['meta'].get('format_version') == FARM_INDEX_VERSION:
+        if not os.path.exists(csv_file_path) or saved['meta'].get('source_hash') == compute_file_hash(csv_file_path):
+            return FarmIndex(saved['meta'], saved['records'], saved['groups'])
+
+    if not os.path.exists(csv_file_path):
+        print(f"Error building farm index: {csv_file_path} not found and no saved index available")
+        return None
+
+    print("Farm index missing or stale, rebuilding...")
+    source_hash = compute_file_hash(csv_file_path)
+    index = build_farm_index(csv_file_path)
+    try:
+        save_farm_index(index, index_path, source_hash)
+    except OSError as e:
+        print(f"⚠️ Could not save farm index to {index_path}: {e}")
+    return index
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the nearest-real-farm index for crop_yield.csv')
+    parser.add_argument('csv', nargs='?', help='CSV to index (defaults to ml/crop_yield.csv)',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'crop_yield.csv'))
+    parser.add_argument('--output', help='Index file (defaults to <csv name>.farms.joblib)')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = build_farm_index(args.csv)
+    output = args.output or default_farm_index_path(args.csv)
+    save_farm_index(index, output, compute_file_hash(args.csv))
+    summary = index.describe()
+    print(f"✅ Wrote {output}: {summary['rows']} farms in {summary['groups']} groups "
+          f"(largest {summary['largest_group']}) in {time.perf_counter() - started:.2f}s")
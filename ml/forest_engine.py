@@ -0,0 +1,455 @@
+"""
+Framework-free inference for trained random forests.
+
+``compile_forest`` flattens every tree of a fitted scikit-learn
+RandomForestClassifier or RandomForestRegressor into contiguous NumPy arrays
+(feature, threshold, children and leaf values). ``CompiledForest`` then walks
+all trees for all rows at once, level by level, dropping the pairs that have
+reached a leaf as it goes, without any of sklearn's input validation or
+per-estimator dispatch.
+
+Predictions are bit-identical to sklearn's: inputs are compared as float32
+exactly like sklearn's tree code, leaf values are normalized with the same
+operations, and per-tree outputs are accumulated in estimator order before
+dividing by the number of trees.
+
+``save_compiled_forest`` writes the arrays as ``.npy`` files that
+``load_compiled_forest`` maps read-only, so every process serving the same
+bundle shares one page-cache copy. ``compact_forest`` shrinks a forest
+without changing a single prediction: thresholds become float32 (rounded
+down, which is exact for float32 inputs), indices use the narrowest integer
+type, sibling leaves with identical outputs are merged into their parent and
+leaf outputs are stored once per distinct value.
+"""
+
+import json
+import os
+
+import numpy as np
+
+# Marker used by sklearn for "no child" in tree_.children_left/right
+TREE_LEAF = -1
+
+# Array files of a saved forest, plus its metadata file
+FOREST_ARRAYS = ('roots', 'feature', 'threshold', 'children', 'values', 'value_ids')
+FOREST_META_FILE = 'forest.json'
+
+class CompiledForest:
+    """
+    A random forest flattened into contiguous arrays.
+
+    Node arrays are global across trees: ``roots[t]`` is the index of tree
+    ``t``'s root node, and ``children[2 * node]`` / ``children[2 * node + 1]``
+    are the global indices of its left and right child. Leaves point to
+    themselves, so walking a fixed number of levels leaves every row parked
+    on its leaf.
+
+    ``values`` holds one output row per node, unless ``value_ids`` is given,
+    in which case node ``n``'s output is ``values[value_ids[n]]``.
+    """
+
+    # (tree, row) pairs walked together. Large inputs are walked a few trees
+    # at a time over all rows, so each level only touches those trees' nodes
+    # and the working set stays cache-sized
+    block_pairs = 32768
+
+    # Levels walked between dropping the (tree, row) pairs already on a leaf;
+    # most paths end far above max_depth, and a check every level costs more
+    # than it saves
+    compact_every = 8
+
+    # Outputs per tree up to which a cumulative sum beats adding tree by tree
+    cumsum_max_outputs = 128
+
+    def __init__(self, kind, roots, feature, threshold, children, values,
+                 max_depth, n_features, classes=None, feature_names=None, value_ids=None):
+        self.kind = kind
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.values = values
+        self.value_ids = value_ids
+        self.max_depth = max_depth
+        self.n_features_in_ = n_features
+        self.n_estimators = len(roots)
+        if classes is not None:
+            self.classes_ = classes
+        if feature_names is not None:
+            self.feature_names_in_ = feature_names
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays().values())
+
+    def arrays(self):
+        """The forest's arrays by name, as written by save_compiled_forest."""
+        arrays = {name: getattr(self, name) for name in FOREST_ARRAYS}
+        return {name: array for name, array in arrays.items() if array is not None}
+
+    def _as_matrix(self, X):
+        """Convert input rows to the float32 matrix sklearn's trees compare against."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[1]} features, but the forest expects {self.n_features_in_}")
+        return X
+
+    def apply(self, X):
+        """
+        Return the leaf each row reaches in each tree.
+
+        Returns:
+            ndarray: Global leaf node indices, shape (n_trees, n_rows)
+        """
+        X = self._as_matrix(X)
+        trees_per_block = max(1, self.block_pairs // max(X.shape[0], 1))
+        if trees_per_block >= self.n_estimators:
+            return self._apply_trees(X, self.roots)
+        return np.concatenate([
+            self._apply_trees(X, self.roots[start:start + trees_per_block])
+            for start in range(0, self.n_estimators, trees_per_block)
+        ])
+
+    def _apply_trees(self, X, roots):
+        n_rows, n_features = X.shape
+        flat_X = X.ravel()
+
+        # One entry per (tree, row) pair, walked together one level at a time
+        nodes = np.repeat(roots.astype(np.intp, copy=False), n_rows)
+        row_offsets = np.tile(np.arange(n_rows) * n_features, len(roots))
+        leaves = np.empty_like(nodes)
+        pairs = np.arange(nodes.size)
+        for level in range(1, self.max_depth + 1):
+            # sklearn sends a row left when X <= threshold, so NaN goes right
+            go_right = ~(flat_X[row_offsets + self.feature[nodes]] <= self.threshold[nodes])
+            nodes = self.children[2 * nodes + go_right].astype(np.intp, copy=False)
+            if level % self.compact_every == 0 and level < self.max_depth:
+                # Park the pairs that reached a leaf and keep walking the rest
+                done = self.children[2 * nodes] == nodes
+                leaves[pairs[done]] = nodes[done]
+                walking = ~done
+                nodes, row_offsets, pairs = nodes[walking], row_offsets[walking], pairs[walking]
+                if nodes.size == 0:
+                    break
+        leaves[pairs] = nodes
+        return leaves.reshape(len(roots), n_rows)
+
+    def tree_outputs(self, X):
+        """
+        Return every tree's output for every row.
+
+        Returns:
+            ndarray: Shape (n_trees, n_rows, n_outputs) for classifiers
+                (class probabilities) or (n_trees, n_rows) for regressors
+        """
+        leaves = self.apply(X)
+        if self.value_ids is not None:
+            return self.values[self.value_ids[leaves]]
+        return self.values[leaves]
+
+    def _mean_over_trees(self, per_tree):
+        # Accumulate in estimator order, as sklearn does, so the sums match bit
+        # for bit; cumsum adds in the same order and is cheaper for a few rows
+        if per_tree[0].size <= self.cumsum_max_outputs:
+            return np.cumsum(per_tree, axis=0, dtype=np.float64)[-1] / self.n_estimators
+        total = np.zeros(per_tree.shape[1:], dtype=np.float64)
+        for tree_output in per_tree:
+            total += tree_output
+        total /= self.n_estimators
+        return total
+
+    def predict_proba(self, X):
+        """Class probabilities, identical to RandomForestClassifier.predict_proba."""
+        if self.kind != 'classifier':
+            raise AttributeError("predict_proba is only available for classifiers")
+        return self._mean_over_trees(self.tree_outputs(X))
+
+    def predict(self, X):
+        """Predicted labels (classifier) or values (regressor), as sklearn would return."""
+        if self.kind == 'classifier':
+            return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+        return self._mean_over_trees(self.tree_outputs(X))
+
+    def predict_with_trees(self, X):
+        """
+        Regressor predictions together with the per-tree outputs they average,
+        from a single traversal.
+
+        Returns:
+            tuple: (predictions identical to ``predict``, per-tree outputs of shape (n_trees, n_rows))
+        """
+        if self.kind != 'regressor':
+            raise AttributeError("predict_with_trees is only available for regressors")
+        per_tree = self.tree_outputs(X)
+        return self._mean_over_trees(per_tree), per_tree
+
+def tree_spread(per_tree, quantiles=(0.1, 0.9)):
+    """
+    Spread of a regression forest's per-tree outputs.
+
+    Quantiles interpolate linearly between the sorted tree outputs, like
+    ``np.quantile``'s default method, without its per-call overhead.
+
+    Returns:
+        tuple: (standard deviation per row, quantiles of shape (len(quantiles), n_rows))
+    """
+    ordered = np.sort(per_tree, axis=0)
+    positions = np.asarray(quantiles, dtype=np.float64) * (len(ordered) - 1)
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.minimum(lower + 1, len(ordered) - 1)
+    fraction = (positions - lower)[:, np.newaxis]
+    values = ordered[lower] + (ordered[upper] - ordered[lower]) * fraction
+    return per_tree.std(axis=0), values
+
+def _leaf_values(tree, kind):
+    """Per-node outputs computed with the same operations sklearn's trees use."""
+    if kind == 'classifier':
+        proba = tree.tree_.value[:, 0, :tree.n_classes_]
+        normalizer = proba.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        return proba / normalizer
+    return tree.tree_.value[:, 0, 0].copy()
+
+def compile_forest(model):
+    """
+    Flatten a fitted RandomForestClassifier/RandomForestRegressor into a
+    CompiledForest.
+    """
+    kind = 'classifier' if hasattr(model, 'classes_') else 'regressor'
+    if getattr(model, 'n_outputs_', 1) != 1:
+        raise ValueError("Only single-output forests can be compiled")
+
+    roots, features, thresholds, children, values = [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(offset, offset + n_nodes)
+        is_leaf = tree.children_left == TREE_LEAF
+
+        # Leaves point at themselves and test feature 0, so extra levels are no-ops
+        roots.append(offset)
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        children.append(np.column_stack((
+            np.where(is_leaf, node_ids, tree.children_left + offset),
+            np.where(is_leaf, node_ids, tree.children_right + offset)
+        )).ravel())
+        values.append(_leaf_values(estimator, kind))
+
+        max_depth = max(max_depth, tree.max_depth)
+        offset += n_nodes
+
+    return CompiledForest(
+        kind=kind,
+        roots=np.asarray(roots, dtype=np.intp),
+        feature=np.concatenate(features).astype(np.intp),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        children=np.concatenate(children).astype(np.intp),
+        values=np.concatenate(values),
+        max_depth=max_depth,
+        n_features=model.n_features_in_,
+        classes=getattr(model, 'classes_', None),
+        feature_names=getattr(model, 'feature_names_in_', None)
+    )
+
+def _smallest_int_dtype(max_value):
+    for dtype in (np.int8, np.int16, np.int32):
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+def _float32_floor(threshold):
+    """
+    The largest float32 not above each threshold.
+
+    For a float32 input x, ``x <= t`` and ``x <= _float32_floor(t)`` always
+    agree, so comparisons stay exact in float32.
+    """
+    rounded = threshold.astype(np.float32)
+    too_high = rounded.astype(np.float64) > threshold
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+def compact_forest(forest):
+    """
+    Return an equivalent CompiledForest that uses far less memory.
+
+    Predictions are unchanged bit for bit; see the module docstring for the
+    individual steps.
+    """
+    n_nodes = forest.n_nodes
+    node_ids = np.arange(n_nodes)
+    children = np.asarray(forest.children).reshape(-1, 2).astype(np.int64)
+    is_leaf = children[:, 0] == node_ids
+
+    # Store each distinct leaf output once; internal nodes never produce output
+    values = np.asarray(forest.values)
+    value_ids = np.zeros(n_nodes, dtype=np.int64)
+    leaf_values = values[forest.value_ids[is_leaf]] if forest.value_ids is not None else values[is_leaf]
+    unique_values, inverse = np.unique(leaf_values, axis=0, return_inverse=True)
+    value_ids[is_leaf] = inverse.ravel()
+
+    # Merge sibling leaves with identical outputs into their parent, bottom up,
+    # until no such pair is left
+    removed = np.zeros(n_nodes, dtype=bool)
+    while True:
+        left, right = children[:, 0], children[:, 1]
+        mergeable = (~is_leaf & is_leaf[left] & is_leaf[right]
+                     & (value_ids[left] == value_ids[right]))
+        if not mergeable.any():
+            break
+        parents = node_ids[mergeable]
+        removed[left[parents]] = True
+        removed[right[parents]] = True
+        value_ids[parents] = value_ids[left[parents]]
+        is_leaf[parents] = True
+        children[parents, 0] = parents
+        children[parents, 1] = parents
+
+    # Renumber the surviving nodes; trees stay contiguous and in order
+    keep = ~removed
+    new_ids = np.cumsum(keep) - 1
+    kept_children = new_ids[children[keep]]
+    kept_leaf = is_leaf[keep]
+    n_kept = int(keep.sum())
+
+    # Merging can make trees shallower; apply() only needs to walk that far
+    frontier = new_ids[np.asarray(forest.roots)]
+    max_depth = 0
+    while True:
+        frontier = frontier[~kept_leaf[frontier]]
+        if frontier.size == 0:
+            break
+        max_depth += 1
+        frontier = kept_children[frontier].ravel()
+
+    index_dtype = _smallest_int_dtype(n_kept)
+    return CompiledForest(
+        kind=forest.kind,
+        roots=new_ids[np.asarray(forest.roots)].astype(index_dtype),
+        feature=np.asarray(forest.feature)[keep].astype(_smallest_int_dtype(forest.n_features_in_)),
+        threshold=_float32_floor(np.asarray(forest.threshold, dtype=np.float64)[keep]),
+        children=kept_children.ravel().astype(index_dtype),
+        values=unique_values,
+        max_depth=max_depth,
+        n_features=forest.n_features_in_,
+        classes=getattr(forest, 'classes_', None),
+        feature_names=getattr(forest, 'feature_names_in_', None),
+        value_ids=value_ids[keep].astype(_smallest_int_dtype(max(len(unique_values) - 1, 0)))
+    )
+
+def save_compiled_forest(forest, path):
+    """
+    Write a CompiledForest as one ``.npy`` file per array plus forest.json.
+    """
+    os.makedirs(path, exist_ok=True)
+    for name, array in forest.arrays().items():
+        np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(array))
+
+    classes = getattr(forest, 'classes_', None)
+    feature_names = getattr(forest, 'feature_names_in_', None)
+    meta = {
+        'kind': forest.kind,
+        'max_depth': int(forest.max_depth),
+        'n_features': int(forest.n_features_in_),
+        'classes': classes.tolist() if classes is not None else None,
+        'feature_names': feature_names.tolist() if feature_names is not None else None
+    }
+    with open(os.path.join(path, FOREST_META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+def load_compiled_forest(path, mmap=True):
+    """
+    Load a forest written by save_compiled_forest.
+
+    With ``mmap`` the arrays are mapped read-only rather than read, so
+    processes loading the same files share their pages.
+    """
+    with open(os.path.join(path, FOREST_META_FILE), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+
+    arrays = {}
+    for name in FOREST_ARRAYS:
+        array_path = os.path.join(path, f"{name}.npy")
+        if os.path.exists(array_path):
+            # Plain ndarray views of the mapping; np.memmap slices are slower to index
+            arrays[name] = np.asarray(np.load(array_path, mmap_mode='r' if mmap else None))
+
+    return CompiledForest(
+        kind=meta['kind'],
+        max_depth=meta['max_depth'],
+        n_features=meta['n_features'],
+        classes=np.asarray(meta['classes'], dtype=object) if meta['classes'] is not None else None,
+        feature_names=np.asarray(meta['feature_names'], dtype=object) if meta['feature_names'] is not None else None,
+        value_ids=arrays.pop('value_ids', None),
+        **arrays
+    )
+
+class ForestPredictor:
+    """
+    Serves predictions from a compiled forest, handing large batches to the
+    original sklearn model when it is available.
+
+    The compiled engine wins by a wide margin for the handful of rows a single
+    request needs and roughly keeps pace with sklearn's Cython traversal on
+    large batches, so memory-mapped bundles (which have no sklearn model) do
+    not fall behind. Both give identical results, so the switch is invisible
+    to callers.
+    """
+
+    def __init__(self, model, compiled=None, max_compiled_rows=1000):
+        self.model = model
+        self.compiled = compiled
+        self.max_compiled_rows = max_compiled_rows
+        source = compiled if compiled is not None else model
+        self.n_features_in_ = source.n_features_in_
+        if hasattr(source, 'classes_'):
+            self.classes_ = source.classes_
+        if hasattr(source, 'feature_names_in_'):
+            self.feature_names_in_ = source.feature_names_in_
+
+    def _engine_for(self, X):
+        if self.compiled is None:
+            return self.model, True
+        if self.model is not None and len(X) > self.max_compiled_rows:
+            return self.model, True
+        return self.compiled, False
+
+    def _sklearn_input(self, X):
+        # sklearn models fitted on DataFrames expect the same column names back
+        if hasattr(self, 'feature_names_in_') and not hasattr(X, 'columns'):
+            import pandas as pd
+            return pd.DataFrame(np.asarray(X), columns=self.feature_names_in_[:np.shape(X)[1]])
+        return X
+
+    def predict_proba(self, X):
+        engine, is_sklearn = self._engine_for(X)
+        return engine.predict_proba(self._sklearn_input(X) if is_sklearn else X)
+
+    def predict(self, X):
+        engine, is_sklearn = self._engine_for(X)
+        return engine.predict(self._sklearn_input(X) if is_sklearn else X)
+
+    def predict_with_trees(self, X):
+        """Predictions and per-tree outputs, see ``CompiledForest.predict_with_trees``."""
+        engine, is_sklearn = self._engine_for(X)
+        if not is_sklearn:
+            return engine.predict_with_trees(X)
+
+        # Same float32 input and estimator-order accumulation as sklearn's predict
+        X = np.asarray(X, dtype=np.float32)
+        per_tree = np.array([tree.predict(X, check_input=False) for tree in engine.estimators_])
+        total = np.zeros(per_tree.shape[1:], dtype=np.float64)
+        for tree_output in per_tree:
+            total += tree_output
+        total /= len(per_tree)
+        return total, per_tree
@@ -0,0 +1,428 @@
+"""
+Incremental crop insights from mergeable per-crop sketches.
+
+``analyze_crop_data`` needs the whole dataset because the high-yield
+threshold (75th percentile of a crop's yields) is only known once every
+record has been seen, and the optimal rainfall and temperature ranges are
+quartiles of the rows above it. ``InsightsSketch`` instead keeps, per crop:
+
+* exact running sums, counts, minima and maxima (yields, harvest days,
+  fertilizer and irrigation use),
+* exact yield sums and counts per (weather, soil, region) cell, for the
+  best-category lookups; slot 0 of each axis holds rows with a blank value,
+  which never win but still count on the other two axes,
+* fixed-bin histograms of yield, and of yield × rainfall and
+  yield × temperature, from which the threshold and the quartiles of the
+  high-yield rows are read.
+
+Folding in a batch costs O(batch); merging two sketches (e.g. from shards)
+adds their arrays, and the result is identical to sketching all the records
+in one pass.
+
+Error bound
+-----------
+Every field is exact except the four optimal range bounds and
+``high_yield_samples``. Quantiles are read from the histograms assuming
+values are spread evenly inside a bin, so each estimate lies in the same bin
+as the value it estimates:
+
+* the high-yield threshold is within one yield bin (0.05 t/ha),
+* the rainfall and temperature quartiles of the selected rows are within
+  one rainfall bin (2 mm) and one temperature bin (0.1 °C),
+* the selected rows differ from the exact high-yield rows only by rows in
+  the yield bin holding the threshold, which are counted by the fraction of
+  that bin above the threshold; ``high_yield_samples`` is off by at most
+  that bin's count.
+
+Values outside a histogram's range are counted in its first or last bin.
+Blank cells are skipped as ``analyze_crop_data`` skips them: harvest days
+are averaged over the rows that have them, and blank fertilizer and
+irrigation cells count as not used.
+
+Trust rule
+----------
+A sketch remembers the SHA-256 content hash of every CSV folded into it
+(for a columnar store, the hash of the CSV it was converted from), and the
+insights artifact written from it lists those hashes. ``load_crop_insights``
+keeps a sketch artifact when the CSV next to it is missing or is one of the
+files the sketch ingested, since the sketch then covers the CSV and
+possibly newer records. If the CSV holds content the sketch never saw, the
+CSV wins: the artifact is rebuilt from it exactly, and the sketch's
+artifact can be rewritten after folding the CSV in.
+
+Usage:
+    python -m ml.insights_sketch update crop_yield.sketch.npz new_records.csv [...]
+    python -m ml.insights_sketch merge merged.sketch.npz shard1.sketch.npz shard2.sketch.npz
+    python -m ml.insights_sketch insights crop_yield.sketch.npz [--output crop_yield.insights.json]
+"""
+
+import argparse
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .data_analyzer import ANALYZER_COLUMNS, INSIGHTS_ARTIFACT_VERSION, category_codes, compute_file_hash, flag_values
+from .dataset_store import is_store, read_dataset, read_store_meta
+
+SKETCH_FORMAT_VERSION = 2
+
+# Histogram ranges and bin widths: (start, stop, width)
+YIELD_BINS = (-5.0, 15.0, 0.05)
+RAINFALL_BINS = (0.0, 2000.0, 2.0)
+TEMPERATURE_BINS = (-10.0, 60.0, 0.1)
+
+# Exact per-crop totals, in the order they are stored
+TOTALS = ['rows', 'yield_count', 'yield_sum', 'harvest_count', 'harvest_sum', 'fertilizer_sum', 'irrigation_sum']
+
+def n_bins(bins):
+    start, stop, width = bins
+    return int(round((stop - start) / width))
+
+def bin_index(values, bins):
+    """Histogram bin of each value, clamped into the range (blanks, which callers mask out, get bin 0)."""
+    start, _, width = bins
+    values = np.nan_to_num(values, nan=start)
+    return np.clip(np.floor((values - start) / width), 0, n_bins(bins) - 1).astype(np.intp)
+
+def histogram_quantile(counts, bins, q):
+    """
+    The q-quantile of a (possibly fractionally weighted) histogram, with
+    values spread evenly inside each bin.
+    """
+    start, _, width = bins
+    total = counts.sum()
+    if total <= 0:
+        return float('nan')
+    cumulative = np.cumsum(counts)
+    target = q * total
+    index = min(int(np.searchsorted(cumulative, target, side='left')), len(counts) - 1)
+    # Skip empty bins the target lands on the edge of
+    while counts[index] <= 0 and index + 1 < len(counts):
+        index += 1
+    before = cumulative[index] - counts[index]
+    fraction = min(max((target - before) / counts[index], 0.0), 1.0)
+    return float(start + (index + fraction) * width)
+
+class _Labels:
+    """Category labels in the order they were first seen."""
+
+    def __init__(self, labels=()):
+        self.labels = list(labels)
+        self._index = {label: i for i, label in enumerate(self.labels)}
+
+    def codes(self, labels):
+        """Indices of ``labels``, adding the unseen ones."""
+        for label in labels:
+            if label not in self._index:
+                self._index[label] = len(self.labels)
+                self.labels.append(label)
+        return np.array([self._index[label] for label in labels], dtype=np.intp)
+
+    def __len__(self):
+        return len(self.labels)
+
+class _CropSketch:
+    __slots__ = ('totals', 'extremes', 'yield_hist', 'rainfall_hist', 'temperature_hist', 'cell_sums', 'cell_counts')
+
+    def __init__(self, cell_shape):
+        self.totals = np.zeros(len(TOTALS))
+        self.extremes = np.array([np.inf, -np.inf, np.inf, -np.inf])
+        self.yield_hist = np.zeros(n_bins(YIELD_BINS), dtype=np.int64)
+        self.rainfall_hist = np.zeros((n_bins(YIELD_BINS), n_bins(RAINFALL_BINS)), dtype=np.int64)
+        self.temperature_hist = np.zeros((n_bins(YIELD_BINS), n_bins(TEMPERATURE_BINS)), dtype=np.int64)
+        self.cell_sums = np.zeros(cell_shape)
+        self.cell_counts = np.zeros(cell_shape, dtype=np.int64)
+
+    def grow(self, cell_shape):
+        """Pad the cell arrays when new weather, soil or region labels appear."""
+        padding = [(0, new - old) for old, new in zip(self.cell_sums.shape, cell_shape)]
+        if any(after for _, after in padding):
+            self.cell_sums = np.pad(self.cell_sums, padding)
+            self.cell_counts = np.pad(self.cell_counts, padding)
+
+class InsightsSketch:
+    """
+    Mergeable per-crop summaries that produce the ``crop_insights`` dict.
+
+    Crops are reported in the order they were first seen, as
+    ``analyze_crop_data`` does for a single file.
+    """
+
+    def __init__(self):
+        self.crops = {}
+        self.weather = _Labels()
+        self.soil = _Labels()
+        self.region = _Labels()
+        # Content hashes of the files folded in, for the artifact's trust rule
+        self.source_hashes = []
+
+    @property
+    def cell_shape(self):
+        # One extra slot per axis, in front, for blank values
+        return (len(self.weather) + 1, len(self.soil) + 1, len(self.region) + 1)
+
+    def _crop(self, name):
+        sketch = self.crops.get(name)
+        if sketch is None:
+            sketch = self.crops[name] = _CropSketch(self.cell_shape)
+        return sketch
+
+    def _grow(self):
+        for sketch in self.crops.values():
+            sketch.grow(self.cell_shape)
+
+    def update(self, data):
+        """Fold a batch of records (a frame with the analyzer's columns) into the sketch."""
+        crop_codes, crop_names = category_codes(data['Crop'])
+        weather_codes, weather_names = category_codes(data['Weather_Condition'])
+        soil_codes, soil_names = category_codes(data['Soil_Type'])
+        region_codes, region_names = category_codes(data['Region'])
+
+        # Batch category codes translated into the sketch's cell slots
+        # (missing values, code -1, pick the appended blank slot 0)
+        weather = np.append(self.weather.codes([str(name) for name in weather_names]) + 1, 0)[weather_codes]
+        soil = np.append(self.soil.codes([str(name) for name in soil_names]) + 1, 0)[soil_codes]
+        region = np.append(self.region.codes([str(name) for name in region_names]) + 1, 0)[region_codes]
+
+        yields = data['Yield_tons_per_hectare'].to_numpy(dtype=float)
+        rainfall = data['Rainfall_mm'].to_numpy(dtype=float)
+        temperature = data['Temperature_Celsius'].to_numpy(dtype=float)
+        harvest_days = data['Days_to_Harvest'].to_numpy(dtype=float)
+        fertilizer = flag_values(data['Fertilizer_Used'])
+        irrigation = flag_values(data['Irrigation_Used'])
+
+        yield_bin = bin_index(yields, YIELD_BINS)
+        rainfall_bin = bin_index(rainfall, RAINFALL_BINS)
+        temperature_bin = bin_index(temperature, TEMPERATURE_BINS)
+
+        for code in pd.unique(crop_codes[crop_codes >= 0]):
+            rows = crop_codes == code
+            sketch = self._crop(str(crop_names[code]).lower())
+            sketch.grow(self.cell_shape)
+
+            has_yield = rows & ~np.isnan(yields)
+            crop_yields = yields[has_yield]
+            crop_harvest_days = harvest_days[rows & ~np.isnan(harvest_days)]
+            sketch.totals += [
+                np.count_nonzero(rows), len(crop_yields), crop_yields.sum(),
+                len(crop_harvest_days), crop_harvest_days.sum(),
+                np.nansum(fertilizer[rows]), np.nansum(irrigation[rows])
+            ]
+            if len(crop_yields):
+                sketch.extremes[0] = min(sketch.extremes[0], crop_yields.min())
+                sketch.extremes[1] = max(sketch.extremes[1], crop_yields.max())
+            if len(crop_harvest_days):
+                sketch.extremes[2] = min(sketch.extremes[2], crop_harvest_days.min())
+                sketch.extremes[3] = max(sketch.extremes[3], crop_harvest_days.max())
+
+            sketch.yield_hist += np.bincount(yield_bin[has_yield], minlength=len(sketch.yield_hist))
+            with_rainfall = has_yield & ~np.isnan(rainfall)
+            np.add.at(sketch.rainfall_hist, (yield_bin[with_rainfall], rainfall_bin[with_rainfall]), 1)
+            with_temperature = has_yield & ~np.isnan(temperature)
+            np.add.at(sketch.temperature_hist, (yield_bin[with_temperature], temperature_bin[with_temperature]), 1)
+
+            cell = (weather[has_yield], soil[has_yield], region[has_yield])
+            np.add.at(sketch.cell_sums, cell, crop_yields)
+            np.add.at(sketch.cell_counts, cell, 1)
+
+        self._grow()
+        return self
+
+    def merge(self, other):
+        """Add another sketch's records to this one."""
+        self.add_source_hashes(other.source_hashes)
+        weather = self.weather.codes(other.weather.labels) + 1
+        soil = self.soil.codes(other.soil.labels) + 1
+        region = self.region.codes(other.region.labels) + 1
+        self._grow()
+        # Their blank slot 0 lands on ours
+        cells = np.ix_(np.append(0, weather), np.append(0, soil), np.append(0, region))
+
+        for name, theirs in other.crops.items():
+            ours = self._crop(name)
+            ours.grow(self.cell_shape)
+            ours.totals += theirs.totals
+            ours.extremes[[0, 2]] = np.minimum(ours.extremes[[0, 2]], theirs.extremes[[0, 2]])
+            ours.extremes[[1, 3]] = np.maximum(ours.extremes[[1, 3]], theirs.extremes[[1, 3]])
+            ours.yield_hist += theirs.yield_hist
+            ours.rainfall_hist += theirs.rainfall_hist
+            ours.temperature_hist += theirs.temperature_hist
+            ours.cell_sums[cells] += theirs.cell_sums
+            ours.cell_counts[cells] += theirs.cell_counts
+        return self
+
+    def add_source_hashes(self, hashes):
+        for source_hash in hashes:
+            if source_hash and source_hash not in self.source_hashes:
+                self.source_hashes.append(source_hash)
+
+    def _best_category(self, sketch, axis, labels):
+        # Ties resolve to the alphabetically first label, as in analyze_crop_frame
+        other_axes = tuple(i for i in range(3) if i != axis)
+        counts = sketch.cell_counts.sum(axis=other_axes)[1:]
+        means = np.where(counts > 0, sketch.cell_sums.sum(axis=other_axes)[1:] / np.maximum(counts, 1), -np.inf)
+        order = sorted(range(len(labels)), key=lambda i: labels.labels[i])
+        return labels.labels[max(order, key=lambda i: means[i])]
+
+    def insights(self):
+        """The ``crop_insights`` dict, in the structure ``analyze_crop_data`` returns."""
+        crop_insights = {}
+        for name, sketch in self.crops.items():
+            totals = dict(zip(TOTALS, sketch.totals.tolist()))
+            yield_min, yield_max, harvest_min, harvest_max = sketch.extremes.tolist()
+            if not totals['yield_count']:
+                continue
+
+            # Weight of each yield bin in the high-yield subset: the bin
+            # holding the threshold counts by the fraction above it
+            threshold = histogram_quantile(sketch.yield_hist, YIELD_BINS, 0.75)
+            start, _, width = YIELD_BINS
+            lower_edges = start + np.arange(len(sketch.yield_hist)) * width
+            weights = np.clip((lower_edges + width - threshold) / width, 0.0, 1.0)
+
+            rainfall = weights @ sketch.rainfall_hist
+            temperature = weights @ sketch.temperature_hist
+            rainfall_q25, rainfall_q75 = (histogram_quantile(rainfall, RAINFALL_BINS, q) for q in (0.25, 0.75))
+            temp_q25, temp_q75 = (histogram_quantile(temperature, TEMPERATURE_BINS, q) for q in (0.25, 0.75))
+
+            rows = totals['rows']
+            if totals['harvest_count']:
+                avg_harvest_days = totals['harvest_sum'] / totals['harvest_count']
+            else:
+                avg_harvest_days = harvest_min = harvest_max = float('nan')
+            crop_insights[name] = {
+                'optimal_rainfall_min': round(rainfall_q25, 0),
+                'optimal_rainfall_max': round(rainfall_q75, 0),
+                'optimal_temp_min': round(temp_q25, 1),
+                'optimal_temp_max': round(temp_q75, 1),
+                'avg_yield': round(totals['yield_sum'] / totals['yield_count'], 1),
+                'max_yield': round(yield_max, 1),
+                'min_yield': round(yield_min, 1),
+                'avg_harvest_days': round(avg_harvest_days, 0),
+                'min_harvest_days': round(harvest_min, 0),
+                'max_harvest_days': round(harvest_max, 0),
+                'fertilizer_usage_rate': round((totals['fertilizer_sum'] / rows) * 100, 1),
+                'irrigation_usage_rate': round((totals['irrigation_sum'] / rows) * 100, 1),
+                'best_weather': self._best_category(sketch, 0, self.weather),
+                'best_soil': self._best_category(sketch, 1, self.soil),
+                'best_region': self._best_category(sketch, 2, self.region),
+                'total_samples': int(rows),
+                'high_yield_samples': int(round(float(weights @ sketch.yield_hist)))
+            }
+        return crop_insights
+
+    def save(self, path):
+        """Write the sketch to a compressed ``.npz`` file (atomically)."""
+        meta = {
+            'format_version': SKETCH_FORMAT_VERSION,
+            'bins': {'yield': YIELD_BINS, 'rainfall': RAINFALL_BINS, 'temperature': TEMPERATURE_BINS},
+            'crops': list(self.crops),
+            'weather': self.weather.labels,
+            'soil': self.soil.labels,
+            'region': self.region.labels,
+            'source_hashes': self.source_hashes
+        }
+        arrays = {'meta': np.array(json.dumps(meta))}
+        for index, sketch in enumerate(self.crops.values()):
+            for field in _CropSketch.__slots__:
+                arrays[f"{index}_{field}"] = getattr(sketch, field)
+
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            meta = json.loads(str(arrays['meta']))
+            if meta.get('format_version') != SKETCH_FORMAT_VERSION:
+                raise ValueError(f"{path} has sketch format {meta.get('format_version')}, expected {SKETCH_FORMAT_VERSION}")
+            bins = {'yield': list(YIELD_BINS), 'rainfall': list(RAINFALL_BINS), 'temperature': list(TEMPERATURE_BINS)}
+            if meta['bins'] != bins:
+                raise ValueError(f"{path} was built with different histogram bins")
+
+            sketch = cls()
+            sketch.weather = _Labels(meta['weather'])
+            sketch.soil = _Labels(meta['soil'])
+            sketch.region = _Labels(meta['region'])
+            sketch.source_hashes = list(meta.get('source_hashes', []))
+            for index, name in enumerate(meta['crops']):
+                crop = sketch.crops[name] = _CropSketch(sketch.cell_shape)
+                for field in _CropSketch.__slots__:
+                    setattr(crop, field, arrays[f"{index}_{field}"])
+        return sketch
+
+def source_hash(path):
+    """Content hash of a CSV, or of the CSV a columnar store was converted from (None if unknown)."""
+    if is_store(path):
+        return read_store_meta(path).get('source_sha256')
+    return compute_file_hash(path)
+
+def sketch_files(paths, sketch=None):
+    """Fold every record of the given CSVs or columnar stores into a sketch."""
+    sketch = sketch or InsightsSketch()
+    for path in paths:
+        sketch.update(read_dataset(path, ANALYZER_COLUMNS))
+        sketch.add_source_hashes([source_hash(path)])
+    return sketch
+
+def write_insights_artifact(sketch, artifact_path):
+    """
+    Write the sketch's insights in the artifact format ``load_crop_insights``
+    reads, marked as a sketch artifact along with the files it covers.
+    """
+    artifact = {
+        'format_version': INSIGHTS_ARTIFACT_VERSION,
+        'source_hash': None,
+        'source': 'sketch',
+        'source_hashes': sketch.source_hashes,
+        'crop_insights': sketch.insights()
+    }
+    temp_path = f"{artifact_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(artifact, f)
+    os.replace(temp_path, artifact_path)
+    return artifact['crop_insights']
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Maintain incremental crop insights sketches')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    update = commands.add_parser('update', help='Fold record files into a sketch (created if missing)')
+    update.add_argument('sketch', help='Sketch file (.npz)')
+    update.add_argument('records', nargs='+', help='CSV files or columnar stores of new records')
+
+    merge = commands.add_parser('merge', help='Merge sketches, e.g. from several shards')
+    merge.add_argument('output', help='Merged sketch file (.npz)')
+    merge.add_argument('sketches', nargs='+', help='Sketches to merge')
+
+    insights = commands.add_parser('insights', help='Print or write the crop insights of a sketch')
+    insights.add_argument('sketch', help='Sketch file (.npz)')
+    insights.add_argument('--output', help='Write an insights artifact here instead of printing')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'update':
+        sketch = InsightsSketch.load(args.sketch) if os.path.exists(args.sketch) else InsightsSketch()
+        sketch_files(args.records, sketch).save(args.sketch)
+        print(f"✅ Folded {len(args.records)} file(s) into {args.sketch} ({len(sketch.crops)} crops)")
+    elif args.command == 'merge':
+        merged = InsightsSketch()
+        for path in args.sketches:
+            merged.merge(InsightsSketch.load(path))
+        merged.save(args.output)
+        print(f"✅ Merged {len(args.sketches)} sketches into {args.output} ({len(merged.crops)} crops)")
+    elif args.output:
+        crop_insights = write_insights_artifact(InsightsSketch.load(args.sketch), args.output)
+        print(f"✅ Wrote {args.output} with insights for {len(crop_insights)} crops.")
+    else:
+        print(json.dumps(InsightsSketch.load(args.sketch).insights(), indent=2))
+
+if __name__ == '__main__':
+    main()
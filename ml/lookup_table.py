@@ -0,0 +1,390 @@
+"""
+Precomputed recommendation lookup table.
+
+Region, soil type and weather condition have a few dozen combinations (72
+in the shipped dataset), fertilizer and irrigation are booleans, and
+rainfall and temperature can be put on a grid. ``build_lookup_table``
+evaluates the three models once over that whole discretized input space and
+stores, for every grid point, the top-k candidate crops with their
+probabilities, predicted yields and harvest days in flat arrays. A request
+then costs an index computation instead of three forest traversals.
+
+By default only requests whose rainfall and temperature lie exactly on the
+grid are answered from the table, and those answers are the live answers:
+probabilities and yields are stored as float64, exactly as the models
+returned them. With ``snap='nearest'`` every request inside the grid's range
+is snapped to the nearest grid point; the forests are not smooth in rainfall
+and temperature, so that changes answers noticeably. ``deviation_report``
+measures both modes against live inference and the report is stored with
+the table. Inputs off the grid are served by live inference.
+
+Tables live in the ``lookup/`` directory of the bundle they were built from
+and are memory-mapped when loaded.
+
+Usage:
+    python -m ml.lookup_table [--version V] [--rainfall 100:1000:25] [--temperature 15:40:0.5] [--samples 2000]
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+LOOKUP_FORMAT_VERSION = 2
+
+# Directory of a bundle holding its lookup table
+LOOKUP_DIR = 'lookup'
+LOOKUP_META_FILE = 'meta.json'
+LOOKUP_ARRAYS = ('crops', 'probabilities', 'yields', 'harvest_days')
+
+# Categorical axes of the table, in index order
+CATEGORY_AXES = ('Region', 'Soil_Type', 'Weather_Condition')
+
+# How requests are matched to grid points
+SNAP_MODES = ('exact', 'nearest')
+
+# Default rainfall and temperature grids: (start, stop, step), spanning the training data
+DEFAULT_RAINFALL_AXIS = (100.0, 1000.0, 25.0)
+DEFAULT_TEMPERATURE_AXIS = (15.0, 40.0, 0.5)
+
+def axis_values(start, stop, step):
+    """Grid values from start up to stop inclusive."""
+    count = int(np.floor((stop - start) / step + 1e-9)) + 1
+    return np.round(start + np.arange(count) * step, 6)
+
+def parse_axis(text):
+    """Parse 'start:stop:step' into a float triple."""
+    start, stop, step = (float(part) for part in text.split(':'))
+    if step <= 0 or stop < start:
+        raise argparse.ArgumentTypeError(f"'{text}' needs start <= stop and a positive step")
+    return start, stop, step
+
+class LookupTable:
+    """
+    Top-k recommendations for every point of the discretized input space.
+
+    Arrays are indexed by a flat grid point number; ``crops`` holds class
+    indices into ``classes`` (-1 where a candidate fell below the confidence
+    threshold).
+    """
+
+    def __init__(self, meta, arrays, snap='exact'):
+        if snap not in SNAP_MODES:
+            raise ValueError(f"Unknown lookup snap mode '{snap}' (expected one of {', '.join(SNAP_MODES)})")
+        self.meta = meta
+        self.snap = snap
+        self.version = meta['bundle_version']
+        self.classes = np.asarray(meta['classes'], dtype=object)
+        self.category_sizes = [meta['categories'][column] for column in CATEGORY_AXES]
+        self.rainfall_axis = tuple(meta['rainfall_axis'])
+        self.temperature_axis = tuple(meta['temperature_axis'])
+        self.n_rainfall = len(axis_values(*self.rainfall_axis))
+        self.n_temperature = len(axis_values(*self.temperature_axis))
+        self.crops = arrays['crops']
+        self.probabilities = arrays['probabilities']
+        self.yields = arrays['yields']
+        self.harvest_days = arrays['harvest_days']
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in LOOKUP_ARRAYS)
+
+    def _axis_index(self, value, axis, size):
+        start, _, step = axis
+        index = int(round((value - start) / step))
+        if not 0 <= index < size:
+            return None
+        if self.snap == 'exact' and abs(start + index * step - value) > 1e-6:
+            return None
+        return index
+
+    def point(self, features):
+        """
+        Flat grid point for an encoded feature row, or None when the row is
+        off the grid.
+        """
+        region, soil, weather = features['Region'], features['Soil_Type'], features['Weather_Condition']
+        for code, size in zip((region, soil, weather), self.category_sizes):
+            if not 0 <= code < size:
+                return None
+        rainfall = self._axis_index(features['Rainfall_mm'], self.rainfall_axis, self.n_rainfall)
+        temperature = self._axis_index(features['Temperature_Celsius'], self.temperature_axis, self.n_temperature)
+        if rainfall is None or temperature is None:
+            return None
+
+        index = (region * self.category_sizes[1] + soil) * self.category_sizes[2] + weather
+        index = (index * 2 + int(features['Fertilizer_Used'])) * 2 + int(features['Irrigation_Used'])
+        return (index * self.n_rainfall + rainfall) * self.n_temperature + temperature
+
+    def lookup(self, features):
+        """
+        The stored model outputs for a feature row, shaped like one entry of
+        ``predict_feature_rows``.
+
+        Returns:
+            tuple: (candidates, predicted yields, predicted harvest times), or
+                None when the row is off the grid
+        """
+        point = self.point(features)
+        if point is None:
+            return None
+        keep = self.crops[point] >= 0
+        candidates = [
+            (self.classes[crop], float(probability) * 100)
+            for crop, probability in zip(self.crops[point][keep], self.probabilities[point][keep])
+        ]
+        return candidates, self.yields[point][keep].tolist(), self.harvest_days[point][keep].tolist()
+
+    def describe(self):
+        return {
+            'bundle_version': self.version,
+            'points': int(len(self.crops)),
+            'top_k': int(self.crops.shape[1]),
+            'snap': self.snap,
+            'rainfall_axis': list(self.rainfall_axis),
+            'temperature_axis': list(self.temperature_axis),
+            'nbytes': int(self.nbytes),
+            'built_at': self.meta.get('built_at'),
+            'deviation': self.meta.get('deviation')
+        }
+
+def grid_matrix(category_sizes, rainfall_values, temperature_values, start, stop):
+    """Feature rows (FEATURE_COLUMNS order) for flat grid points [start, stop)."""
+    shape = tuple(category_sizes) + (2, 2, len(rainfall_values), len(temperature_values))
+    region, soil, weather, fertilizer, irrigation, rainfall, temperature = np.unravel_index(
+        np.arange(start, stop), shape)
+    return np.column_stack([
+        region, soil, rainfall_values[rainfall], temperature_values[temperature],
+        fertilizer, irrigation, weather
+    ]).astype(float)
+
+def build_lookup_table(bundle, rainfall_axis=DEFAULT_RAINFALL_AXIS, temperature_axis=DEFAULT_TEMPERATURE_AXIS,
+                       top_k=3, min_confidence=5, chunk_points=20000):
+    """
+    Evaluate the bundle's models over the whole discretized input space.
+
+    Candidates are chosen exactly as ``select_candidate_crops`` does: the
+    top_k classes by probability, best first, dropping those under
+    ``min_confidence`` percent.
+
+    Returns:
+        LookupTable: The table, held in memory
+    """
+    # Imported here; recommendation itself imports this module
+    from .recommendation import encode_crops, model_feature_columns
+
+    # One axis entry per fitted class; the encoder's lookup tables also hold aliases
+    category_sizes = [len(bundle.label_encoders[column].classes_) for column in CATEGORY_AXES]
+    rainfall_values = axis_values(*rainfall_axis)
+    temperature_values = axis_values(*temperature_axis)
+    n_points = int(np.prod(category_sizes)) * 4 * len(rainfall_values) * len(temperature_values)
+
+    classes = bundle.crop_predictor.classes_
+    crop_codes = encode_crops(bundle, classes).astype(float)
+    yield_columns = len(model_feature_columns(bundle.yield_predictor))
+    harvest_columns = len(model_feature_columns(bundle.harvest_predictor))
+
+    crops = np.full((n_points, top_k), -1, dtype=np.int8)
+    probabilities = np.zeros((n_points, top_k), dtype=np.float64)
+    yields = np.zeros((n_points, top_k), dtype=np.float64)
+    harvest_days = np.zeros((n_points, top_k), dtype=np.int16)
+
+    started = time.perf_counter()
+    for start in range(0, n_points, chunk_points):
+        stop = min(start + chunk_points, n_points)
+        matrix = grid_matrix(category_sizes, rainfall_values, temperature_values, start, stop)
+        proba = bundle.crop_predictor.predict_proba(matrix)
+
+        # Same ordering as select_candidate_crops, one row at a time
+        top = np.argsort(proba, axis=1)[:, -top_k:][:, ::-1]
+        top_proba = np.take_along_axis(proba, top, axis=1)
+        keep = top_proba * 100 >= min_confidence
+
+        rows, slots = np.nonzero(keep)
+        pairs = np.column_stack([matrix[rows], crop_codes[top[rows, slots]]])
+        chunk = slice(start, stop)
+        crops[chunk][rows, slots] = top[rows, slots]
+        probabilities[chunk][rows, slots] = top_proba[rows, slots]
+        if len(pairs):
+            yields[chunk][rows, slots] = bundle.yield_predictor.predict(pairs[:, :yield_columns])
+            # Truncated like render_recommendation's int()
+            harvest_days[chunk][rows, slots] = bundle.harvest_predictor.predict(pairs[:, :harvest_columns]).astype(int)
+
+        elapsed = time.perf_counter() - started
+        print(f"   {stop}/{n_points} grid points ({elapsed:.0f}s, ~{elapsed / stop * (n_points - stop):.0f}s left)")
+
+    meta = {
+        'format_version': LOOKUP_FORMAT_VERSION,
+        'bundle_version': bundle.version,
+        'built_at': datetime.now().isoformat(timespec='seconds'),
+        'classes': [str(crop_name) for crop_name in classes],
+        'categories': dict(zip(CATEGORY_AXES, category_sizes)),
+        'rainfall_axis': list(rainfall_axis),
+        'temperature_axis': list(temperature_axis),
+        'top_k': top_k,
+        'min_confidence': min_confidence
+    }
+    return LookupTable(meta, {
+        'crops': crops, 'probabilities': probabilities, 'yields': yields, 'harvest_days': harvest_days
+    })
+
+def save_lookup_table(table, bundle_dir):
+    """Write a table into ``lookup/`` of a bundle directory, replacing any previous one."""
+    path = os.path.join(bundle_dir, LOOKUP_DIR)
+    os.makedirs(path, exist_ok=True)
+    # Remove the metadata first so a half-written table is never loaded
+    meta_path = os.path.join(path, LOOKUP_META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    for name in LOOKUP_ARRAYS:
+        np.save(os.path.join(path, f"{name}.npy"), getattr(table, name))
+    temp_path = f"{meta_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(table.meta, f, indent=2)
+    os.replace(temp_path, meta_path)
+    return path
+
+def load_lookup_table(bundle_dir, version, snap='exact', mmap=True):
+    """
+    Load the lookup table stored with a bundle.
+
+    Returns:
+        LookupTable: The table, or None if the bundle has none or it was
+            built from a different bundle version
+    """
+    path = os.path.join(bundle_dir, LOOKUP_DIR)
+    try:
+        with open(os.path.join(path, LOOKUP_META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if meta.get('format_version') != LOOKUP_FORMAT_VERSION or meta.get('bundle_version') != version:
+        print(f"⚠️ Ignoring lookup table in {path}: built for bundle {meta.get('bundle_version')}")
+        return None
+    arrays = {
+        name: np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r' if mmap else None))
+        for name in LOOKUP_ARRAYS
+    }
+    return LookupTable(meta, arrays, snap=snap)
+
+def random_feature_rows(table, count, on_grid=False, seed=0):
+    """
+    Random encoded feature rows inside the grid's range, with rainfall and
+    temperature either continuous or on grid points.
+    """
+    rng = np.random.default_rng(seed)
+    rainfall_values = axis_values(*table.rainfall_axis)
+    temperature_values = axis_values(*table.temperature_axis)
+
+    def draw(values):
+        if on_grid:
+            return float(values[rng.integers(len(values))])
+        return float(rng.uniform(values[0], values[-1]))
+
+    return [
+        {
+            'Region': int(rng.integers(table.category_sizes[0])),
+            'Soil_Type': int(rng.integers(table.category_sizes[1])),
+            'Rainfall_mm': draw(rainfall_values),
+            'Temperature_Celsius': draw(temperature_values),
+            'Fertilizer_Used': int(rng.integers(2)),
+            'Irrigation_Used': int(rng.integers(2)),
+            'Weather_Condition': int(rng.integers(table.category_sizes[2]))
+        }
+        for _ in range(count)
+    ]
+
+def compare_with_live(bundle, table, feature_rows):
+    """
+    Agreement rates of the top crop and the candidate lists, and mean/max
+    absolute differences of the matching crops' suitability (percentage
+    points), yield (tons/ha) and harvest days.
+    """
+    from .recommendation import predict_feature_rows
+
+    samples = len(feature_rows)
+    live = predict_feature_rows(bundle, feature_rows)
+
+    top_matches = list_matches = 0
+    differences = {'suitability': [], 'yield': [], 'harvest_days': []}
+    for features, (candidates, predicted_yields, predicted_harvest_times) in zip(feature_rows, live):
+        stored_candidates, stored_yields, stored_harvest_days = table.lookup(features)
+        live_crops = [crop_name for crop_name, _ in candidates]
+        stored_crops = [crop_name for crop_name, _ in stored_candidates]
+        top_matches += live_crops[:1] == stored_crops[:1]
+        list_matches += live_crops == stored_crops
+
+        stored = {crop_name: (confidence, stored_yields[i], stored_harvest_days[i])
+                  for i, (crop_name, confidence) in enumerate(stored_candidates)}
+        for (crop_name, confidence), predicted_yield, predicted_harvest_time in zip(
+                candidates, predicted_yields, predicted_harvest_times):
+            if crop_name in stored:
+                stored_confidence, stored_yield, stored_harvest = stored[crop_name]
+                differences['suitability'].append(abs(confidence - stored_confidence))
+                differences['yield'].append(abs(predicted_yield - stored_yield))
+                differences['harvest_days'].append(abs(int(predicted_harvest_time) - stored_harvest))
+
+    report = {
+        'samples': samples,
+        'top_crop_agreement': round(top_matches / samples, 4),
+        'candidate_list_agreement': round(list_matches / samples, 4)
+    }
+    for name, values in differences.items():
+        report[f"{name}_mean_abs_diff"] = round(float(np.mean(values)), 4) if values else None
+        report[f"{name}_max_abs_diff"] = round(float(np.max(values)), 4) if values else None
+    return report
+
+def deviation_report(bundle, table, samples=2000, seed=0):
+    """
+    Compare the table with live inference: on random grid points (what
+    exact matching serves) and on random continuous in-range inputs snapped
+    to the nearest grid point.
+
+    Returns:
+        dict: compare_with_live results under 'on_grid' and 'snapped'
+    """
+    nearest = LookupTable(table.meta, {name: getattr(table, name) for name in LOOKUP_ARRAYS}, snap='nearest')
+    return {
+        'on_grid': compare_with_live(bundle, nearest, random_feature_rows(table, samples, on_grid=True, seed=seed)),
+        'snapped': compare_with_live(bundle, nearest, random_feature_rows(table, samples, seed=seed))
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute the recommendation lookup table of a model bundle')
+    parser.add_argument('--version', help='Bundle version (defaults to the current one)')
+    parser.add_argument('--rainfall', type=parse_axis, default=DEFAULT_RAINFALL_AXIS,
+                        help='Rainfall grid as start:stop:step in mm (default 100:1000:25)')
+    parser.add_argument('--temperature', type=parse_axis, default=DEFAULT_TEMPERATURE_AXIS,
+                        help='Temperature grid as start:stop:step in Celsius (default 15:40:0.5)')
+    parser.add_argument('--top-k', type=int, default=3, help='Candidate crops stored per grid point')
+    parser.add_argument('--samples', type=int, default=2000, help='Random inputs for the deviation report')
+    args = parser.parse_args(argv)
+
+    from .recommendation import model_registry
+
+    if args.version:
+        model_registry.reload(args.version)
+    bundle = model_registry.get()
+    if bundle is None:
+        raise SystemExit("✗ No model bundle could be loaded")
+
+    print(f"Building lookup table for bundle {bundle.version}...")
+    started = time.perf_counter()
+    table = build_lookup_table(bundle, args.rainfall, args.temperature, top_k=args.top_k)
+    print(f"✓ Evaluated {len(table.crops)} grid points in {time.perf_counter() - started:.1f}s "
+          f"({table.nbytes / 1024 / 1024:.1f} MB)")
+
+    report = deviation_report(bundle, table, samples=args.samples)
+    table.meta['deviation'] = report
+    path = save_lookup_table(table, bundle.path)
+    print(f"✓ Saved lookup table to {path}")
+    for mode, title in (('on_grid', 'on grid points'), ('snapped', 'snapped to the nearest grid point')):
+        print(f"Deviation from live inference, random inputs {title}:")
+        for name, value in report[mode].items():
+            print(f"   {name:<32}{value}")
+
+if __name__ == '__main__':
+    main()
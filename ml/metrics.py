@@ -0,0 +1,378 @@
+"""
+Lightweight in-process metrics exposed in the Prometheus text format.
+
+Counters and histograms are plain Python objects updated under a per-series
+lock; an observation costs a ``bisect`` and two additions, and nothing is
+formatted until ``/metrics`` is scraped. Values owned by other components
+(response cache, batcher, model registry) are read by collectors at scrape
+time instead of being mirrored on the request path. ``AGROVIA_METRICS=0``
+turns every span and counter into a no-op.
+
+Under serve.py every worker has its own metrics. Each worker writes a
+snapshot of them to ``AGROVIA_METRICS_DIR`` every few seconds and when it
+scrapes, and ``/metrics`` serves the sum over all snapshots, so any worker
+answers for the whole server (other workers' values may lag by up to the
+snapshot interval). When a worker exits the parent folds its counters and
+histograms into a retired snapshot, so totals never go backwards, and drops
+its gauges.
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Histogram bucket upper bounds in seconds, spanning cache hits to cold loads
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(labels):
+    """Render a label dict as ``{name="value",...}`` (empty string for no labels)."""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+class _Timer:
+    """Context manager that observes its elapsed time into a histogram series."""
+
+    __slots__ = ('_series', '_started')
+
+    def __init__(self, series):
+        self._series = series
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._series.observe(time.perf_counter() - self._started)
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+NULL_TIMER = _NullTimer()
+
+class _CounterSeries:
+    __slots__ = ('value', '_lock', '_enabled')
+
+    def __init__(self, enabled):
+        self.value = 0.0
+        self._lock = threading.Lock()
+        self._enabled = enabled
+
+    def inc(self, amount=1.0):
+        if self._enabled:
+            with self._lock:
+                self.value += amount
+
+class _HistogramSeries:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock', '_enabled')
+
+    def __init__(self, buckets, enabled):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+        self._enabled = enabled
+
+    def observe(self, value):
+        if not self._enabled:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Time a block of code: ``with histogram.labels('stage').time(): ...``"""
+        return _Timer(self) if self._enabled else NULL_TIMER
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), enabled=True):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.enabled = enabled
+        self._series = {}
+        self._lock = threading.Lock()
+
+    @property
+    def family_name(self):
+        return self.name
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """The series for one combination of label values, created on first use."""
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                series = self._series.setdefault(values, self._new_series())
+        return series
+
+    def _labelled_series(self):
+        with self._lock:
+            items = list(self._series.items())
+        return [(dict(zip(self.labelnames, values)), series) for values, series in sorted(items)]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    @property
+    def family_name(self):
+        return f"{self.name}_total"
+
+    def _new_series(self):
+        return _CounterSeries(self.enabled)
+
+    def inc(self, amount=1.0):
+        """Increment the unlabelled series."""
+        self.labels().inc(amount)
+
+    def samples(self):
+        return [(self.family_name, labels, series.value) for labels, series in self._labelled_series()]
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, enabled=True):
+        super().__init__(name, documentation, labelnames, enabled)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets, self.enabled)
+
+    def observe(self, value):
+        """Observe into the unlabelled series."""
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self):
+        samples = []
+        for labels, series in self._labelled_series():
+            with series._lock:
+                counts, total, count = list(series.counts), series.sum, series.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", dict(labels, le=_format_value(float(bound))), cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+class MetricsRegistry:
+    """
+    Holds the process's metrics and renders them for a scrape.
+
+    Collectors are callables returning ``(name, type, help, samples)``
+    tuples, with samples as ``(sample name, labels, value)``; they are only
+    called while rendering.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames, enabled=self.enabled)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets, enabled=self.enabled)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def collect(self):
+        families = [(metric.family_name, metric.kind, metric.documentation, metric.samples()) for metric in self._metrics]
+        for collector in self._collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        return families
+
+    def write_snapshot(self, directory):
+        """Save this process's current metrics as ``<pid>.json`` in ``directory``."""
+        write_snapshot_file(os.path.join(directory, f"{os.getpid()}.json"), self.collect())
+
+    def start_snapshot_writer(self, directory, interval):
+        """Write a snapshot every ``interval`` seconds from a daemon thread."""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write_snapshot(directory)
+                except OSError as e:
+                    print(f"⚠️ Could not write metrics snapshot: {e}")
+
+        threading.Thread(target=run, name='metrics-snapshot', daemon=True).start()
+
+    def render(self, families=None):
+        """All metrics (or the given families) in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for name, kind, documentation, samples in (self.collect() if families is None else families):
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+def write_snapshot_file(path, families):
+    # Write then rename, so a concurrent scrape never reads half a file
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(families, f)
+    os.replace(temporary, path)
+
+def read_snapshots(directory):
+    """
+    Load every process snapshot in ``directory``.
+
+    Returns:
+        list: One list of metric families per snapshot
+    """
+    snapshots = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            # The process exited and was retired between listing and reading
+            continue
+    return snapshots
+
+def merge_snapshots(snapshots):
+    """
+    Combine several processes' metric families into one set.
+
+    Samples with the same name and labels are summed, except quantile
+    gauges, where the largest value across processes is kept.
+
+    Returns:
+        list: Merged ``(name, type, help, samples)`` families
+    """
+    families = {}
+    for snapshot in snapshots:
+        for name, kind, documentation, samples in snapshot:
+            merged = families.setdefault(name, (kind, documentation, {}))[2]
+            for sample_name, labels, value in samples:
+                key = (sample_name, tuple(sorted((str(k), str(v)) for k, v in labels.items())))
+                if key not in merged:
+                    merged[key] = (labels, value)
+                elif kind == 'gauge' and 'quantile' in labels:
+                    merged[key] = (labels, max(merged[key][1], value))
+                else:
+                    merged[key] = (labels, merged[key][1] + value)
+    return [(name, kind, documentation, [(key[0], labels, value) for key, (labels, value) in merged.items()])
+            for name, (kind, documentation, merged) in families.items()]
+
+# Counters and histograms of workers that have exited
+RETIRED_SNAPSHOT = 'retired.json'
+
+def retire_snapshot(directory, pid):
+    """Fold an exited process's counters and histograms into the retired snapshot and remove its file."""
+    path = os.path.join(directory, f"{pid}.json")
+    retired_path = os.path.join(directory, RETIRED_SNAPSHOT)
+    try:
+        with open(path, encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return
+    snapshots = [[family for family in snapshot if family[1] != 'gauge']]
+    if os.path.exists(retired_path):
+        with open(retired_path, encoding='utf-8') as f:
+            snapshots.insert(0, json.load(f))
+    write_snapshot_file(retired_path, merge_snapshots(snapshots))
+    os.unlink(path)
+
+# Content type Prometheus expects from a text-format scrape
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+metrics = MetricsRegistry(enabled=os.environ.get('AGROVIA_METRICS', '1') != '0')
+
+# Shared snapshot directory, set by serve.py for its workers
+METRICS_DIR = os.environ.get('AGROVIA_METRICS_DIR')
+METRICS_SNAPSHOT_INTERVAL = float(os.environ.get('AGROVIA_METRICS_SNAPSHOT_INTERVAL', '5'))
+
+def render_all():
+    """
+    The ``/metrics`` body: this process's metrics, or under serve.py the
+    sum over every worker's latest snapshot.
+
+    Returns:
+        str: Prometheus text exposition
+    """
+    if METRICS_DIR is None:
+        return metrics.render()
+    metrics.write_snapshot(METRICS_DIR)
+    return metrics.render(merge_snapshots(read_snapshots(METRICS_DIR)))
+
+stage_seconds = metrics.histogram(
+    'agrovia_stage_duration_seconds',
+    'Time spent in each stage of serving a recommendation', ['stage'])
+http_request_seconds = metrics.histogram(
+    'agrovia_http_request_duration_seconds',
+    'Time from receiving an HTTP request to returning its response', ['endpoint', 'method'])
+http_requests = metrics.counter(
+    'agrovia_http_requests',
+    'HTTP requests served, by endpoint and status code', ['endpoint', 'method', 'status'])
+mock_fallbacks = metrics.counter(
+    'agrovia_mock_fallbacks',
+    'Recommendations answered with mock data instead of the models', ['reason'])
+encoding_failures = metrics.counter(
+    'agrovia_encoding_failures',
+    'Farm inputs that could not be converted into model features', ['reason'])
+lookup_table_lookups = metrics.counter(
+    'agrovia_lookup_table_lookups',
+    'Requests checked against the precomputed lookup table, by result', ['result'])
+shed_requests = metrics.counter(
+    'agrovia_shed_requests',
+    'Requests turned away by admission control, by endpoint and reason', ['endpoint', 'reason'])
+degraded_responses = metrics.counter(
+    'agrovia_degraded_responses',
+    'Requests answered without the models because the service was overloaded', ['endpoint'])
+exceptions = metrics.counter(
+    'agrovia_exceptions',
+    'Exceptions caught while serving requests', ['where'])
+
+# Stage timers are looked up once; a span is then one perf_counter pair
+_stage_series = {}
+
+def stage_span(stage):
+    """Time a stage of the request path: ``with stage_span('encode'): ...``"""
+    series = _stage_series.get(stage)
+    if series is None:
+        series = _stage_series.setdefault(stage, stage_seconds.labels(stage))
+    return series.time()
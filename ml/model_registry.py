@@ -0,0 +1,367 @@
+"""
+Versioned model bundles with lazy loading and hot reload.
+
+A bundle is the set of trained models plus label encoders produced by one
+training run. Bundles live in ``models/<version>/`` and the ``models/CURRENT``
+file names the version to serve. Trees that still have the flat
+``*.pkl`` files next to this module are served as a single legacy bundle.
+
+Requests take a reference to the current bundle once and use it until they
+finish, so swapping to a new bundle never affects requests in flight.
+
+Bundles may also carry the compiled forests under ``compiled/`` as plain
+``.npy`` arrays. With the 'compiled' engine those are memory-mapped instead
+of unpickling the sklearn models, so every worker process on a host shares
+one page-cache copy of the trees.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+import joblib
+
+from .encoding import CategoryEncoder
+from .forest_engine import (ForestPredictor, compact_forest, compile_forest, load_compiled_forest,
+                            save_compiled_forest)
+
+# Artifact file names inside a bundle directory
+MODEL_FILES = {
+    'crop_model': 'crop_recommendation_model.pkl',
+    'yield_model': 'yield_prediction_model.pkl',
+    'harvest_model': 'harvest_time_model.pkl',
+    'label_encoders': 'label_encoders.pkl'
+}
+
+# Pointer file naming the bundle version to serve
+CURRENT_FILE = 'CURRENT'
+
+# Directory of a bundle holding the memory-mappable compiled forests
+COMPILED_DIR = 'compiled'
+
+# Models that have a compiled form, by MODEL_FILES key
+FOREST_MODELS = ('crop_model', 'yield_model', 'harvest_model')
+
+class ModelLoadError(Exception):
+    """Raised when a model bundle cannot be resolved or loaded."""
+
+class ModelBundle:
+    """
+    One loaded, read-only set of models and encoders.
+
+    With the 'compiled' engine each forest is also flattened for the
+    framework-free inference engine; the ``*_predictor`` attributes are what
+    the request path calls either way. When the compiled forests were loaded
+    from memory-mapped artifacts the sklearn models are not loaded at all and
+    the ``*_model`` attributes are None.
+    """
+
+    def __init__(self, version, path, crop_model, yield_model, harvest_model, label_encoders,
+                 engine='compiled', max_compiled_rows=1000, compiled_forests=None):
+        compiled_forests = compiled_forests or {}
+        self.version = version
+        self.path = path
+        self.crop_model = crop_model
+        self.yield_model = yield_model
+        self.harvest_model = harvest_model
+        self.label_encoders = label_encoders
+        self.category_encoder = CategoryEncoder(label_encoders)
+        self.engine = engine
+        self.memory_mapped = bool(compiled_forests)
+        self.crop_predictor = _make_predictor(crop_model, engine, max_compiled_rows, compiled_forests.get('crop_model'))
+        self.yield_predictor = _make_predictor(yield_model, engine, max_compiled_rows, compiled_forests.get('yield_model'))
+        self.harvest_predictor = _make_predictor(harvest_model, engine, max_compiled_rows, compiled_forests.get('harvest_model'))
+        self.loaded_at = datetime.now()
+
+    def describe(self):
+        """Summary of the bundle for status endpoints."""
+        return {
+            'version': self.version,
+            'path': self.path,
+            'engine': self.engine,
+            'memory_mapped': self.memory_mapped,
+            'loaded_at': self.loaded_at.isoformat(timespec='seconds'),
+            'unknown_categories': self.category_encoder.stats()
+        }
+
+def _make_predictor(model, engine, max_compiled_rows, compiled=None):
+    """Wrap a model for the request path, compiling it when the engine allows."""
+    if compiled is not None:
+        return ForestPredictor(model, compiled, max_compiled_rows)
+    if engine != 'compiled':
+        return ForestPredictor(model)
+    try:
+        return ForestPredictor(model, compile_forest(model), max_compiled_rows)
+    except Exception as e:
+        print(f"Could not compile {type(model).__name__}, using sklearn inference: {e}")
+        return ForestPredictor(model)
+
+def has_compiled_artifacts(path):
+    """True if a bundle directory holds compiled forests for every model."""
+    return all(os.path.isdir(os.path.join(path, COMPILED_DIR, name)) for name in FOREST_MODELS)
+
+def load_bundle(path, version, engine='compiled', max_compiled_rows=1000, mmap=True):
+    """
+    Load every artifact of a bundle directory into a ModelBundle.
+
+    With the 'compiled' engine and ``mmap``, bundles that carry compiled
+    artifacts are memory-mapped and their sklearn pickles are skipped.
+    """
+    use_mmap = engine == 'compiled' and mmap and has_compiled_artifacts(path)
+    try:
+        if use_mmap:
+            artifacts = {name: None for name in FOREST_MODELS}
+            artifacts['label_encoders'] = joblib.load(os.path.join(path, MODEL_FILES['label_encoders']))
+            compiled_forests = {
+                name: load_compiled_forest(os.path.join(path, COMPILED_DIR, name), mmap=True)
+                for name in FOREST_MODELS
+            }
+        else:
+            artifacts = {
+                name: joblib.load(os.path.join(path, file_name))
+                for name, file_name in MODEL_FILES.items()
+            }
+            compiled_forests = None
+    except Exception as e:
+        raise ModelLoadError(f"Could not load model bundle '{version}' from {path}: {e}") from e
+
+    return ModelBundle(version, path, engine=engine, max_compiled_rows=max_compiled_rows,
+                       compiled_forests=compiled_forests, **artifacts)
+
+def export_compiled_model(bundle_dir, name, model, compact=False):
+    """
+    Write the memory-mappable compiled form of one bundle model.
+
+    Returns:
+        CompiledForest: The forest that was written
+    """
+    forest = compile_forest(model)
+    if compact:
+        forest = compact_forest(forest)
+    save_compiled_forest(forest, os.path.join(bundle_dir, COMPILED_DIR, name))
+    return forest
+
+def new_version_name():
+    """Timestamp-based version name for a freshly trained bundle."""
+    return datetime.now().strftime('%Y%m%d-%H%M%S')
+
+def save_bundle(models_dir, crop_model, yield_model, harvest_model, label_encoders,
+                version=None, make_current=True, compiled=True, compact=False):
+    """
+    Write a new versioned bundle and, optionally, point CURRENT at it.
+
+    With ``compiled`` the memory-mappable compiled forests are written too,
+    shrunk by compact_forest when ``compact`` is set.
+
+    The bundle directory is fully written before CURRENT is replaced, so a
+    watcher never sees a half-written bundle.
+
+    Returns:
+        str: The version name of the saved bundle
+    """
+    version = version or new_version_name()
+    bundle_dir = os.path.join(models_dir, version)
+    os.makedirs(bundle_dir, exist_ok=True)
+
+    artifacts = {
+        'crop_model': crop_model,
+        'yield_model': yield_model,
+        'harvest_model': harvest_model,
+        'label_encoders': label_encoders
+    }
+    for name, file_name in MODEL_FILES.items():
+        joblib.dump(artifacts[name], os.path.join(bundle_dir, file_name))
+    if compiled:
+        for name in FOREST_MODELS:
+            export_compiled_model(bundle_dir, name, artifacts[name], compact=compact)
+
+    if make_current:
+        set_current_version(models_dir, version)
+
+    return version
+
+def set_current_version(models_dir, version):
+    """Atomically point the CURRENT file at an existing bundle version."""
+    if not os.path.isdir(os.path.join(models_dir, version)):
+        raise ModelLoadError(f"Model bundle '{version}' does not exist in {models_dir}")
+
+    temp_path = os.path.join(models_dir, f"{CURRENT_FILE}.tmp")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(version + '\n')
+    os.replace(temp_path, os.path.join(models_dir, CURRENT_FILE))
+
+class ModelRegistry:
+    """
+    Serves the current model bundle, loading it lazily and swapping it
+    atomically on reload.
+    """
+
+    def __init__(self, base_dir, models_dir=None, retry_interval=30.0,
+                 engine='compiled', max_compiled_rows=1000, mmap=True, on_load=None):
+        self.base_dir = base_dir
+        self.models_dir = models_dir or os.path.join(base_dir, 'models')
+        self.retry_interval = retry_interval
+        self.engine = engine
+        self.max_compiled_rows = max_compiled_rows
+        self.mmap = mmap
+        # Called with each freshly loaded bundle before it starts serving,
+        # to precompute anything derived from the models
+        self.on_load = on_load
+
+        self._bundle = None
+        self._last_error = None
+        self._last_attempt = 0.0
+        # Serializes loads; readers never take this lock once a bundle exists
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        # Version an admin switched to explicitly; the watcher leaves it in
+        # place until a reload without a version
+        self._pinned_version = None
+
+    def resolve(self, version=None):
+        """
+        Work out which bundle version should be served and where it lives.
+
+        Returns:
+            tuple: (version, bundle directory)
+        """
+        if version is None:
+            current_path = os.path.join(self.models_dir, CURRENT_FILE)
+            if os.path.exists(current_path):
+                with open(current_path, 'r', encoding='utf-8') as f:
+                    version = f.read().strip()
+
+        if version:
+            # Versions are plain directory names; refuse anything path-like
+            if os.path.basename(version) != version or version.startswith('.'):
+                raise ModelLoadError(f"Invalid model bundle version '{version}'")
+            path = os.path.join(self.models_dir, version)
+            if not os.path.isdir(path):
+                raise ModelLoadError(f"Model bundle '{version}' does not exist in {self.models_dir}")
+            return version, path
+
+        # Legacy layout: flat files next to this module, versioned by mtime
+        legacy_files = [os.path.join(self.base_dir, file_name) for file_name in MODEL_FILES.values()]
+        missing = [path for path in legacy_files if not os.path.exists(path)]
+        if missing:
+            raise ModelLoadError(f"No model bundle found (missing {', '.join(os.path.basename(p) for p in missing)})")
+        modified = max(os.path.getmtime(path) for path in legacy_files)
+        return f"legacy-{datetime.fromtimestamp(modified).strftime('%Y%m%d-%H%M%S')}", self.base_dir
+
+    def get(self):
+        """
+        Return the current bundle, loading it on first use.
+
+        Returns None when no bundle can be loaded; the load is retried at most
+        once per ``retry_interval`` seconds so a missing model does not slow
+        every request down.
+        """
+        bundle = self._bundle
+        if bundle is not None:
+            return bundle
+
+        with self._reload_lock:
+            if self._bundle is None and self._retry_due():
+                try:
+                    self._load_locked()
+                except ModelLoadError as e:
+                    print(f"Error loading models: {e}")
+        return self._bundle
+
+    def _retry_due(self):
+        return not self._last_error or time.monotonic() - self._last_attempt >= self.retry_interval
+
+    def reload(self, version=None):
+        """
+        Load a bundle and make it current without interrupting requests.
+
+        The previous bundle stays current if loading fails. An explicit
+        ``version`` is pinned: ``check_for_update`` will not switch away from
+        it until the next reload without a version, which follows CURRENT again.
+
+        Returns:
+            ModelBundle: The newly loaded bundle
+        """
+        with self._reload_lock:
+            bundle = self._load_locked(version)
+            self._pinned_version = version
+            return bundle
+
+    def _load_locked(self, version=None):
+        self._last_attempt = time.monotonic()
+        try:
+            version, path = self.resolve(version)
+            bundle = load_bundle(path, version, self.engine, self.max_compiled_rows, self.mmap)
+            if self.on_load is not None:
+                try:
+                    self.on_load(bundle)
+                except Exception as e:
+                    raise ModelLoadError(f"Could not prepare model bundle '{version}': {e}") from e
+        except ModelLoadError as e:
+            self._last_error = str(e)
+            raise
+
+        # A single reference assignment is the atomic swap
+        self._bundle = bundle
+        self._last_error = None
+        print(f"✓ Model bundle {version} loaded successfully")
+        return bundle
+
+    def check_for_update(self):
+        """
+        Reload if the bundle that should be served differs from the loaded one.
+
+        Does nothing while an explicitly requested version is pinned.
+
+        Returns:
+            bool: True if a new bundle was loaded
+        """
+        if self._pinned_version is not None:
+            return False
+        try:
+            version, _ = self.resolve()
+        except ModelLoadError:
+            return False
+
+        bundle = self._bundle
+        if bundle is not None and bundle.version == version:
+            return False
+
+        with self._reload_lock:
+            # An admin may have pinned a version while CURRENT was resolved
+            if self._pinned_version is not None:
+                return False
+            try:
+                self._load_locked(version)
+            except ModelLoadError as e:
+                print(f"Error reloading models: {e}")
+                return False
+        return True
+
+    def start_watcher(self, interval=10.0):
+        """
+        Poll for a new CURRENT version (or updated legacy files) in a
+        background thread and hot-swap to it.
+        """
+        if self._watcher is not None and self._watcher.is_alive():
+            return self._watcher
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                self.check_for_update()
+
+        self._watcher = threading.Thread(target=watch, name='model-registry-watcher', daemon=True)
+        self._watcher.start()
+        return self._watcher
+
+    def status(self):
+        """Summary of the registry state for status endpoints."""
+        bundle = self._bundle
+        return {
+            'current': bundle.describe() if bundle else None,
+            'last_error': self._last_error,
+            'pinned_version': self._pinned_version,
+            'models_dir': self.models_dir
+        }
@@ -0,0 +1,166 @@
+"""
+Opt-in cProfile capture of individual requests.
+
+Profiling is armed from the admin endpoints, for the next N requests and/or
+a random fraction of traffic, or asked for per request with a header. Each
+captured request is written to the profile directory as a ``.prof`` file
+(loadable with ``pstats`` or snakeviz) next to a ``.json`` file holding the
+request inputs, timing and the top functions by cumulative time.
+
+While nothing is armed the request path only reads one attribute.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from datetime import datetime
+
+# Profile names are generated here; anything else is refused on download
+PROFILE_NAME_PATTERN = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9]{6}-[a-z_]+$')
+
+class RequestProfiler:
+    """
+    Decides which requests to profile and stores their profiles.
+
+    Only one request is profiled at a time (cProfile cannot nest); requests
+    arriving meanwhile run unprofiled and do not use up the armed count.
+    """
+
+    def __init__(self, output_dir, max_profiles=200, top_functions=25):
+        self.output_dir = output_dir
+        self.max_profiles = max_profiles
+        self.top_functions = top_functions
+
+        self.remaining = 0
+        self.sample_rate = 0.0
+        # The only thing the request path reads while profiling is off
+        self.active = False
+
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()
+
+    def enable(self, count=None, sample_rate=None):
+        """Profile the next ``count`` requests and/or a ``sample_rate`` fraction of requests."""
+        with self._lock:
+            if count is not None:
+                self.remaining = max(0, int(count))
+            if sample_rate is not None:
+                self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+            self.active = self.remaining > 0 or self.sample_rate > 0
+
+    def disable(self):
+        self.enable(count=0, sample_rate=0.0)
+
+    def _claim(self, requested):
+        """Decide whether this request is profiled, consuming the armed count."""
+        with self._lock:
+            if requested:
+                return True
+            if self.remaining > 0:
+                self.remaining -= 1
+                self.active = self.remaining > 0 or self.sample_rate > 0
+                return True
+            return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def run(self, endpoint, inputs, func, *args, requested=False, **kwargs):
+        """
+        Call ``func``, profiling it if this request was selected.
+
+        Returns:
+            tuple: (func's return value, saved profile name or None)
+        """
+        if not self._busy.acquire(blocking=False):
+            return func(*args, **kwargs), None
+        try:
+            if not self._claim(requested):
+                return func(*args, **kwargs), None
+
+            profile = cProfile.Profile()
+            started = time.perf_counter()
+            profile.enable()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                profile.disable()
+                elapsed = time.perf_counter() - started
+            return result, self._save(endpoint, inputs, profile, elapsed)
+        finally:
+            self._busy.release()
+
+    def _save(self, endpoint, inputs, profile, elapsed):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            slug = re.sub(r'[^a-z]+', '_', endpoint.lower()).strip('_') or 'request'
+            name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{slug}"
+            profile.dump_stats(os.path.join(self.output_dir, f"{name}.prof"))
+
+            summary = io.StringIO()
+            pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(self.top_functions)
+            with open(os.path.join(self.output_dir, f"{name}.json"), 'w', encoding='utf-8') as f:
+                json.dump({
+                    'name': name,
+                    'endpoint': endpoint,
+                    'created_at': datetime.now().isoformat(timespec='seconds'),
+                    'duration_ms': round(elapsed * 1000, 3),
+                    'inputs': inputs,
+                    'top_functions': summary.getvalue()
+                }, f, indent=2, default=str)
+            self._prune()
+            return name
+        except OSError as e:
+            print(f"Could not save request profile: {e}")
+            return None
+
+    def _prune(self):
+        # Keep the newest profiles; names sort by creation time
+        names = sorted(self._names())
+        for name in names[:max(0, len(names) - self.max_profiles)]:
+            for extension in ('.prof', '.json'):
+                try:
+                    os.remove(os.path.join(self.output_dir, name + extension))
+                except FileNotFoundError:
+                    pass
+
+    def _names(self):
+        if not os.path.isdir(self.output_dir):
+            return []
+        return [
+            file_name[:-len('.json')] for file_name in os.listdir(self.output_dir)
+            if file_name.endswith('.json') and PROFILE_NAME_PATTERN.match(file_name[:-len('.json')])
+        ]
+
+    def list_profiles(self):
+        """Metadata of the saved profiles, newest first (without the function summaries)."""
+        profiles = []
+        for name in sorted(self._names(), reverse=True):
+            try:
+                with open(os.path.join(self.output_dir, f"{name}.json"), 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            meta.pop('top_functions', None)
+            profiles.append(meta)
+        return profiles
+
+    def profile_path(self, name, extension='.prof'):
+        """Path of a saved profile file, or None for unknown or malformed names."""
+        if not PROFILE_NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self.output_dir, name + extension)
+        return path if os.path.exists(path) else None
+
+    def status(self):
+        with self._lock:
+            return {
+                'active': self.active,
+                'remaining': self.remaining,
+                'sample_rate': self.sample_rate,
+                'output_dir': self.output_dir,
+                'saved_profiles': len(self._names())
+            }
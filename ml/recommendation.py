@@ -2,33 +2,79 @@
 This module contains the crop recommendation logic using trained machine learning models.
 """
 
-import joblib
-import pandas as pd
 import numpy as np
 import os
-from .data_analyzer import analyze_crop_data, get_data_driven_optimal_conditions, get_yield_benchmark, get_farming_recommendations, evaluate_user_conditions
+import threading
+from .data_analyzer import load_crop_insights, get_data_driven_optimal_conditions, get_yield_benchmark, get_farming_recommendations
+from .batcher import MicroBatcher
+from .encoding import CategoryEncoder, FALLBACK_CODE
+from .forest_engine import tree_spread
+from .farm_index import load_farm_index
+from .lookup_table import load_lookup_table
+from .metrics import encoding_failures, exceptions, lookup_table_lookups, metrics, mock_fallbacks, stage_span
+from .model_registry import ModelLoadError, ModelRegistry
+from .response_cache import RecommendationCache
 
-# Load trained models and encoders
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
-# Load crop insights from actual data
-print("Analyzing crop data for insights...")
-crop_insights = analyze_crop_data(os.path.join(current_dir, 'crop_yield.csv'))
-print(f"✓ Analyzed data for {len(crop_insights)} crops")
-
-try:
-    crop_model = joblib.load(os.path.join(current_dir, 'crop_recommendation_model.pkl'))
-    yield_model = joblib.load(os.path.join(current_dir, 'yield_prediction_model.pkl'))
-    harvest_model = joblib.load(os.path.join(current_dir, 'harvest_time_model.pkl'))
-    label_encoders = joblib.load(os.path.join(current_dir, 'label_encoders.pkl'))
-    print("✓ All ML models loaded successfully")
-except Exception as e:
-    print(f"Error loading models: {e}")
-    # Fallback to None if models don't exist
-    crop_model = None
-    yield_model = None
-    harvest_model = None
-    label_encoders = None
+# Load crop insights from the precomputed artifact (rebuilt only if the CSV changed)
+crop_insights = load_crop_insights(os.path.join(current_dir, 'crop_yield.csv'))
+print(f"✓ Loaded data insights for {len(crop_insights)} crops")
+
+# Inference engine: 'compiled' (flattened forests, bit-identical and much
+# faster for small inputs) or 'sklearn'
+INFERENCE_ENGINE = os.environ.get('AGROVIA_INFERENCE_ENGINE', 'compiled')
+
+# Above this many rows the compiled engine hands batches to sklearn
+COMPILED_MAX_ROWS = int(os.environ.get('AGROVIA_COMPILED_MAX_ROWS', '1000'))
+
+# Memory-map compiled model artifacts when a bundle has them, so worker
+# processes share one copy of the trees (sklearn pickles are then not loaded
+# and large batches also run on the compiled engine)
+MMAP_MODELS = os.environ.get('AGROVIA_MMAP_MODELS', '1') != '0'
+
+# Answer inputs on the grid of a bundle's precomputed lookup table (built
+# with lookup_table.py) from the table instead of running the models.
+# 'exact' only matches rainfall and temperature on grid points; 'nearest'
+# snaps every in-range input (see the table's deviation report first)
+LOOKUP_TABLE = os.environ.get('AGROVIA_LOOKUP_TABLE', '1') != '0'
+LOOKUP_SNAP = os.environ.get('AGROVIA_LOOKUP_SNAP', 'exact')
+
+# Trained models and encoders are loaded lazily, on first use, by the registry
+model_registry = ModelRegistry(current_dir, engine=INFERENCE_ENGINE, max_compiled_rows=COMPILED_MAX_ROWS,
+                               mmap=MMAP_MODELS)
+
+# Response cache for repeated inputs (AGROVIA_CACHE_SIZE=0 disables it)
+recommendation_cache = RecommendationCache(
+    max_entries=int(os.environ.get('AGROVIA_CACHE_SIZE', '10000')),
+    ttl_seconds=float(os.environ.get('AGROVIA_CACHE_TTL', '3600')),
+    rainfall_precision=int(os.environ.get('AGROVIA_CACHE_RAINFALL_PRECISION', '0')),
+    temperature_precision=int(os.environ.get('AGROVIA_CACHE_TEMPERATURE_PRECISION', '1'))
+)
+
+# Coalesce concurrent single-farm requests into one model call per forest
+# (AGROVIA_BATCH_MAX_SIZE of 1 or less disables it)
+request_batcher = MicroBatcher(
+    lambda bundle, feature_rows: predict_feature_rows(bundle, feature_rows),
+    max_batch_size=int(os.environ.get('AGROVIA_BATCH_MAX_SIZE', '1')),
+    max_wait_ms=float(os.environ.get('AGROVIA_BATCH_MAX_WAIT_MS', '2'))
+)
+
+# Largest rainfall x temperature grid a single surface request may ask for
+SURFACE_MAX_POINTS = int(os.environ.get('AGROVIA_SURFACE_MAX_POINTS', '10000'))
+
+# Quantiles of the per-tree yield and harvest predictions reported when a
+# request asks for prediction intervals, e.g. '0.05,0.5,0.95'
+PREDICTION_QUANTILES = tuple(float(value) for value in os.environ.get('AGROVIA_PREDICTION_QUANTILES', '0.1,0.9').split(','))
+
+# Most neighbours a /similar-farms request may ask for
+SIMILAR_FARMS_MAX_K = int(os.environ.get('AGROVIA_SIMILAR_FARMS_MAX_K', '50'))
+
+# Feature columns in the order the models were trained on
+FEATURE_COLUMNS = ['Region', 'Soil_Type', 'Rainfall_mm', 'Temperature_Celsius', 'Fertilizer_Used', 'Irrigation_Used', 'Weather_Condition']
+
+# Yield and harvest models also take the candidate crop as a feature
+CROP_FEATURE_COLUMNS = FEATURE_COLUMNS + ['Crop']
 
 # Crop database for additional information
 crop_database = {
@@ -85,45 +131,11 @@ crop_database = {
 def encode_input_data(region, soil_type, weather_condition, label_encoders):
     """
     Encode categorical input data using the trained label encoders.
+
+    Builds the lookup tables on every call; the request path uses the
+    bundle's precomputed ``category_encoder`` instead.
     """
-    try:
-        # Map region names to match training data
-        region_mapping = {
-            'North': 'Northern',
-            'South': 'Southern', 
-            'East': 'Eastern',
-            'West': 'Western'
-        }
-        region = region_mapping.get(region, region)
-        
-        # Map soil types to match training data
-        soil_mapping = {
-            'Clay': 'Clay',
-            'Sandy': 'Sandy',
-            'Loam': 'Loamy',
-            'Silt': 'Silty',
-            'Peaty': 'Peaty',
-            'Chalky': 'Chalky'
-        }
-        soil_type = soil_mapping.get(soil_type, soil_type)
-        
-        # Map weather conditions
-        weather_mapping = {
-            'Sunny': 'Sunny',
-            'Rainy': 'Rainy',
-            'Cloudy': 'Cloudy'
-        }
-        weather_condition = weather_mapping.get(weather_condition, weather_condition)
-        
-        encoded_region = label_encoders['Region'].transform([region])[0]
-        encoded_soil = label_encoders['Soil_Type'].transform([soil_type])[0]
-        encoded_weather = label_encoders['Weather_Condition'].transform([weather_condition])[0]
-        
-        return encoded_region, encoded_soil, encoded_weather
-    except Exception as e:
-        print(f"Encoding error: {e}")
-        # Return default values if encoding fails
-        return 0, 0, 0
+    return CategoryEncoder(label_encoders).encode_row(region, soil_type, weather_condition)
 
 def get_optimal_rainfall_range(crop_name):
     """Get optimal rainfall range for a specific crop from actual data."""
@@ -176,9 +188,369 @@ def get_growth_stage(days_to_harvest):
     else:
         return "Extended season crop"
 
+def prepare_input_features(bundle, region, soil_type, rainfall, temperature,
+                           fertilizer_used, irrigation_used,
+                           weather_condition, days_to_harvest, encode_categories=True):
+    """
+    Validate raw request inputs and convert them into a model feature row.
+
+    With ``encode_categories=False`` the Region, Soil_Type and
+    Weather_Condition entries are left as None for the caller to fill in,
+    as the batch path does a whole column at a time.
+
+    Returns:
+        tuple: (feature row dict, rainfall, temperature, fertilizer flag, irrigation flag)
+    """
+    # Convert and validate input parameters
+    rainfall = float(rainfall) if rainfall else 0
+    temperature = float(temperature) if temperature else 0
+    days_to_harvest = int(days_to_harvest) if days_to_harvest else 90
+
+    # Convert string boolean inputs to numeric
+    fertilizer_numeric = 1 if fertilizer_used.lower() == 'true' else 0
+    irrigation_numeric = 1 if irrigation_used.lower() == 'true' else 0
+
+    # Encode categorical features with the bundle's precomputed lookup tables
+    if encode_categories:
+        encoded_region, encoded_soil, encoded_weather = bundle.category_encoder.encode_row(
+            region, soil_type, weather_condition
+        )
+    else:
+        encoded_region = encoded_soil = encoded_weather = None
+
+    features = {
+        'Region': encoded_region,
+        'Soil_Type': encoded_soil,
+        'Rainfall_mm': rainfall,
+        'Temperature_Celsius': temperature,
+        'Fertilizer_Used': fertilizer_numeric,
+        'Irrigation_Used': irrigation_numeric,
+        'Weather_Condition': encoded_weather
+    }
+
+    return features, rainfall, temperature, fertilizer_numeric, irrigation_numeric
+
+def encode_request(bundle, region, soil_type, rainfall, temperature,
+                   fertilizer_used, irrigation_used, weather_condition, days_to_harvest,
+                   encode_categories=True):
+    """prepare_input_features, counting inputs that cannot be encoded."""
+    try:
+        return prepare_input_features(
+            bundle, region, soil_type, rainfall, temperature,
+            fertilizer_used, irrigation_used, weather_condition, days_to_harvest,
+            encode_categories
+        )
+    except (ValueError, TypeError, AttributeError):
+        encoding_failures.labels('invalid_input').inc()
+        raise
+
+def select_candidate_crops(bundle, crop_probabilities, top_k=3, min_confidence=5):
+    """
+    Pick the top crops from the classifier probabilities for a single farm.
+
+    Returns:
+        list: (crop name, confidence percentage) tuples, best first
+    """
+    crop_classes = bundle.crop_predictor.classes_
+
+    # Get top 3 crop recommendations
+    top_indices = np.argsort(crop_probabilities)[-top_k:][::-1]
+    candidates = []
+
+    for idx in top_indices:
+        confidence = crop_probabilities[idx] * 100
+
+        # Skip if confidence is too low
+        if confidence < min_confidence:  # Lowered threshold to show more results
+            continue
+
+        candidates.append((crop_classes[idx], confidence))
+
+    return candidates
+
+def encode_crop(bundle, crop_name):
+    """Encode a crop name for the crop-conditioned yield and harvest models."""
+    # Bundles trained before the crop became a feature have no crop table
+    if 'Crop' not in bundle.category_encoder.tables:
+        return FALLBACK_CODE
+    return bundle.category_encoder.encode('Crop', crop_name)
+
+def encode_crops(bundle, crop_names):
+    """encode_crop for many crop names in one pass."""
+    if 'Crop' not in bundle.category_encoder.tables:
+        return np.full(len(crop_names), FALLBACK_CODE, dtype=np.int64)
+    return bundle.category_encoder.encode_batch('Crop', crop_names)
+
+def feature_vector(features, columns=FEATURE_COLUMNS):
+    """Order a feature row dict into a list matching the model's columns."""
+    return [features[column] for column in columns]
+
+def model_feature_columns(model):
+    """Return the feature columns a regressor was trained on."""
+    if 'Crop' in getattr(model, 'feature_names_in_', ()):
+        return CROP_FEATURE_COLUMNS
+    return FEATURE_COLUMNS
+
+def quantile_label(quantile):
+    """Response key of a quantile: 0.1 -> 'p10', 0.025 -> 'p2.5'."""
+    return f"p{quantile * 100:g}"
+
+def prediction_interval(mean, std, quantile_values, quantiles, digits):
+    """One prediction's mean, per-tree spread and quantiles, rounded for the response."""
+    return {
+        'mean': round(float(mean), digits),
+        'std': round(float(std), digits),
+        'quantiles': {quantile_label(quantile): round(float(value), digits)
+                      for quantile, value in zip(quantiles, quantile_values)}
+    }
+
+def predict_candidate_outcomes(bundle, feature_rows, candidates_per_row, quantiles=None):
+    """
+    Predict yield and harvest time for every (farm, candidate crop) pair.
+
+    All pairs are stacked into one (candidates x features) matrix so each
+    regressor runs exactly once, however many farms and candidates there are.
+    Models trained before the crop became a feature are still supported;
+    they simply give every candidate of a farm the same numbers.
+
+    With ``quantiles`` the same single pass also keeps every tree's output,
+    and each candidate gets a prediction interval for yield and harvest days
+    (mean, spread across trees and the requested quantiles).
+
+    Returns:
+        tuple: (yields per farm, harvest times per farm, intervals per farm),
+            each a list of lists; intervals are None without ``quantiles``
+    """
+    candidate_rows = []
+    for features, candidates in zip(feature_rows, candidates_per_row):
+        for crop_name, _ in candidates:
+            candidate_rows.append(feature_vector(dict(features, Crop=encode_crop(bundle, crop_name)), CROP_FEATURE_COLUMNS))
+
+    if not candidate_rows:
+        return [[] for _ in feature_rows], [[] for _ in feature_rows], [None if quantiles is None else [] for _ in feature_rows]
+
+    # FEATURE_COLUMNS is a prefix of CROP_FEATURE_COLUMNS, so models trained
+    # without the crop just see the leading columns
+    candidate_matrix = np.array(candidate_rows, dtype=float)
+    yield_predictor, harvest_predictor = bundle.yield_predictor, bundle.harvest_predictor
+    yield_matrix = candidate_matrix[:, :len(model_feature_columns(yield_predictor))]
+    harvest_matrix = candidate_matrix[:, :len(model_feature_columns(harvest_predictor))]
+    intervals = None
+    if quantiles is None:
+        predicted_yields = yield_predictor.predict(yield_matrix)
+        predicted_harvest_times = harvest_predictor.predict(harvest_matrix)
+    else:
+        predicted_yields, yield_trees = yield_predictor.predict_with_trees(yield_matrix)
+        predicted_harvest_times, harvest_trees = harvest_predictor.predict_with_trees(harvest_matrix)
+        (yield_std, yield_quantiles), (harvest_std, harvest_quantiles) = (
+            tree_spread(yield_trees, quantiles), tree_spread(harvest_trees, quantiles))
+        intervals = [
+            {
+                'yield': prediction_interval(predicted_yields[i], yield_std[i], yield_quantiles[:, i], quantiles, 2),
+                'harvest_days': prediction_interval(predicted_harvest_times[i], harvest_std[i],
+                                                    harvest_quantiles[:, i], quantiles, 1)
+            }
+            for i in range(len(candidate_rows))
+        ]
+
+    # Split the flat predictions back into per-farm lists
+    yields_per_row, harvest_per_row, intervals_per_row = [], [], []
+    offset = 0
+    for candidates in candidates_per_row:
+        yields_per_row.append(predicted_yields[offset:offset + len(candidates)])
+        harvest_per_row.append(predicted_harvest_times[offset:offset + len(candidates)])
+        intervals_per_row.append(None if intervals is None else intervals[offset:offset + len(candidates)])
+        offset += len(candidates)
+
+    return yields_per_row, harvest_per_row, intervals_per_row
+
+def predict_feature_rows(bundle, feature_rows):
+    """
+    Run the models over encoded feature rows: one ``predict_proba`` over all
+    rows, then one call per regressor over every candidate crop.
+
+    Returns:
+        list: (candidates, predicted yields, predicted harvest times) per row
+    """
+    outputs, _ = predict_feature_rows_with_intervals(bundle, feature_rows, quantiles=None)
+    return outputs
+
+def predict_feature_rows_with_intervals(bundle, feature_rows, quantiles=PREDICTION_QUANTILES):
+    """
+    ``predict_feature_rows`` that also returns prediction intervals for every
+    candidate, computed from the same single pass over each regressor.
+
+    Returns:
+        tuple: (``predict_feature_rows`` outputs, intervals per row); the
+            intervals are None when ``quantiles`` is None
+    """
+    with stage_span('crop_model'):
+        input_data = np.array([feature_vector(features) for features in feature_rows], dtype=float)
+        crop_probabilities = bundle.crop_predictor.predict_proba(input_data)
+        candidates_per_row = [select_candidate_crops(bundle, probabilities) for probabilities in crop_probabilities]
+    with stage_span('yield_harvest_models'):
+        yields_per_row, harvest_per_row, intervals_per_row = predict_candidate_outcomes(
+            bundle, feature_rows, candidates_per_row, quantiles)
+    return list(zip(candidates_per_row, yields_per_row, harvest_per_row)), intervals_per_row
+
+def lookup_stored_outputs(bundle, features):
+    """
+    The lookup table's model outputs for a feature row, shaped like an entry
+    of ``predict_feature_rows``; None without a table or off its grid.
+    """
+    lookup_table = getattr(bundle, 'lookup_table', None)
+    if lookup_table is None:
+        return None
+    with stage_span('lookup_table'):
+        stored = lookup_table.lookup(features)
+    lookup_table_lookups.labels('miss' if stored is None else 'hit').inc()
+    return stored
+
+def build_crop_template(crop_name):
+    """
+    Precompute everything in a crop's recommendation that does not depend on
+    the request: catalog fields, formatted data insights and optimal ranges.
+    """
+    # Get crop details from database
+    crop_info = crop_database.get(crop_name.lower(), {
+        'name': crop_name.title(),
+        'type': 'Crop',
+        'season': 'Both seasons',
+        'image': 'https://via.placeholder.com/200x150/22c55e/ffffff?text=🌱',
+        'seedRequired': 'Contact local supplier',
+        'fertilizerNeeded': 'NPK fertilizer'
+    })
+
+    # Get yield benchmarks from actual data
+    yield_benchmark = get_yield_benchmark(crop_name, crop_insights)
+    farming_recommendations = get_farming_recommendations(crop_name, crop_insights)
+
+    # Data-driven optimal ranges the user's conditions are checked against
+    crop_data = crop_insights.get(crop_name.lower(), {})
+    if crop_data:
+        rainfall_bounds = (crop_data.get('optimal_rainfall_min', 0), crop_data.get('optimal_rainfall_max', 1000))
+        temperature_bounds = (crop_data.get('optimal_temp_min', 0), crop_data.get('optimal_temp_max', 50))
+        rainfall_range = f"{rainfall_bounds[0]}-{rainfall_bounds[1]}mm"
+        temperature_range = f"{temperature_bounds[0]}-{temperature_bounds[1]}°C"
+    else:
+        rainfall_bounds = temperature_bounds = None
+        rainfall_range = temperature_range = 'Unknown'
+
+    return {
+        'name': crop_info['name'],
+        'type': crop_info['type'],
+        'seedRequired': crop_info['seedRequired'],
+        'fertilizerNeeded': crop_info['fertilizerNeeded'],
+        'season': crop_info['season'],
+        'image': crop_info['image'],
+        'optimal_rainfall': get_optimal_rainfall_range(crop_name),
+        'optimal_temperature': get_optimal_temperature_range(crop_name),
+        'best_weather': get_best_weather_condition(crop_name),
+        'data_insights': {
+            'average_yield_benchmark': f"{yield_benchmark['average_yield']:.1f} tons/ha",
+            'maximum_yield_potential': f"{yield_benchmark['maximum_yield']:.1f} tons/ha",
+            'minimum_yield_recorded': f"{yield_benchmark['minimum_yield']:.1f} tons/ha",
+            'typical_harvest_time': f"{yield_benchmark['expected_harvest_days']:.0f} days",
+            'harvest_range': f"{yield_benchmark['min_harvest_days']:.0f}-{yield_benchmark['max_harvest_days']:.0f} days",
+            'fertilizer_success_rate': farming_recommendations['fertilizer_success_rate'],
+            'irrigation_success_rate': farming_recommendations['irrigation_success_rate'],
+            'best_soil_type': farming_recommendations['best_soil_type'],
+            'best_region': farming_recommendations['best_region'],
+            'data_samples': f"Based on {yield_benchmark['data_samples']} real farm records"
+        },
+        'rainfall_bounds': rainfall_bounds,
+        'temperature_bounds': temperature_bounds,
+        'rainfall_optimal_range': rainfall_range,
+        'temperature_optimal_range': temperature_range
+    }
+
+def build_crop_templates(crop_names):
+    """Build the static response template of every crop the models can predict."""
+    return {crop_name: build_crop_template(crop_name) for crop_name in crop_names}
+
+# Templates of every crop in the insights, for model-free degraded responses
+degraded_templates = build_crop_templates(list(crop_insights))
+
+def prepare_bundle(bundle):
+    """Precompute per-bundle request-path data when the registry loads a bundle."""
+    bundle.crop_templates = build_crop_templates(bundle.crop_predictor.classes_)
+    bundle.lookup_table = load_lookup_table(bundle.path, bundle.version, snap=LOOKUP_SNAP) if LOOKUP_TABLE else None
+    if bundle.lookup_table is not None:
+        print(f"✓ Lookup table with {len(bundle.lookup_table.crops)} grid points loaded")
+
+model_registry.on_load = prepare_bundle
+
+def condition_status(value, bounds):
+    """'Optimal' when value lies within the (min, max) bounds."""
+    if bounds is None:
+        return 'Unknown'
+    return 'Optimal' if bounds[0] <= value <= bounds[1] else 'Suboptimal'
+
+def render_recommendation(template, confidence, predicted_yield, predicted_harvest_time,
+                          rainfall, temperature, fertilizer_numeric, irrigation_numeric):
+    """
+    Fill a crop template with the request-dependent fields.
+    """
+    harvest_days = int(predicted_harvest_time)
+
+    return {
+        'name': template['name'],
+        'type': template['type'],
+        'suitabilityScore': round(confidence, 1),
+        'yield': f"{predicted_yield:.1f} tons/ha",
+        'seedRequired': template['seedRequired'],
+        'fertilizerNeeded': template['fertilizerNeeded'],
+        'season': template['season'],
+        'image': template['image'],
+        'predicted_harvest_time': harvest_days,
+        'expected_conditions': {
+            'optimal_rainfall': template['optimal_rainfall'],
+            'optimal_temperature': template['optimal_temperature'],
+            'best_weather': template['best_weather'],
+            'recommended_fertilizer': 'Yes' if fertilizer_numeric else 'Recommended',
+            'recommended_irrigation': 'Yes' if irrigation_numeric else 'Recommended'
+        },
+        'data_insights': dict(template['data_insights']),
+        'suitability_factors': {
+            'rainfall': condition_status(rainfall, template['rainfall_bounds']),
+            'temperature': condition_status(temperature, template['temperature_bounds']),
+            'rainfall_optimal_range': template['rainfall_optimal_range'],
+            'temperature_optimal_range': template['temperature_optimal_range']
+        },
+        'harvest_prediction': {
+            'expected_days': harvest_days,
+            'harvest_month': get_harvest_month(harvest_days),
+            'growth_stage': get_growth_stage(harvest_days)
+        }
+    }
+
+def build_recommendations(bundle, candidates, predicted_yields, predicted_harvest_times,
+                          rainfall, temperature, fertilizer_numeric, irrigation_numeric, intervals=None):
+    """
+    Turn the model outputs for a single farm into the recommendation payload.
+
+    ``intervals`` (one per candidate, from ``predict_candidate_outcomes``)
+    adds the optional ``prediction_intervals`` field.
+    """
+    templates = getattr(bundle, 'crop_templates', {})
+    recommendations = []
+
+    for position, ((crop_name, confidence), predicted_yield, predicted_harvest_time) in enumerate(zip(
+            candidates, predicted_yields, predicted_harvest_times)):
+        template = templates.get(crop_name) or build_crop_template(crop_name)
+        recommendation = render_recommendation(
+            template, confidence, predicted_yield, predicted_harvest_time,
+            rainfall, temperature, fertilizer_numeric, irrigation_numeric
+        )
+        if intervals is not None:
+            recommendation['prediction_intervals'] = intervals[position]
+        recommendations.append(recommendation)
+
+    return recommendations
+
 def get_crop_recommendations(region, soil_type, rainfall, temperature,
                            fertilizer_used, irrigation_used,
-                           weather_condition, days_to_harvest):
+                           weather_condition, days_to_harvest, bundle=None, prediction_intervals=False):
     """
     Get crop recommendations based on input parameters using trained ML models.
     
@@ -191,132 +563,435 @@ def get_crop_recommendations(region, soil_type, rainfall, temperature,
         irrigation_used (str): Type of irrigation
         weather_condition (str): Current weather conditions
         days_to_harvest (int): Desired days to harvest
+        bundle (ModelBundle): Models to use; defaults to the registry's current bundle
+        prediction_intervals (bool): Add yield and harvest-day intervals from
+            the spread of the individual trees (PREDICTION_QUANTILES)
         
     Returns:
         list: List of recommended crops with their scores
     """
+    bundle = bundle or model_registry.get()
     
     # If models are not loaded, return mock data
-    if not all([crop_model, yield_model, harvest_model, label_encoders]):
+    if bundle is None:
+        mock_fallbacks.labels('no_models').inc()
         return get_mock_recommendations(rainfall, temperature)
     
     try:
-        # Convert and validate input parameters
-        rainfall = float(rainfall) if rainfall else 0
-        temperature = float(temperature) if temperature else 0
-        days_to_harvest = int(days_to_harvest) if days_to_harvest else 90
+        with stage_span('encode'):
+            features, rainfall, temperature, fertilizer_numeric, irrigation_numeric = encode_request(
+                bundle, region, soil_type, rainfall, temperature,
+                fertilizer_used, irrigation_used,
+                weather_condition, days_to_harvest
+            )
         
-        # Convert string boolean inputs to numeric
-        fertilizer_numeric = 1 if fertilizer_used.lower() == 'true' else 0
-        irrigation_numeric = 1 if irrigation_used.lower() == 'true' else 0
-        
-        # Encode categorical features
-        encoded_region, encoded_soil, encoded_weather = encode_input_data(
-            region, soil_type, weather_condition, label_encoders
-        )
-        
-        # Prepare input data for ML models
-        input_data = pd.DataFrame({
-            'Region': [encoded_region],
-            'Soil_Type': [encoded_soil],
-            'Rainfall_mm': [rainfall],
-            'Temperature_Celsius': [temperature],
-            'Fertilizer_Used': [fertilizer_numeric],
-            'Irrigation_Used': [irrigation_numeric],
-            'Weather_Condition': [encoded_weather]
-        })
-        
-        # Get crop prediction probabilities
-        crop_probabilities = crop_model.predict_proba(input_data)[0]
-        crop_classes = crop_model.classes_
+        # Inputs on the lookup table's grid need neither the cache nor the models
+        cache_key = None
+        intervals = None
+        stored = None if prediction_intervals else lookup_stored_outputs(bundle, features)
+        if prediction_intervals:
+            # Per-tree outputs are neither stored nor cached, so run the models
+            outputs, intervals_per_row = predict_feature_rows_with_intervals(bundle, [features])
+            (candidates, predicted_yields, predicted_harvest_times), intervals = outputs[0], intervals_per_row[0]
+        elif stored is not None:
+            candidates, predicted_yields, predicted_harvest_times = stored
+        else:
+            # Serve repeated inputs from the cache; cached responses are computed
+            # from the rounded rainfall and temperature so they depend only on the key
+            if recommendation_cache.enabled:
+                with stage_span('cache_lookup'):
+                    rainfall, temperature = recommendation_cache.quantize(rainfall, temperature)
+                    features['Rainfall_mm'], features['Temperature_Celsius'] = rainfall, temperature
+                    cache_key = recommendation_cache.make_key(bundle.version, features)
+                    cached = recommendation_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
+            # Concurrent requests share one model call per forest when batching is on
+            if request_batcher.enabled:
+                with stage_span('batch_wait_and_models'):
+                    candidates, predicted_yields, predicted_harvest_times = request_batcher.submit(bundle, features)
+            else:
+                candidates, predicted_yields, predicted_harvest_times = predict_feature_rows(bundle, [features])[0]
         
-        # Get top 3 crop recommendations
-        top_indices = np.argsort(crop_probabilities)[-3:][::-1]
-        recommendations = []
+        with stage_span('format'):
+            recommendations = build_recommendations(
+                bundle, candidates, predicted_yields, predicted_harvest_times,
+                rainfall, temperature, fertilizer_numeric, irrigation_numeric, intervals
+            )
         
-        for i, idx in enumerate(top_indices):
-            crop_name = crop_classes[idx]
-            confidence = crop_probabilities[idx] * 100
-            
-            # Skip if confidence is too low
-            if confidence < 5:  # Lowered threshold to show more results
-                continue
-            
-            # Predict yield and harvest time for this specific crop input
-            predicted_yield = yield_model.predict(input_data)[0]
-            predicted_harvest_time = harvest_model.predict(input_data)[0]
-            
-            # Get crop details from database
-            crop_info = crop_database.get(crop_name.lower(), {
-                'name': crop_name.title(),
-                'type': 'Crop',
-                'season': 'Both seasons',
-                'image': 'https://via.placeholder.com/200x150/22c55e/ffffff?text=🌱',
-                'seedRequired': 'Contact local supplier',
-                'fertilizerNeeded': 'NPK fertilizer'
-            })
-            
-                # Get yield benchmarks from actual data
-            yield_benchmark = get_yield_benchmark(crop_name, crop_insights)
-            farming_recommendations = get_farming_recommendations(crop_name, crop_insights)
-            
-            # Evaluate user conditions against data-driven optimal ranges
-            user_condition_evaluation = evaluate_user_conditions(crop_name, rainfall, temperature, crop_insights)
-            
-            recommendation = {
-                'name': crop_info['name'],
-                'type': crop_info['type'],
-                'suitabilityScore': round(confidence, 1),
-                'yield': f"{predicted_yield:.1f} tons/ha",
-                'seedRequired': crop_info['seedRequired'],
-                'fertilizerNeeded': crop_info['fertilizerNeeded'],
-                'season': crop_info['season'],
-                'image': crop_info['image'],
-                'predicted_harvest_time': int(predicted_harvest_time),
-                'expected_conditions': {
-                    'optimal_rainfall': get_optimal_rainfall_range(crop_name),
-                    'optimal_temperature': get_optimal_temperature_range(crop_name),
-                    'best_weather': get_best_weather_condition(crop_name),
-                    'recommended_fertilizer': 'Yes' if fertilizer_numeric else 'Recommended',
-                    'recommended_irrigation': 'Yes' if irrigation_numeric else 'Recommended'
-                },
-                'data_insights': {
-                    'average_yield_benchmark': f"{yield_benchmark['average_yield']:.1f} tons/ha",
-                    'maximum_yield_potential': f"{yield_benchmark['maximum_yield']:.1f} tons/ha",
-                    'minimum_yield_recorded': f"{yield_benchmark['minimum_yield']:.1f} tons/ha",
-                    'typical_harvest_time': f"{yield_benchmark['expected_harvest_days']:.0f} days",
-                    'harvest_range': f"{yield_benchmark['min_harvest_days']:.0f}-{yield_benchmark['max_harvest_days']:.0f} days",
-                    'fertilizer_success_rate': farming_recommendations['fertilizer_success_rate'],
-                    'irrigation_success_rate': farming_recommendations['irrigation_success_rate'],
-                    'best_soil_type': farming_recommendations['best_soil_type'],
-                    'best_region': farming_recommendations['best_region'],
-                    'data_samples': f"Based on {yield_benchmark['data_samples']} real farm records"
-                },
-                'suitability_factors': {
-                    'rainfall': user_condition_evaluation['rainfall'],
-                    'temperature': user_condition_evaluation['temperature'],
-                    'rainfall_optimal_range': user_condition_evaluation['rainfall_range'],
-                    'temperature_optimal_range': user_condition_evaluation['temperature_range']
-                },
-                'harvest_prediction': {
-                    'expected_days': int(predicted_harvest_time),
-                    'harvest_month': get_harvest_month(int(predicted_harvest_time)),
-                    'growth_stage': get_growth_stage(int(predicted_harvest_time))
-                }
-            }
-            
-            recommendations.append(recommendation)
+        if not recommendations:
+            mock_fallbacks.labels('no_candidates').inc()
+            return get_mock_recommendations(rainfall, temperature)
         
-        return recommendations if recommendations else get_mock_recommendations(rainfall, temperature)
+        if cache_key is not None:
+            recommendation_cache.put(cache_key, recommendations)
+        return recommendations
         
     except Exception as e:
         print(f"ML prediction error: {e}")
+        exceptions.labels('get_crop_recommendations').inc()
+        mock_fallbacks.labels('exception').inc()
         # Fallback to mock data if ML prediction fails
         return get_mock_recommendations(rainfall, temperature)
 
+def get_crop_recommendations_batch(farms, bundle=None, prediction_intervals=False):
+    """
+    Get crop recommendations for many farms with one model call per forest.
+
+    All valid farms are encoded into a single feature matrix so that
+    ``predict_proba`` runs once over the whole batch, and both regressors
+    run once over every (farm, candidate crop) pair instead of once per farm.
+
+    Args:
+        farms (list): Dicts with the same keys as the arguments of
+            ``get_crop_recommendations`` (region, soil_type, rainfall, ...)
+        bundle (ModelBundle): Models to use; defaults to the registry's current bundle
+        prediction_intervals (bool): Add prediction intervals to every recommendation
+
+    Returns:
+        list: One dict per farm, in input order, holding either
+            ``recommendations`` or an ``error`` message
+    """
+    results = [None] * len(farms)
+    bundle = bundle or model_registry.get()
+
+    # If models are not loaded, return mock data for every farm
+    if bundle is None:
+        mock_fallbacks.labels('no_models').inc(len(farms))
+        for position, farm in enumerate(farms):
+            farm = farm if isinstance(farm, dict) else {}
+            results[position] = {
+                'recommendations': get_mock_recommendations(farm.get('rainfall'), farm.get('temperature'))
+            }
+        return results
+
+    # Validate every farm, reporting bad inputs per item
+    rows = []
+    prepared = []
+    for position, farm in enumerate(farms):
+        try:
+            if not isinstance(farm, dict):
+                raise ValueError("Each farm must be a JSON object")
+            features, rainfall, temperature, fertilizer_numeric, irrigation_numeric = encode_request(
+                bundle, farm.get('region'), farm.get('soil_type'), farm.get('rainfall'), farm.get('temperature'),
+                farm.get('fertilizer_used'), farm.get('irrigation_used'),
+                farm.get('weather_condition'), farm.get('days_to_harvest'),
+                encode_categories=False
+            )
+        except Exception as e:
+            results[position] = {'error': f"Invalid input: {e}"}
+            continue
+
+        rows.append(features)
+        prepared.append((position, rainfall, temperature, fertilizer_numeric, irrigation_numeric))
+
+    if not rows:
+        return results
+
+    # Encode each categorical column of the valid farms in one pass
+    for column, key in (('Region', 'region'), ('Soil_Type', 'soil_type'), ('Weather_Condition', 'weather_condition')):
+        codes = bundle.category_encoder.encode_batch(column, [farms[position].get(key) for position, *_ in prepared])
+        for features, code in zip(rows, codes.tolist()):
+            features[column] = code
+
+    # Rows on the lookup table's grid skip the models (unless intervals are wanted)
+    if prediction_intervals:
+        predictions = [None] * len(rows)
+    else:
+        predictions = [lookup_stored_outputs(bundle, features) for features in rows]
+    live_rows = [row for row, stored in enumerate(predictions) if stored is None]
+    intervals = [None] * len(rows)
+
+    try:
+        # Run each forest once over the feature matrix of the remaining rows
+        if live_rows:
+            live_predictions, live_intervals = predict_feature_rows_with_intervals(
+                bundle, [rows[row] for row in live_rows], PREDICTION_QUANTILES if prediction_intervals else None)
+            for row, outputs, row_intervals in zip(live_rows, live_predictions, live_intervals):
+                predictions[row], intervals[row] = outputs, row_intervals
+    except Exception as e:
+        print(f"ML batch prediction error: {e}")
+        exceptions.labels('get_crop_recommendations_batch').inc()
+        for position, *_ in prepared:
+            results[position] = {'error': f"Prediction failed: {e}"}
+        return results
+
+    for row, (position, rainfall, temperature, fertilizer_numeric, irrigation_numeric) in enumerate(prepared):
+        try:
+            candidates, predicted_yields, predicted_harvest_times = predictions[row]
+            recommendations = build_recommendations(
+                bundle, candidates, predicted_yields, predicted_harvest_times,
+                rainfall, temperature, fertilizer_numeric, irrigation_numeric, intervals[row]
+            )
+            if not recommendations:
+                mock_fallbacks.labels('no_candidates').inc()
+                recommendations = get_mock_recommendations(rainfall, temperature)
+            results[position] = {'recommendations': recommendations}
+        except Exception as e:
+            exceptions.labels('get_crop_recommendations_batch').inc()
+            results[position] = {'error': f"Prediction failed: {e}"}
+
+    return results
+
+def surface_axis(name, spec):
+    """
+    Grid values for one axis of a suitability surface.
+
+    ``spec`` is a dict with ``min``, ``max`` and ``step``; the values run
+    from min up to max inclusive.
+
+    Returns:
+        numpy.ndarray: The axis values
+    """
+    if not isinstance(spec, dict):
+        raise ValueError(f"{name} must be an object with min, max and step")
+    try:
+        start, stop, step = float(spec['min']), float(spec['max']), float(spec['step'])
+    except KeyError as e:
+        raise ValueError(f"{name} is missing {e.args[0]}")
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} min, max and step must be numbers")
+    if not np.isfinite([start, stop, step]).all() or step <= 0 or stop < start:
+        raise ValueError(f"{name} needs min <= max and a positive step")
+
+    count = int(np.floor((stop - start) / step + 1e-9)) + 1
+    if count > SURFACE_MAX_POINTS:
+        raise ValueError(f"{name} has {count} steps; at most {SURFACE_MAX_POINTS} grid points are allowed")
+    # Computed from the index rather than accumulated so values do not drift
+    return np.round(start + np.arange(count) * step, 6)
+
+def parse_flag(value):
+    """1 for true/'true' (any case), 0 for anything else."""
+    if isinstance(value, str):
+        return 1 if value.lower() == 'true' else 0
+    return 1 if value is True else 0
+
+def get_suitability_surface(region, soil_type, weather_condition, rainfall, temperature,
+                            fertilizer_used=None, irrigation_used=None, bundle=None):
+    """
+    Crop suitability, predicted yield and harvest time over a grid of
+    rainfall and temperature for one region, soil and weather.
+
+    The whole grid is built as one feature matrix: the crop classifier runs
+    once over every grid point and each regressor once over every
+    (grid point, crop) pair.
+
+    Args:
+        region (str): Geographic region
+        soil_type (str): Type of soil
+        weather_condition (str): Weather conditions
+        rainfall (dict): Rainfall axis as {"min", "max", "step"} in mm
+        temperature (dict): Temperature axis as {"min", "max", "step"} in Celsius
+        fertilizer_used: Fertilizer flag for every grid point (default false)
+        irrigation_used: Irrigation flag for every grid point (default false)
+        bundle (ModelBundle): Models to use; defaults to the registry's current bundle
+
+    Returns:
+        dict: The axes and, per crop, [rainfall][temperature] arrays of
+            suitability (%), yield (tons/ha) and harvest days
+    """
+    rainfall_values = surface_axis('rainfall', rainfall)
+    temperature_values = surface_axis('temperature', temperature)
+    points = len(rainfall_values) * len(temperature_values)
+    if points > SURFACE_MAX_POINTS:
+        raise ValueError(f"The grid has {points} points; at most {SURFACE_MAX_POINTS} are allowed")
+
+    bundle = bundle or model_registry.get()
+    if bundle is None:
+        raise ModelLoadError("Models are not loaded")
+
+    with stage_span('encode'):
+        encoded_region, encoded_soil, encoded_weather = bundle.category_encoder.encode_row(
+            region, soil_type, weather_condition
+        )
+        fertilizer_numeric, irrigation_numeric = parse_flag(fertilizer_used), parse_flag(irrigation_used)
+
+        # One row per grid point, rainfall-major, in FEATURE_COLUMNS order
+        grid_rainfall, grid_temperature = np.meshgrid(rainfall_values, temperature_values, indexing='ij')
+        matrix = np.empty((points, len(CROP_FEATURE_COLUMNS)))
+        matrix[:, 0] = encoded_region
+        matrix[:, 1] = encoded_soil
+        matrix[:, 2] = grid_rainfall.ravel()
+        matrix[:, 3] = grid_temperature.ravel()
+        matrix[:, 4] = fertilizer_numeric
+        matrix[:, 5] = irrigation_numeric
+        matrix[:, 6] = encoded_weather
+
+    with stage_span('crop_model'):
+        crop_classes = bundle.crop_predictor.classes_
+        probabilities = bundle.crop_predictor.predict_proba(matrix[:, :len(FEATURE_COLUMNS)])
+
+    with stage_span('yield_harvest_models'):
+        # Every grid point once per crop, crop-major
+        crop_matrix = np.tile(matrix, (len(crop_classes), 1))
+        crop_matrix[:, len(FEATURE_COLUMNS)] = np.repeat(encode_crops(bundle, crop_classes), points)
+        yield_predictor, harvest_predictor = bundle.yield_predictor, bundle.harvest_predictor
+        predicted_yields = yield_predictor.predict(crop_matrix[:, :len(model_feature_columns(yield_predictor))])
+        predicted_harvest_times = harvest_predictor.predict(
+            crop_matrix[:, :len(model_feature_columns(harvest_predictor))])
+
+    with stage_span('format'):
+        shape = (len(rainfall_values), len(temperature_values))
+        crops = {}
+        for index, crop_name in enumerate(crop_classes):
+            rows = slice(index * points, (index + 1) * points)
+            crops[str(crop_name)] = {
+                'suitability': np.round(probabilities[:, index] * 100, 1).reshape(shape).tolist(),
+                'yield': np.round(predicted_yields[rows], 2).reshape(shape).tolist(),
+                # Truncated like predicted_harvest_time in /recommend
+                'harvest_days': predicted_harvest_times[rows].astype(int).reshape(shape).tolist()
+            }
+
+    return {
+        'rainfall': rainfall_values.tolist(),
+        'temperature': temperature_values.tolist(),
+        'shape': list(shape),
+        'fixed': {
+            'region': region,
+            'soilType': soil_type,
+            'weatherCondition': weather_condition,
+            'fertilizerUsed': bool(fertilizer_numeric),
+            'irrigationUsed': bool(irrigation_numeric)
+        },
+        'crops': crops
+    }
+
+def batch_size_samples(batcher):
+    """The batcher's batch-size buckets as cumulative histogram samples."""
+    samples, cumulative = [], 0
+    for bound, count in batcher['batch_size_buckets'].items():
+        cumulative += count
+        samples.append(('agrovia_batcher_batch_size_bucket', {'le': bound}, cumulative))
+    samples.append(('agrovia_batcher_batch_size_sum', {}, batcher['requests']))
+    samples.append(('agrovia_batcher_batch_size_count', {}, batcher['batches']))
+    return samples
+
+def collect_service_metrics():
+    """
+    Scrape-time metrics read from the cache, the batcher and the current
+    model bundle (see ml/metrics.py for the tuple format).
+    """
+    cache = recommendation_cache.stats()
+    batcher = request_batcher.stats()
+    families = [
+        ('agrovia_cache_lookups_total', 'counter', 'Response cache lookups by result',
+         [('agrovia_cache_lookups_total', {'result': 'hit'}, cache['hits']),
+          ('agrovia_cache_lookups_total', {'result': 'miss'}, cache['misses'])]),
+        ('agrovia_cache_removals_total', 'counter', 'Response cache entries removed, by cause',
+         [('agrovia_cache_removals_total', {'cause': 'eviction'}, cache['evictions']),
+          ('agrovia_cache_removals_total', {'cause': 'expiration'}, cache['expirations'])]),
+        ('agrovia_cache_entries', 'gauge', 'Entries currently in the response cache',
+         [('agrovia_cache_entries', {}, cache['entries'])]),
+        ('agrovia_batcher_batch_size', 'histogram', 'Requests per micro-batch', batch_size_samples(batcher)),
+        ('agrovia_batcher_added_wait_seconds', 'gauge', 'Recent wait added by micro-batching, by quantile',
+         [('agrovia_batcher_added_wait_seconds', {'quantile': quantile}, batcher['added_wait_ms'][key] / 1000)
+          for quantile, key in (('0.5', 'p50'), ('0.99', 'p99'))])
+    ]
+
+    bundle = model_registry.get()
+    if bundle is not None:
+        families.append(('agrovia_model_bundle_info', 'gauge', 'The model bundle being served',
+                         [('agrovia_model_bundle_info', {'version': bundle.version, 'engine': bundle.engine}, 1)]))
+        families.append(('agrovia_unknown_categories_total', 'counter',
+                         'Categorical inputs unknown to the current bundle, encoded with the fallback code',
+                         [('agrovia_unknown_categories_total', {'column': column}, count)
+                          for column, count in bundle.category_encoder.stats().items()]))
+    return families
+
+metrics.register_collector(collect_service_metrics)
+
+def optional_number(value):
+    """float(value), or None when it is missing or not a number."""
+    try:
+        return float(value) if value not in (None, '') else None
+    except (ValueError, TypeError):
+        return None
+
+def get_degraded_recommendations(rainfall, temperature, fertilizer_used=None, irrigation_used=None, top_k=3):
+    """
+    Model-free recommendations from the precomputed crop_insights, served
+    when the service is too busy to run the models.
+
+    Crops whose data-driven optimal rainfall and temperature ranges contain
+    the farm's conditions rank first, then crops with the higher average
+    yield. Yield and harvest time are the crops' historical averages, there
+    is no suitability score, and every recommendation is marked ``degraded``.
+    """
+    rainfall, temperature = optional_number(rainfall), optional_number(temperature)
+    fertilizer_numeric, irrigation_numeric = parse_flag(fertilizer_used), parse_flag(irrigation_used)
+
+    ranked = []
+    for crop_name, template in degraded_templates.items():
+        optimal = sum(
+            condition_status(value, bounds) == 'Optimal'
+            for value, bounds in ((rainfall, template['rainfall_bounds']), (temperature, template['temperature_bounds']))
+            if value is not None
+        )
+        ranked.append((-optimal, -crop_insights[crop_name].get('avg_yield', 0), crop_name))
+    ranked.sort()
+
+    recommendations = []
+    for _, _, crop_name in ranked[:top_k]:
+        crop_data = crop_insights[crop_name]
+        recommendation = render_recommendation(
+            degraded_templates[crop_name], 0.0, crop_data.get('avg_yield', 0), crop_data.get('avg_harvest_days', 90),
+            rainfall if rainfall is not None else float('nan'),
+            temperature if temperature is not None else float('nan'),
+            fertilizer_numeric, irrigation_numeric
+        )
+        recommendation['suitabilityScore'] = None
+        recommendation['degraded'] = True
+        if rainfall is None:
+            recommendation['suitability_factors']['rainfall'] = 'Unknown'
+        if temperature is None:
+            recommendation['suitability_factors']['temperature'] = 'Unknown'
+        recommendations.append(recommendation)
+    return recommendations
+
+# Nearest-real-farm index, loaded on first use (see get_farm_index)
+farm_index = None
+farm_index_lock = threading.Lock()
+
+def get_farm_index():
+    """
+    The nearest-real-farm index over crop_yield.csv, loading it on first use.
+
+    Returns:
+        FarmIndex: The index, or None when neither the CSV nor a saved index exists
+    """
+    global farm_index
+    if farm_index is None:
+        with farm_index_lock:
+            if farm_index is None:
+                farm_index = load_farm_index(os.path.join(current_dir, 'crop_yield.csv'))
+                if farm_index is not None:
+                    print(f"✓ Farm index loaded: {farm_index.meta['rows']} farms in {len(farm_index.groups)} groups")
+    return farm_index
+
+def similar_farms_k(value, default=5):
+    """The requested neighbour count, validated against SIMILAR_FARMS_MAX_K."""
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError("k must be an integer")
+    try:
+        k = int(value)
+    except ValueError:
+        raise ValueError("k must be an integer")
+    if not 1 <= k <= SIMILAR_FARMS_MAX_K:
+        raise ValueError(f"k must be between 1 and {SIMILAR_FARMS_MAX_K}")
+    return k
+
+class MockRecommendations(list):
+    """A list of mock recommendations, so callers can tell them from model output."""
+
 def get_mock_recommendations(rainfall, temperature):
     """
     Fallback function that returns mock recommendations when ML models fail.
+
+    Returns:
+        MockRecommendations: The mock recommendations
     """
     # Ensure rainfall and temperature are numeric
     try:
@@ -383,4 +1058,4 @@ def get_mock_recommendations(rainfall, temperature):
         }
     ]
     
-    return mock_recommendations
+    return MockRecommendations(mock_recommendations)
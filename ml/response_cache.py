@@ -0,0 +1,126 @@
+"""
+In-process LRU/TTL cache for crop recommendation responses.
+
+Keys are built from the model version, the encoded categorical inputs, the
+fertilizer/irrigation flags and rainfall/temperature rounded to a
+configurable precision. Because harvest months are computed from today's
+date, the whole cache is dropped when the date rolls over.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+class RecommendationCache:
+    """
+    Thread-safe, size-bounded LRU cache whose entries also expire after a TTL
+    and at midnight.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=3600.0,
+                 rainfall_precision=0, temperature_precision=1):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.rainfall_precision = rainfall_precision
+        self.temperature_precision = temperature_precision
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._day = date.today()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def quantize(self, rainfall, temperature):
+        """Round rainfall and temperature to the precision used in cache keys."""
+        return round(rainfall, self.rainfall_precision), round(temperature, self.temperature_precision)
+
+    def make_key(self, model_version, features):
+        """
+        Build the cache key for an encoded feature row whose rainfall and
+        temperature have already been quantized.
+        """
+        return (
+            model_version,
+            int(features['Region']),
+            int(features['Soil_Type']),
+            int(features['Weather_Condition']),
+            int(features['Fertilizer_Used']),
+            int(features['Irrigation_Used']),
+            features['Rainfall_mm'],
+            features['Temperature_Celsius']
+        )
+
+    def _roll_over_locked(self):
+        # Harvest months depend on today's date, so nothing survives midnight
+        today = date.today()
+        if today != self._day:
+            self.expirations += len(self._entries)
+            self._entries.clear()
+            self._day = today
+
+    def get(self, key):
+        """Return a copy of the cached value, or None on a miss."""
+        with self._lock:
+            self._roll_over_locked()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            value = entry[1]
+
+        # Callers get their own copy so they can never corrupt the cache
+        return copy.deepcopy(value)
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries if full."""
+        if not self.enabled:
+            return
+
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._roll_over_locked()
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters and sizing for status endpoints."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'rainfall_precision': self.rainfall_precision,
+                'temperature_precision': self.temperature_precision,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,298 @@
+"""
+Refresh the served model bundle with trees fitted on new records only.
+
+Instead of rebuilding the three forests from scratch on the whole dataset,
+the current bundle's forests are loaded and grown with ``warm_start``: each
+gets ``--new-trees`` trees fitted on the records appended since the base
+bundle was trained (or on a recent ``--window`` of records), and the oldest
+trees are retired so no forest grows past ``--max-trees``. New records are
+encoded with the base bundle's label encoders; rows with categories the
+bundle has never seen are dropped.
+
+Before anything is saved, a held-out part of the new records is scored
+with the base and the refreshed forests, and single-row latency of the
+compiled forests is compared. A refresh that loses more than
+``--max-score-drop`` of accuracy / R² on any model, or slows inference by
+more than ``--max-latency-increase``, is rejected. Accepted refreshes are
+published as a new versioned bundle whose ``manifest.json`` records the base
+version and how many dataset rows it has seen, so the next run picks up
+where this one stopped.
+
+Usage:
+    python -m ml.retrain_incremental [--data crop_yield.csv] [--since-row N | --window N] [--new-trees 10]
+"""
+
+import argparse
+import copy
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+from .encoding import CategoryEncoder
+from .forest_engine import compile_forest
+from .model_registry import (COMPILED_DIR, FOREST_MODELS, ModelLoadError, ModelRegistry, load_bundle,
+                             new_version_name, save_bundle, set_current_version)
+from .train_models import ENCODED_COLUMNS, FEATURE_COLUMNS, ML_DIR, load_dataset
+from .train_parallel import MANIFEST_FILE, write_manifest
+
+# Bundle models refreshed by this script: (name, bundle attribute, target column, takes the crop as a feature)
+REFRESHED_MODELS = (
+    ('crop recommendation', 'crop_model', 'Crop', False),
+    ('harvest time', 'harvest_model', 'Days_to_Harvest', True),
+    ('yield prediction', 'yield_model', 'Yield_tons_per_hectare', True)
+)
+
+def read_manifest(bundle_dir):
+    """A bundle's manifest.json, or {} for bundles written without one."""
+    try:
+        with open(os.path.join(bundle_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def has_compact_artifacts(bundle_dir):
+    """True if a bundle's compiled forests were written by compact_forest."""
+    return all(os.path.exists(os.path.join(bundle_dir, COMPILED_DIR, name, 'value_ids.npy')) for name in FOREST_MODELS)
+
+def encode_with_encoders(data, label_encoders):
+    """
+    Encode records with an existing bundle's label encoders.
+
+    Returns:
+        tuple: (features, features with the encoded crop, mask of the rows
+            whose categories the encoders all know)
+    """
+    encoder = CategoryEncoder(label_encoders)
+    known = np.ones(len(data), dtype=bool)
+    columns = {}
+    for column in FEATURE_COLUMNS:
+        if column in ENCODED_COLUMNS:
+            codes = encoded_column(encoder, column, data[column])
+            known &= ~np.isnan(codes)
+            columns[column] = codes
+        else:
+            columns[column] = data[column].to_numpy(dtype=np.float32)
+
+    X = pd.DataFrame(columns, columns=FEATURE_COLUMNS)
+    crop_codes = encoded_column(encoder, 'Crop', data['Crop'])
+    known &= ~np.isnan(crop_codes)
+    return X, X.assign(Crop=crop_codes), known
+
+def encoded_column(encoder, column, values):
+    """Category codes of a column as float32, NaN where the value is unknown."""
+    codes = encoder.encode_batch(column, values.to_numpy(dtype=object), unknown_code=-1).astype(np.float32)
+    codes[codes < 0] = np.nan
+    return codes
+
+def grow_forest(model, X, y, new_trees, max_trees, n_jobs=None):
+    """
+    A copy of a fitted forest with ``new_trees`` trees fitted on (X, y)
+    appended and the oldest trees retired down to ``max_trees``.
+
+    The base forest is left untouched; both share the trees they have in common.
+
+    Returns:
+        tuple: (grown forest, trees retired)
+    """
+    grown = copy.copy(model)
+    grown.estimators_ = list(model.estimators_)
+    grown.set_params(warm_start=True, n_estimators=len(grown.estimators_) + new_trees)
+    if n_jobs is not None:
+        grown.set_params(n_jobs=n_jobs)
+    grown.fit(X, y)
+
+    retired = max(0, len(grown.estimators_) - max_trees)
+    grown.estimators_ = grown.estimators_[retired:]
+    grown.set_params(warm_start=False, n_estimators=len(grown.estimators_))
+    return grown, retired
+
+def single_row_latency_ms(models, X, rows=200, passes=5):
+    """
+    Single-row latency of each model's compiled forest, as the request path
+    runs it. The forests take turns on every row so bursts of machine load
+    hit them alike; each gets the best of its per-pass medians.
+
+    Returns:
+        list: Latency in milliseconds per model
+    """
+    methods = []
+    for model in models:
+        forest = compile_forest(model)
+        methods.append(forest.predict_proba if forest.kind == 'classifier' else forest.predict)
+    matrix = X.to_numpy(dtype=np.float32)[:rows]
+
+    best = np.full(len(methods), np.inf)
+    for _ in range(passes):
+        timings = np.empty((len(matrix), len(methods)))
+        for row_number, row in enumerate(matrix):
+            for position, method in enumerate(methods):
+                started = time.perf_counter()
+                method(row)
+                timings[row_number, position] = time.perf_counter() - started
+        best = np.minimum(best, np.median(timings, axis=0) * 1000)
+    return [float(latency) for latency in best]
+
+def select_new_records(data, args, base_manifest):
+    """
+    The records to fit on: rows from ``--since-row`` (by default where the
+    base bundle stopped), or the last ``--window`` rows.
+
+    Returns:
+        tuple: (records, first row index)
+    """
+    if args.window:
+        start = max(0, len(data) - args.window)
+    elif args.since_row is not None:
+        start = args.since_row
+    elif 'data_rows' in base_manifest:
+        start = base_manifest['data_rows']
+    else:
+        raise ValueError("The base bundle does not record how many rows it has seen; pass --since-row or --window")
+    if start > len(data):
+        raise ValueError(f"--since-row {start} is past the end of the dataset ({len(data)} rows)")
+    return data.iloc[start:].reset_index(drop=True), start
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Incrementally refresh the Agrovia crop models')
+    parser.add_argument('--data', default=os.path.join(ML_DIR, 'crop_yield.csv'), help='Dataset holding the new records')
+    parser.add_argument('--models-dir', default=os.path.join(ML_DIR, 'models'), help='Where versioned bundles live')
+    parser.add_argument('--base-version', help='Bundle to refresh (defaults to CURRENT)')
+    parser.add_argument('--version', help='Version name of the refreshed bundle (defaults to a timestamp)')
+    parser.add_argument('--since-row', type=int, help='First new row of --data (defaults to where the base bundle stopped)')
+    parser.add_argument('--window', type=int, help='Fit on the last N rows of --data instead')
+    parser.add_argument('--new-trees', type=int, default=10, help='Trees added to each forest')
+    parser.add_argument('--max-trees', type=int, help='Trees kept per forest, oldest retired first (defaults to the base size)')
+    parser.add_argument('--test-size', type=float, default=0.2, help='Held-out fraction of the new records')
+    parser.add_argument('--max-score-drop', type=float, default=0.02, help='Largest accepted held-out score loss per model')
+    parser.add_argument('--max-latency-increase', type=float, default=0.25,
+                        help='Largest accepted relative single-row latency increase per model')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Parallel jobs per forest (-1 = all cores)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--no-publish', action='store_true', help='Do not make the new bundle current')
+    parser.add_argument('--compact', action='store_true',
+                        help='Shrink the memory-mapped compiled forests (exact; on by default when the base bundle is compact)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    total_started = time.perf_counter()
+
+    registry = ModelRegistry(ML_DIR, models_dir=args.models_dir, engine='sklearn', mmap=False)
+    try:
+        base_version, base_path = registry.resolve(args.base_version)
+        base = load_bundle(base_path, base_version, engine='sklearn', mmap=False)
+    except ModelLoadError as e:
+        print(f"✗ {e}")
+        return None
+    base_manifest = read_manifest(base_path)
+    print(f"✓ Loaded base bundle {base_version} in {time.perf_counter() - total_started:.1f}s")
+
+    data = load_dataset(args.data)
+    try:
+        records, first_row = select_new_records(data, args, base_manifest)
+    except ValueError as e:
+        print(f"✗ {e}")
+        return None
+
+    X, X_with_crop, known = encode_with_encoders(records, base.label_encoders)
+    if not known.all():
+        print(f"⚠️ Dropping {int((~known).sum())} new record(s) with categories the base bundle does not know")
+    records, X, X_with_crop = records[known], X[known], X_with_crop[known]
+    if len(records) < 10:
+        print(f"✗ Only {len(records)} usable new record(s) from row {first_row}; nothing to refresh")
+        return None
+
+    fit_index, test_index = train_test_split(np.arange(len(records)), test_size=args.test_size, random_state=args.seed)
+    print(f"✓ {len(records)} new records from row {first_row}: fitting on {len(fit_index)}, "
+          f"validating on {len(test_index)}")
+
+    refreshed = {}
+    reports = {}
+    rejected = []
+    for name, attribute, target, with_crop in REFRESHED_MODELS:
+        model = getattr(base, attribute)
+        features = X_with_crop if with_crop else X
+        y = records[target].astype(str).to_numpy() if target == 'Crop' else records[target].to_numpy()
+        max_trees = args.max_trees or len(model.estimators_)
+
+        report = {'base_trees': len(model.estimators_)}
+        if target == 'Crop' and set(np.unique(y[fit_index])) != set(model.classes_):
+            # warm_start refits classes_ from the new labels, which must match the old trees
+            print(f"⚠️ {name}: new records do not cover every crop; keeping the base forest")
+            refreshed[attribute] = model
+            reports[name] = {**report, 'status': 'kept', 'reason': 'new records do not cover every crop'}
+            continue
+
+        started = time.perf_counter()
+        grown, retired = grow_forest(model, features.iloc[fit_index], y[fit_index], args.new_trees, max_trees,
+                                     args.n_jobs)
+        report.update({
+            'trees_added': args.new_trees,
+            'trees_retired': retired,
+            'trees': len(grown.estimators_),
+            'fit_seconds': round(time.perf_counter() - started, 2)
+        })
+
+        X_test, y_test = features.iloc[test_index], y[test_index]
+        report['base_score'] = round(float(model.score(X_test, y_test)), 4)
+        report['score'] = round(float(grown.score(X_test, y_test)), 4)
+        report['base_latency_ms'], report['latency_ms'] = (
+            round(latency, 3) for latency in single_row_latency_ms([model, grown], X_test))
+
+        problems = []
+        if report['score'] < report['base_score'] - args.max_score_drop:
+            problems.append(f"held-out score {report['base_score']} -> {report['score']}")
+        if report['latency_ms'] > report['base_latency_ms'] * (1 + args.max_latency_increase):
+            problems.append(f"latency {report['base_latency_ms']} -> {report['latency_ms']} ms")
+        report['status'] = 'rejected' if problems else 'refreshed'
+        reports[name] = report
+        refreshed[attribute] = grown
+
+        score_name = 'accuracy' if target == 'Crop' else 'R²'
+        marker = '✗' if problems else '✓'
+        print(f"{marker} {name}: +{args.new_trees} trees, -{retired} retired in {report['fit_seconds']}s; "
+              f"held-out {score_name} {report['base_score']} -> {report['score']}, "
+              f"latency {report['base_latency_ms']} -> {report['latency_ms']} ms")
+        if problems:
+            rejected.append(f"{name} ({', '.join(problems)})")
+
+    if rejected:
+        print(f"\n✗ Refresh rejected, no bundle saved: {'; '.join(rejected)}")
+        return None
+
+    version = args.version or new_version_name()
+    save_bundle(args.models_dir, refreshed['crop_model'], refreshed['yield_model'], refreshed['harvest_model'],
+                base.label_encoders, version=version, make_current=False,
+                compact=args.compact or has_compact_artifacts(base_path))
+    total_seconds = time.perf_counter() - total_started
+    write_manifest(os.path.join(args.models_dir, version, MANIFEST_FILE), {
+        'version': version,
+        'kind': 'incremental',
+        'status': 'done',
+        'base_version': base_version,
+        'finished_at': datetime.now().isoformat(timespec='seconds'),
+        'data': os.path.abspath(args.data),
+        'data_rows': len(data),
+        'new_rows': {'from': first_row, 'to': len(data), 'usable': len(records)},
+        'fit_rows': len(fit_index),
+        'test_rows': len(test_index),
+        'models': reports,
+        'wall_time_seconds': round(total_seconds, 2)
+    })
+
+    # The bundle and its manifest are complete before CURRENT moves
+    if not args.no_publish:
+        set_current_version(args.models_dir, version)
+    print(f"✓ Saved model bundle {version} to {os.path.join(args.models_dir, version)}"
+          f"{'' if args.no_publish else ' (now current)'}")
+    print(f"\nTotal wall time {total_seconds:.1f}s "
+          f"(model fits {sum(report.get('fit_seconds', 0) for report in reports.values()):.1f}s)")
+    return version
+
+if __name__ == '__main__':
+    main()
@@ -1,97 +1,265 @@
+"""
+Train the crop recommendation, harvest time and yield prediction models.
+
+Loads the training columns with compact dtypes (categoricals, float32,
+bool), from the columnar store built by ``dataset_store.py`` when one is
+current, makes one train/test split shared by all three models, fits each forest on
+all cores and reports wall time and peak memory per model. The trained
+models are published as a new versioned bundle for the model registry.
+
+Usage:
+    python -m ml.train_models [--data crop_yield.csv] [--sample N] [--n-jobs -1]
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
+import joblib
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
-import joblib
 
-# Debug: Starting script
-print("Starting script...")
+from .data_analyzer import CATEGORY_COLUMNS, category_codes
+from .dataset_store import read_dataset
+from .model_registry import MODEL_FILES, save_bundle
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Feature columns in the order the models are trained on
+FEATURE_COLUMNS = ['Region', 'Soil_Type', 'Rainfall_mm', 'Temperature_Celsius', 'Fertilizer_Used', 'Irrigation_Used', 'Weather_Condition']
+
+# Categorical features label-encoded for the models
+ENCODED_COLUMNS = ['Region', 'Soil_Type', 'Weather_Condition']
+
+# Columns the three models are trained on or predict
+TRAINING_COLUMNS = FEATURE_COLUMNS + ['Crop', 'Days_to_Harvest', 'Yield_tons_per_hectare']
+
+# Compact dtypes for crop_yield.csv; text columns become categoricals
+CSV_DTYPES = {
+    **{column: 'category' for column in CATEGORY_COLUMNS},
+    'Rainfall_mm': np.float32,
+    'Temperature_Celsius': np.float32,
+    'Fertilizer_Used': bool,
+    'Irrigation_Used': bool,
+    'Days_to_Harvest': np.int16,
+    'Yield_tons_per_hectare': np.float32
+}
+
+def load_dataset(csv_path, sample=None, seed=42):
+    """
+    Load the training columns of crop_yield.csv (or its columnar store) with
+    compact dtypes, optionally down-sampled for quick experiments.
+    """
+    data = read_dataset(csv_path, TRAINING_COLUMNS, CSV_DTYPES)
+    if sample and sample < len(data):
+        data = data.sample(sample, random_state=seed)
+    return data.reset_index(drop=True)
+
+def fitted_label_encoder(categories):
+    """A LabelEncoder fitted on the (sorted) categories of a column."""
+    encoder = LabelEncoder()
+    encoder.fit(np.asarray(categories, dtype=object))
+    return encoder
+
+def encode_features(data):
+    """
+    Build the float32 feature matrices and the label encoders.
+
+    Returns:
+        tuple: (features, features with the encoded crop, label encoders)
+    """
+    label_encoders = {}
+    columns = {}
+
+    for column in FEATURE_COLUMNS:
+        if column in ENCODED_COLUMNS:
+            # Sorted category codes are exactly what LabelEncoder would produce
+            codes, categories = category_codes(data[column])
+            label_encoders[column] = fitted_label_encoder(categories)
+            columns[column] = codes.astype(np.float32)
+        else:
+            columns[column] = data[column].to_numpy(dtype=np.float32)
+
+    X = pd.DataFrame(columns, columns=FEATURE_COLUMNS)
+
+    # Yield and harvest time depend on the crop, so those models also take the
+    # encoded crop as a feature (the crop classifier keeps the raw crop names)
+    crop_codes, crop_categories = category_codes(data['Crop'])
+    label_encoders['Crop'] = fitted_label_encoder(crop_categories)
+    X_with_crop = X.assign(Crop=crop_codes.astype(np.float32))
+
+    return X, X_with_crop, label_encoders
+
+def current_rss_bytes():
+    """Resident set size of this process, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
 
-# Debug: Check dataset loading
-print("Dataset loading...")
-data = pd.read_csv('crop_yield.csv')
-print("Dataset loaded successfully.")
+class MemoryMonitor:
+    """
+    Samples resident memory in a background thread to find the peak reached
+    while a block of code runs.
+    """
 
-# Debug: Check dataset loading
-print("Dataset Preview:")
-print(data.head())
-print("\nDataset Info:")
-print(data.info())
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.start_rss = None
+        self.peak_rss = None
+        self._stop = threading.Event()
+        self._thread = None
 
-# # Limit dataset to 1000 rows for testing
-print("Limiting dataset to 1000 rows for testing...")
-data = data.sample(1000, random_state=42)
-print("Dataset limited to 1000 rows.")
-# print(f"Using full dataset with {len(data)} records for training...")
+    def _sample(self):
+        while not self._stop.is_set():
+            rss = current_rss_bytes()
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss or 0, rss)
+            self._stop.wait(self.interval)
 
-# Encode categorical features
-label_encoders = {}
-for col in ['Region', 'Soil_Type', 'Weather_Condition']:
-    le = LabelEncoder()
-    data[col] = le.fit_transform(data[col])
-    label_encoders[col] = le
+    def __enter__(self):
+        self.start_rss = current_rss_bytes()
+        self.peak_rss = self.start_rss
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
 
-# Debug: Check encoded features
-for col in ['Region', 'Soil_Type', 'Weather_Condition']:
-    print(f"\nUnique values in {col} after encoding:")
-    print(data[col].unique())
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        rss = current_rss_bytes()
+        if rss is not None:
+            self.peak_rss = max(self.peak_rss or 0, rss)
 
-# Prepare features and targets
-X = data[['Region', 'Soil_Type', 'Rainfall_mm', 'Temperature_Celsius', 'Fertilizer_Used', 'Irrigation_Used', 'Weather_Condition']]
+def format_mb(value):
+    return f"{value / (1024 * 1024):.1f} MB" if value is not None else "n/a"
 
-# Crop Recommendation Model
-y_crop = data['Crop']
-X_train_crop, X_test_crop, y_train_crop, y_test_crop = train_test_split(X, y_crop, test_size=0.2, random_state=42)
+def train_model(name, estimator, X_train, y_train, X_test, y_test):
+    """
+    Fit one model and report its wall time, peak memory and held-out score.
 
-crop_model = RandomForestClassifier(random_state=42)
+    Returns:
+        tuple: (fitted estimator, report dict)
+    """
+    print(f"Training {name} model on {len(X_train)} rows...")
+    started = time.perf_counter()
+    with MemoryMonitor() as memory:
+        estimator.fit(X_train, y_train)
+    wall_time = time.perf_counter() - started
 
-# Debug: Starting crop recommendation model training
-print("Training crop recommendation model...")
-crop_model.fit(X_train_crop, y_train_crop)
-print("Crop recommendation model trained successfully.")
+    report = {
+        'model': name,
+        'train_rows': len(X_train),
+        'test_rows': len(X_test),
+        'wall_time_seconds': round(wall_time, 2),
+        'peak_rss_bytes': memory.peak_rss,
+        'rss_growth_bytes': (memory.peak_rss - memory.start_rss) if memory.peak_rss and memory.start_rss else None,
+        'test_score': round(float(estimator.score(X_test, y_test)), 4),
+        'tree_nodes': int(sum(tree.tree_.node_count for tree in estimator.estimators_))
+    }
+    score_name = 'accuracy' if hasattr(estimator, 'classes_') else 'R²'
+    print(f"✓ {name}: {report['wall_time_seconds']}s, peak RSS {format_mb(report['peak_rss_bytes'])} "
+          f"(+{format_mb(report['rss_growth_bytes'])}), test {score_name} {report['test_score']}, "
+          f"{report['tree_nodes']} tree nodes")
+    return estimator, report
 
-# Debug: Check training and testing dataset shapes
-print("\nTraining and Testing Dataset Shapes:")
-print(f"Crop Recommendation: X_train: {X_train_crop.shape}, X_test: {X_test_crop.shape}")
+def forest_params(args):
+    """Shared RandomForest hyperparameters from the command line."""
+    return {
+        'n_estimators': args.n_estimators,
+        'max_depth': args.max_depth,
+        'min_samples_leaf': args.min_samples_leaf,
+        'max_samples': args.max_samples,
+        'n_jobs': args.n_jobs,
+        'random_state': args.seed
+    }
 
-# Save the crop recommendation model
-joblib.dump(crop_model, 'crop_recommendation_model.pkl')
+def add_forest_arguments(parser):
+    """Dataset, split and forest-size options shared by the training CLIs."""
+    parser.add_argument('--data', default=os.path.join(ML_DIR, 'crop_yield.csv'), help='Path to crop_yield.csv')
+    parser.add_argument('--models-dir', default=os.path.join(ML_DIR, 'models'), help='Where versioned bundles are published')
+    parser.add_argument('--version', help='Bundle version name (defaults to a timestamp)')
+    parser.add_argument('--sample', type=int, help='Train on a random sample of N rows instead of the full dataset')
+    parser.add_argument('--test-size', type=float, default=0.2, help='Held-out fraction shared by all models')
+    parser.add_argument('--n-estimators', type=int, default=100, help='Trees per forest')
+    parser.add_argument('--max-depth', type=int, help='Maximum tree depth (bounds model size)')
+    parser.add_argument('--min-samples-leaf', type=int, default=1, help='Minimum samples per leaf (bounds model size)')
+    parser.add_argument('--max-samples', type=float, help='Fraction of rows bootstrapped per tree (bounds memory)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--no-publish', action='store_true', help='Do not make the new bundle current')
+    parser.add_argument('--compact', action='store_true', help='Shrink the memory-mapped compiled forests (exact)')
 
-# Harvest Time Prediction Model
-y_harvest = data['Days_to_Harvest']
-X_train_harvest, X_test_harvest, y_train_harvest, y_test_harvest = train_test_split(X, y_harvest, test_size=0.2, random_state=42)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Train the Agrovia crop models')
+    add_forest_arguments(parser)
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Parallel jobs per forest (-1 = all cores)')
+    parser.add_argument('--legacy-files', action='store_true', help='Also write the flat *.pkl files next to this script')
+    return parser.parse_args(argv)
 
-harvest_model = RandomForestRegressor(random_state=42)
+def main(argv=None):
+    args = parse_args(argv)
+    total_started = time.perf_counter()
 
-# Debug: Starting harvest time prediction model training
-print("Training harvest time prediction model...")
-harvest_model.fit(X_train_harvest, y_train_harvest)
-print("Harvest time prediction model trained successfully.")
+    print(f"Loading dataset from {args.data}...")
+    data = load_dataset(args.data, sample=args.sample, seed=args.seed)
+    print(f"✓ Loaded {len(data)} records ({format_mb(data.memory_usage(deep=True).sum())} in memory)")
 
-# Debug: Check training and testing dataset shapes
-print(f"Harvest Time: X_train: {X_train_harvest.shape}, X_test: {X_test_harvest.shape}")
+    X, X_with_crop, label_encoders = encode_features(data)
 
-# Save the harvest time prediction model
-joblib.dump(harvest_model, 'harvest_time_model.pkl')
+    # One split shared by every model
+    train_index, test_index = train_test_split(np.arange(len(data)), test_size=args.test_size, random_state=args.seed)
 
-# Yield Prediction Model
-y_yield = data['Yield_tons_per_hectare']
-X_train_yield, X_test_yield, y_train_yield, y_test_yield = train_test_split(X, y_yield, test_size=0.2, random_state=42)
+    targets = {
+        'crop': data['Crop'].astype(str).to_numpy(),
+        'harvest': data['Days_to_Harvest'].to_numpy(),
+        'yield': data['Yield_tons_per_hectare'].to_numpy()
+    }
+    params = forest_params(args)
 
-yield_model = RandomForestRegressor(random_state=42)
+    crop_model, crop_report = train_model(
+        'crop recommendation', RandomForestClassifier(**params),
+        X.iloc[train_index], targets['crop'][train_index],
+        X.iloc[test_index], targets['crop'][test_index]
+    )
+    harvest_model, harvest_report = train_model(
+        'harvest time', RandomForestRegressor(**params),
+        X_with_crop.iloc[train_index], targets['harvest'][train_index],
+        X_with_crop.iloc[test_index], targets['harvest'][test_index]
+    )
+    yield_model, yield_report = train_model(
+        'yield prediction', RandomForestRegressor(**params),
+        X_with_crop.iloc[train_index], targets['yield'][train_index],
+        X_with_crop.iloc[test_index], targets['yield'][test_index]
+    )
 
-# Debug: Starting yield prediction model training
-print("Training yield prediction model...")
-yield_model.fit(X_train_yield, y_train_yield)
-print("Yield prediction model trained successfully.")
+    # Publish the models as a new versioned bundle; running services pick it
+    # up through the model registry without a restart
+    version = save_bundle(args.models_dir, crop_model, yield_model, harvest_model, label_encoders,
+                          version=args.version, make_current=not args.no_publish, compact=args.compact)
+    print(f"✓ Saved model bundle {version} to {os.path.join(args.models_dir, version)}"
+          f"{'' if args.no_publish else ' (now current)'}")
 
-# Debug: Check training and testing dataset shapes
-print(f"Yield Prediction: X_train: {X_train_yield.shape}, X_test: {X_test_yield.shape}")
+    if args.legacy_files:
+        artifacts = {
+            'crop_model': crop_model,
+            'yield_model': yield_model,
+            'harvest_model': harvest_model,
+            'label_encoders': label_encoders
+        }
+        for name, file_name in MODEL_FILES.items():
+            joblib.dump(artifacts[name], os.path.join(ML_DIR, file_name))
+        print("✓ Wrote legacy model files")
 
-# Save the yield prediction model
-joblib.dump(yield_model, 'yield_prediction_model.pkl')
+    print(f"\nTotal wall time {time.perf_counter() - total_started:.1f}s")
+    for report in (crop_report, harvest_report, yield_report):
+        print(f"   {report['model']:<20} {report['wall_time_seconds']:>8}s   peak RSS {format_mb(report['peak_rss_bytes'])}")
 
-# Save label encoders
-joblib.dump(label_encoders, 'label_encoders.pkl')
+    return version
 
-print("Models and encoders saved successfully!")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""
+Train every model of a bundle at the same time in a process pool.
+
+The encoded feature matrix, targets and train/test split are written once
+into shared memory; every worker maps the same pages instead of receiving
+its own pickled copy of the data. Rows are stored train-first, in split
+order, so a worker's training set is a zero-copy slice of the shared matrix
+and the fitted models are identical to the ones ``train_models.py`` produces
+with the same seed.
+
+Jobs are submitted largest first so total wall time approaches the slowest
+single model. Each worker writes its artifact straight into the new bundle
+directory, and ``manifest.json`` in that directory is rewritten as jobs
+finish with their status, timings, memory and artifact paths. The bundle is
+only made current once every job has succeeded.
+
+Usage:
+    python -m ml.train_parallel [--data crop_yield.csv] [--workers 3] [--per-crop-models]
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.model_selection import train_test_split
+
+from .model_registry import (COMPILED_DIR, MODEL_FILES, export_compiled_model, new_version_name,
+                             set_current_version)
+from .train_models import (FEATURE_COLUMNS, MemoryMonitor, add_forest_arguments, encode_features,
+                           forest_params, format_mb, load_dataset)
+
+MANIFEST_FILE = 'manifest.json'
+
+# Per-crop variants are written under this directory of the bundle
+PER_CROP_DIR = 'per_crop'
+
+# Columns of the shared feature matrix; the crop classifier uses the first
+# len(FEATURE_COLUMNS), the crop-conditioned regressors use all of them
+SHARED_COLUMNS = FEATURE_COLUMNS + ['Crop']
+
+class SharedArrays:
+    """
+    A set of NumPy arrays backed by named shared memory blocks.
+
+    The creating process owns the blocks and unlinks them on ``close``;
+    workers ``attach`` by the picklable ``spec`` and only close their mapping.
+    """
+
+    def __init__(self, blocks, arrays, owner):
+        self._blocks = blocks
+        self.arrays = arrays
+        self.owner = owner
+
+    @classmethod
+    def create(cls, arrays):
+        blocks, shared = {}, {}
+        try:
+            for name, array in arrays.items():
+                block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                blocks[name] = block
+                shared[name] = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+                shared[name][...] = array
+        except Exception:
+            cls(blocks, shared, owner=True).close()
+            raise
+        return cls(blocks, shared, owner=True)
+
+    @classmethod
+    def attach(cls, spec):
+        blocks, arrays = {}, {}
+        for name, (block_name, shape, dtype) in spec.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            blocks[name] = block
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        return cls(blocks, arrays, owner=False)
+
+    @property
+    def spec(self):
+        return {
+            name: (self._blocks[name].name, array.shape, array.dtype.str)
+            for name, array in self.arrays.items()
+        }
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def close(self):
+        # Views must be dropped before the mapping can be closed
+        self.arrays = {}
+        for block in self._blocks.values():
+            block.close()
+            if self.owner:
+                block.unlink()
+        self._blocks = {}
+
+def share_training_data(data, test_size, seed):
+    """
+    Encode the dataset and copy it into shared memory, rows reordered so the
+    training rows come first in split order.
+
+    Returns:
+        tuple: (SharedArrays, label encoders, number of training rows)
+    """
+    _, X_with_crop, label_encoders = encode_features(data)
+    train_index, test_index = train_test_split(np.arange(len(data)), test_size=test_size, random_state=seed)
+    order = np.concatenate([train_index, test_index])
+
+    shared = SharedArrays.create({
+        'features': X_with_crop[SHARED_COLUMNS].to_numpy(dtype=np.float32)[order],
+        'harvest': data['Days_to_Harvest'].to_numpy()[order],
+        'yield': data['Yield_tons_per_hectare'].to_numpy()[order]
+    })
+    return shared, label_encoders, len(train_index)
+
+def training_jobs(crops, per_crop_models=False):
+    """
+    The models to fit, largest first so the pool finishes as early as possible.
+
+    Each job names its estimator, target, feature columns, optional crop
+    filter, the artifact path relative to the bundle directory and, for the
+    bundle's served models, the name of its compiled form.
+    """
+    jobs = [
+        {'name': 'crop recommendation', 'kind': 'classifier', 'target': 'crop', 'columns': FEATURE_COLUMNS,
+         'crop': None, 'artifact': MODEL_FILES['crop_model'], 'compiled': 'crop_model'},
+        {'name': 'harvest time', 'kind': 'regressor', 'target': 'harvest', 'columns': SHARED_COLUMNS,
+         'crop': None, 'artifact': MODEL_FILES['harvest_model'], 'compiled': 'harvest_model'},
+        {'name': 'yield prediction', 'kind': 'regressor', 'target': 'yield', 'columns': SHARED_COLUMNS,
+         'crop': None, 'artifact': MODEL_FILES['yield_model'], 'compiled': 'yield_model'}
+    ]
+    if per_crop_models:
+        for code, crop in enumerate(crops):
+            for target, file_prefix in (('harvest', 'harvest_time_model'), ('yield', 'yield_prediction_model')):
+                jobs.append({
+                    'name': f"{target} ({crop})", 'kind': 'regressor', 'target': target,
+                    'columns': FEATURE_COLUMNS, 'crop': code, 'compiled': None,
+                    'artifact': os.path.join(PER_CROP_DIR, f"{file_prefix}_{crop.lower()}.pkl")
+                })
+    return jobs
+
+def _fit_job(job, spec, n_train, crops, params, bundle_dir, compact=False):
+    """
+    Fit one model in a worker process from the shared arrays and save it.
+
+    Returns:
+        dict: The job's manifest entry
+    """
+    started_at = datetime.now().isoformat(timespec='seconds')
+    started = time.perf_counter()
+    shared = SharedArrays.attach(spec)
+    try:
+        features = shared.arrays['features']
+        n_columns = len(job['columns'])
+
+        if job['target'] == 'crop':
+            labels = np.asarray(crops, dtype=object)
+            target = labels[features[:, SHARED_COLUMNS.index('Crop')].astype(np.intp)]
+        else:
+            target = shared.arrays[job['target']]
+
+        # Zero-copy views of the shared pages unless a crop filter applies
+        X_train, X_test = features[:n_train, :n_columns], features[n_train:, :n_columns]
+        y_train, y_test = target[:n_train], target[n_train:]
+        if job['crop'] is not None:
+            crop_column = features[:, SHARED_COLUMNS.index('Crop')]
+            in_train = crop_column[:n_train] == job['crop']
+            in_test = crop_column[n_train:] == job['crop']
+            X_train, y_train = X_train[in_train], y_train[in_train]
+            X_test, y_test = X_test[in_test], y_test[in_test]
+
+        # DataFrames keep feature names on the model, as the registry expects
+        X_train = pd.DataFrame(X_train, columns=job['columns'], copy=False)
+        X_test = pd.DataFrame(X_test, columns=job['columns'], copy=False)
+
+        estimator_class = RandomForestClassifier if job['kind'] == 'classifier' else RandomForestRegressor
+        estimator = estimator_class(**params)
+        with MemoryMonitor() as memory:
+            estimator.fit(X_train, y_train)
+        fit_seconds = time.perf_counter() - started
+        test_score = float(estimator.score(X_test, y_test)) if len(X_test) else None
+        train_rows, test_rows = len(X_train), len(X_test)
+
+        artifact_path = os.path.join(bundle_dir, job['artifact'])
+        os.makedirs(os.path.dirname(artifact_path), exist_ok=True)
+        joblib.dump(estimator, artifact_path)
+        artifact_bytes = os.path.getsize(artifact_path)
+        if job['compiled']:
+            export_compiled_model(bundle_dir, job['compiled'], estimator, compact=compact)
+        tree_nodes = int(sum(tree.tree_.node_count for tree in estimator.estimators_))
+        del estimator, X_train, X_test, y_train, y_test, target, features
+    finally:
+        shared.close()
+
+    return {
+        'name': job['name'],
+        'status': 'done',
+        'worker_pid': os.getpid(),
+        'started_at': started_at,
+        'finished_at': datetime.now().isoformat(timespec='seconds'),
+        'fit_seconds': round(fit_seconds, 2),
+        'wall_time_seconds': round(time.perf_counter() - started, 2),
+        'peak_rss_bytes': memory.peak_rss,
+        'rss_growth_bytes': (memory.peak_rss - memory.start_rss) if memory.peak_rss and memory.start_rss else None,
+        'train_rows': train_rows,
+        'test_rows': test_rows,
+        'test_score': round(test_score, 4) if test_score is not None else None,
+        'tree_nodes': tree_nodes,
+        'artifact': job['artifact'],
+        'artifact_bytes': artifact_bytes,
+        'compiled_artifact': os.path.join(COMPILED_DIR, job['compiled']) if job['compiled'] else None
+    }
+
+def write_manifest(path, manifest):
+    """Replace the manifest atomically so readers never see a partial file."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, path)
+
+def default_workers(n_jobs_total):
+    return max(1, min(n_jobs_total, os.cpu_count() or 1))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Train the Agrovia crop models in parallel')
+    add_forest_arguments(parser)
+    parser.add_argument('--workers', type=int, help='Worker processes (defaults to one per model, up to the core count)')
+    parser.add_argument('--n-jobs', type=int, help='Threads per forest (defaults to cores divided by workers)')
+    parser.add_argument('--per-crop-models', action='store_true', help='Also fit harvest and yield regressors for each crop')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    total_started = time.perf_counter()
+
+    print(f"Loading dataset from {args.data}...")
+    data = load_dataset(args.data, sample=args.sample, seed=args.seed)
+    print(f"✓ Loaded {len(data)} records")
+
+    shared, label_encoders, n_train = share_training_data(data, args.test_size, args.seed)
+    # The workers only need the shared copy
+    del data
+    crops = [str(crop) for crop in label_encoders['Crop'].classes_]
+
+    try:
+        jobs = training_jobs(crops, per_crop_models=args.per_crop_models)
+        workers = args.workers or default_workers(len(jobs))
+        args.n_jobs = args.n_jobs or max(1, (os.cpu_count() or 1) // workers)
+        params = forest_params(args)
+        print(f"✓ Shared {format_mb(shared.nbytes)} of training data; fitting {len(jobs)} models "
+              f"on {workers} workers × {args.n_jobs} threads")
+
+        version = args.version or new_version_name()
+        bundle_dir = os.path.join(args.models_dir, version)
+        os.makedirs(bundle_dir, exist_ok=True)
+        joblib.dump(label_encoders, os.path.join(bundle_dir, MODEL_FILES['label_encoders']))
+
+        manifest_path = os.path.join(bundle_dir, MANIFEST_FILE)
+        manifest = {
+            'version': version,
+            'status': 'running',
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'data': os.path.abspath(args.data),
+            'train_rows': n_train,
+            'test_rows': int(len(shared.arrays['harvest']) - n_train),
+            'workers': workers,
+            'params': params,
+            'compact': args.compact,
+            'jobs': {job['name']: {'status': 'queued', 'artifact': job['artifact']} for job in jobs}
+        }
+        write_manifest(manifest_path, manifest)
+
+        failures = []
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+            futures = {
+                pool.submit(_fit_job, job, shared.spec, n_train, crops, params, bundle_dir, args.compact): job
+                for job in jobs
+            }
+            for completed, future in enumerate(as_completed(futures), start=1):
+                job = futures[future]
+                try:
+                    entry = future.result()
+                    print(f"[{completed}/{len(jobs)}] ✓ {job['name']}: {entry['fit_seconds']}s, "
+                          f"peak RSS {format_mb(entry['peak_rss_bytes'])}, test score {entry['test_score']}")
+                except Exception as e:
+                    entry = {'name': job['name'], 'status': 'failed', 'error': str(e), 'artifact': job['artifact']}
+                    failures.append(job['name'])
+                    print(f"[{completed}/{len(jobs)}] ✗ {job['name']} failed: {e}")
+                manifest['jobs'][job['name']] = entry
+                write_manifest(manifest_path, manifest)
+    finally:
+        shared.close()
+
+    total_seconds = time.perf_counter() - total_started
+    manifest['status'] = 'failed' if failures else 'done'
+    manifest['finished_at'] = datetime.now().isoformat(timespec='seconds')
+    manifest['wall_time_seconds'] = round(total_seconds, 2)
+    manifest['sum_of_fit_seconds'] = round(sum(entry.get('fit_seconds', 0) for entry in manifest['jobs'].values()), 2)
+    write_manifest(manifest_path, manifest)
+
+    if failures:
+        print(f"\n✗ {len(failures)} model(s) failed; bundle {version} was not published")
+        return None
+
+    # Every artifact is on disk, so the bundle is complete before CURRENT moves
+    if not args.no_publish:
+        set_current_version(args.models_dir, version)
+    print(f"✓ Saved model bundle {version} to {bundle_dir}{'' if args.no_publish else ' (now current)'}")
+    print(f"\nTotal wall time {total_seconds:.1f}s "
+          f"(sum of model fits {manifest['sum_of_fit_seconds']}s); manifest at {manifest_path}")
+    return version
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Fan-out of admin actions to every serve.py worker.
+
+Under the prefork server each worker holds its own model bundle, response
+cache and profiler, so an admin request only reaches the worker that
+accepted it. Actions that change that state go through ``WorkerBroadcast``:
+the accepting worker applies the action, appends it to a log file shared by
+all processes and sends SIGUSR1 to the parent, which forwards the signal to
+every worker and replays the action itself (so workers forked later, on a
+restart or after a crash, inherit it). Each process remembers how far into
+the log it has got and replays new entries in order.
+
+Without a log file (the development server, a single process) actions are
+simply applied in place.
+"""
+
+import fcntl
+import json
+import os
+import signal
+import threading
+
+class WorkerBroadcast:
+    """Applies registered admin actions locally and, under prefork, in every process."""
+
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self._handlers = {}
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.log_path is not None
+
+    def register(self, action, handler):
+        """Register ``handler(params)`` as the way to apply ``action``."""
+        self._handlers[action] = handler
+
+    def run(self, action, params=None):
+        """
+        Apply an action here and, if it succeeds, in every other process.
+
+        Entries other processes logged earlier are replayed first, so every
+        process sees the actions in the same order. An action that raises
+        is not broadcast.
+
+        Returns:
+            object: What the action's handler returned
+        """
+        params = params or {}
+        if not self.enabled:
+            return self._handlers[action](params)
+
+        with self._lock, open(self.log_path, 'a+', encoding='utf-8') as log:
+            fcntl.flock(log, fcntl.LOCK_EX)
+            try:
+                self._replay(log)
+                result = self._handlers[action](params)
+                log.seek(0, os.SEEK_END)
+                log.write(json.dumps({"action": action, "params": params, "pid": os.getpid()}) + '\n')
+                log.flush()
+                self._offset = log.tell()
+            finally:
+                fcntl.flock(log, fcntl.LOCK_UN)
+
+        try:
+            os.kill(os.getppid(), signal.SIGUSR1)
+        except ProcessLookupError:
+            pass
+        return result
+
+    def catch_up(self):
+        """Replay the actions other processes logged since the last call."""
+        if not self.enabled:
+            return
+        with self._lock, open(self.log_path, 'a+', encoding='utf-8') as log:
+            fcntl.flock(log, fcntl.LOCK_SH)
+            try:
+                self._replay(log)
+            finally:
+                fcntl.flock(log, fcntl.LOCK_UN)
+
+    def _replay(self, log):
+        log.seek(self._offset)
+        for line in iter(log.readline, ''):
+            if not line.endswith('\n'):
+                break
+            self._offset = log.tell()
+            entry = json.loads(line)
+            handler = self._handlers.get(entry['action'])
+            if handler is None:
+                continue
+            try:
+                handler(entry['params'])
+            except Exception as e:
+                print(f"⚠️ Could not apply broadcast {entry['action']} in process {os.getpid()}: {e}")
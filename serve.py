@@ -0,0 +1,367 @@
+"""
+Production launcher for the Agrovia API.
+
+The parent process imports the app once, which loads the data insights and
+the current model bundle, then forks worker processes that share that state
+copy-on-write. Each worker serves requests from the inherited listening
+socket with a fixed pool of threads. Per-process background threads (the
+model watcher) are only started in the workers, after fork.
+
+Admin actions that change per-process state (model reload, cache clear,
+profiling) are applied by the worker that receives them and then broadcast:
+that worker signals the parent with SIGUSR1 and the parent replays the
+action and forwards the signal to every worker (see ml/worker_broadcast.py).
+Workers also share a metrics snapshot directory, so a /metrics scrape of any
+worker reports the whole server (see ml/metrics.py).
+
+Signals sent to the parent:
+    SIGHUP           graceful restart: pick up a newly published model bundle,
+                     start fresh workers, then let the old ones finish their
+                     in-flight requests and exit
+    SIGTERM, SIGINT  graceful shutdown
+    SIGTTIN, SIGTTOU add or remove one worker
+    SIGUSR1          sent by a worker: broadcast its latest admin action
+
+Usage:
+    python serve.py [--bind 0.0.0.0:5000 | --bind unix:/run/agrovia.sock] [--workers 4] [--threads 8]
+"""
+
+import argparse
+import gc
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# Tell app.py to leave background threads to the workers; threads running in
+# the parent at fork time would not exist in the children
+os.environ['AGROVIA_PREFORK'] = '1'
+
+class RequestHandler(WSGIRequestHandler):
+    # One request per connection, so an idle keep-alive client never holds
+    # one of the worker's pool threads
+    protocol_version = 'HTTP/1.0'
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    Werkzeug WSGI server that handles requests on a fixed thread pool.
+
+    The accept loop blocks while every thread is busy, leaving new
+    connections on the shared socket for other workers to pick up.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd):
+        super().__init__(host, port, app, handler=RequestHandler, fd=fd)
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+        self._slots = threading.BoundedSemaphore(threads)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            self._pool.submit(self._process_request_thread, request, client_address)
+        except RuntimeError:
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def drain(self):
+        """Wait for in-flight requests after the accept loop has stopped."""
+        self._pool.shutdown(wait=True)
+
+def parse_bind(bind):
+    """
+    Turn a --bind value into werkzeug's (host, port) form.
+
+    Accepts ``host:port``, ``:port`` and ``unix:/path/to.sock``.
+    """
+    if bind.startswith('unix:'):
+        return f"unix://{bind[len('unix:'):]}", 0
+    host, _, port = bind.rpartition(':')
+    if not port.isdigit():
+        raise ValueError(f"Invalid bind address '{bind}' (expected host:port or unix:/path)")
+    return host.strip('[]') or '0.0.0.0', int(port)
+
+def create_listener(host, port, backlog):
+    """Bind the listening socket the workers will share."""
+    if host.startswith('unix://'):
+        path = host[len('unix://'):]
+        if os.path.exists(path):
+            os.unlink(path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+    else:
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        listener = socket.socket(family, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host, port))
+    listener.listen(backlog)
+    listener.set_inheritable(True)
+    return listener
+
+def create_run_dir():
+    """
+    Create the files the workers share: the log of broadcast admin actions
+    and the per-worker metrics snapshots. Must run before app is imported.
+
+    Returns:
+        str: The run directory, removed again on shutdown
+    """
+    run_dir = tempfile.mkdtemp(prefix='agrovia-')
+    os.environ['AGROVIA_BROADCAST_LOG'] = os.path.join(run_dir, 'admin-actions.log')
+    os.environ['AGROVIA_METRICS_DIR'] = os.path.join(run_dir, 'metrics')
+    os.mkdir(os.environ['AGROVIA_METRICS_DIR'])
+    return run_dir
+
+def preload():
+    """
+    Import the app and load the shared state before any worker is forked.
+
+    Returns:
+        module: The imported app module
+    """
+    import app as app_module
+    from ml.recommendation import get_farm_index, model_registry
+
+    bundle = model_registry.get()
+    print(f"✓ Preloaded model bundle {bundle.version}" if bundle else
+          "⚠️ No model bundle could be loaded; workers will serve mock recommendations")
+    if get_farm_index() is not None:
+        print("✓ Preloaded farm similarity index")
+    return app_module
+
+def run_worker(app_module, listener, host, port, threads, graceful_timeout):
+    """Body of a forked worker process; never returns."""
+    from ml.metrics import METRICS_DIR, metrics
+
+    for signum in (signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+        signal.signal(signum, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    server = PooledWSGIServer(host, port, app_module.app, threads, listener.fileno())
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever, which runs on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    def catch_up(signum, frame):
+        # Replaying may reload a model bundle; keep it off the accept loop
+        threading.Thread(target=app_module.admin_broadcast.catch_up, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGUSR1, catch_up)
+    app_module.start_background_tasks()
+
+    exit_code = 0
+    try:
+        server.serve_forever()
+    except Exception as e:
+        print(f"Worker {os.getpid()} failed: {e}", file=sys.stderr)
+        exit_code = 1
+
+    # Let in-flight requests finish, but never hang a restart
+    watchdog = threading.Timer(graceful_timeout, os._exit, args=(exit_code,))
+    watchdog.daemon = True
+    watchdog.start()
+    server.drain()
+    # Keep what was counted since the last periodic snapshot
+    metrics.write_snapshot(METRICS_DIR)
+    os._exit(exit_code)
+
+class Arbiter:
+    """Forks, supervises and replaces the worker processes."""
+
+    def __init__(self, app_module, listener, host, port, workers, threads, graceful_timeout):
+        self.app_module = app_module
+        self.listener = listener
+        self.host = host
+        self.port = port
+        self.num_workers = workers
+        self.threads = threads
+        self.graceful_timeout = graceful_timeout
+        self.workers = {}
+        self._signals = []
+
+    def spawn_worker(self):
+        # Move everything loaded so far out of the collector's reach, so a
+        # collection in a worker does not touch (and copy) shared pages
+        gc.collect()
+        gc.freeze()
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(self.app_module, self.listener, self.host, self.port,
+                           self.threads, self.graceful_timeout)
+            finally:
+                os._exit(1)
+        self.workers[pid] = time.monotonic()
+        return pid
+
+    def spawn_workers(self):
+        while len(self.workers) < self.num_workers:
+            self.spawn_worker()
+
+    def stop_workers(self, pids):
+        self.signal_workers(pids, signal.SIGTERM)
+
+    def signal_workers(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def reap_workers(self):
+        """Collect exited workers; returns how many exited unexpectedly soon."""
+        from ml.metrics import METRICS_DIR, retire_snapshot
+
+        crashed = 0
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            started = self.workers.pop(pid, None)
+            if started is not None:
+                retire_snapshot(METRICS_DIR, pid)
+                code = os.waitstatus_to_exitcode(status)
+                print(f"Worker {pid} exited with status {code}", file=sys.stderr)
+                if time.monotonic() - started < 1.0:
+                    crashed += 1
+        return crashed
+
+    def wait_for_workers(self, pids, timeout):
+        """Wait up to ``timeout`` seconds for the given workers to exit, then kill them."""
+        pids = set(pids)
+        deadline = time.monotonic() + timeout
+        while pids & set(self.workers) and time.monotonic() < deadline:
+            self.reap_workers()
+            time.sleep(0.1)
+        for pid in pids & set(self.workers):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        while pids & set(self.workers):
+            self.reap_workers()
+            time.sleep(0.05)
+
+    def restart(self):
+        """Graceful restart: reload shared state, then replace every worker."""
+        from ml.recommendation import model_registry
+
+        if model_registry.check_for_update():
+            print(f"✓ Model bundle {model_registry.get().version} loaded for new workers")
+
+        old_workers = list(self.workers)
+        for _ in range(self.num_workers):
+            self.spawn_worker()
+        self.stop_workers(old_workers)
+        self.wait_for_workers(old_workers, self.graceful_timeout)
+        print(f"✓ Replaced {len(old_workers)} workers")
+
+    def broadcast(self):
+        """Forward a worker's admin action to every worker and apply it here for future workers."""
+        self.signal_workers(list(self.workers), signal.SIGUSR1)
+        self.app_module.admin_broadcast.catch_up()
+
+    def _queue_signal(self, signum, frame):
+        self._signals.append(signum)
+
+    def run(self):
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGTTIN, signal.SIGTTOU, signal.SIGUSR1):
+            signal.signal(signum, self._queue_signal)
+
+        self.spawn_workers()
+        print(f"✓ Serving on {self.describe_address()} with {self.num_workers} workers × {self.threads} threads "
+              f"(master pid {os.getpid()})")
+
+        while True:
+            while self._signals:
+                signum = self._signals.pop(0)
+                if signum in (signal.SIGTERM, signal.SIGINT):
+                    self.shutdown()
+                    return
+                if signum == signal.SIGHUP:
+                    self.restart()
+                elif signum == signal.SIGUSR1:
+                    self.broadcast()
+                elif signum == signal.SIGTTIN:
+                    self.num_workers += 1
+                elif signum == signal.SIGTTOU and self.num_workers > 1:
+                    self.num_workers -= 1
+                    self.stop_workers(list(self.workers)[:1])
+
+            if self.reap_workers():
+                # Workers dying on start-up would otherwise be respawned in a tight loop
+                time.sleep(1.0)
+            self.spawn_workers()
+            time.sleep(0.2)
+
+    def shutdown(self):
+        print("Shutting down workers...")
+        workers = list(self.workers)
+        self.stop_workers(workers)
+        self.wait_for_workers(workers, self.graceful_timeout)
+        self.listener.close()
+        if self.host.startswith('unix://'):
+            try:
+                os.unlink(self.host[len('unix://'):])
+            except FileNotFoundError:
+                pass
+
+    def describe_address(self):
+        if self.host.startswith('unix://'):
+            return self.host
+        host, port = self.listener.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the Agrovia API with preloaded, forked workers')
+    parser.add_argument('--bind', default=os.environ.get('AGROVIA_BIND', '127.0.0.1:5000'),
+                        help='host:port or unix:/path/to.sock')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('AGROVIA_WORKERS', os.cpu_count() or 1)),
+                        help='Worker processes')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('AGROVIA_THREADS', '4')),
+                        help='Request threads per worker')
+    parser.add_argument('--backlog', type=int, default=2048, help='Listen backlog of the shared socket')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help='Seconds a stopping worker gets to finish in-flight requests')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    host, port = parse_bind(args.bind)
+
+    # Bind first so a bad address fails before the slow preload
+    listener = create_listener(host, port, args.backlog)
+
+    run_dir = create_run_dir()
+    try:
+        app_module = preload()
+        Arbiter(app_module, listener, host, port, max(1, args.workers), max(1, args.threads),
+                args.graceful_timeout).run()
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
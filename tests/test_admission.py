@@ -0,0 +1,74 @@
+"""
+Admission control, on its own and in front of /recommend: requests over
+capacity are shed with a degraded answer instead of queuing.
+"""
+
+import threading
+
+import pytest
+
+from ml.admission import DEADLINE, QUEUE_FULL, AdmissionController
+
+FARM = {
+    'region': 'North', 'soilType': 'Loam', 'rainfall': 600, 'temperature': 27,
+    'fertilizerUsed': 'true', 'irrigationUsed': 'false', 'weatherCondition': 'Sunny', 'daysToHarvest': 100
+}
+
+def test_admits_up_to_the_limit():
+    admission = AdmissionController(max_in_flight=2, max_queued=0)
+    assert admission.acquire(0) is None
+    assert admission.acquire(0) is None
+    assert admission.acquire(0) == QUEUE_FULL
+
+    admission.release()
+    assert admission.acquire(0) is None
+    assert admission.stats()['shed'] == {QUEUE_FULL: 1, DEADLINE: 0}
+
+def test_queued_request_gives_up_at_its_deadline():
+    admission = AdmissionController(max_in_flight=1, max_queued=1)
+    admission.acquire(0)
+    assert admission.acquire(0.02) == DEADLINE
+    assert admission.stats()['waiting'] == 0
+
+def test_queued_request_gets_a_released_slot():
+    admission = AdmissionController(max_in_flight=1, max_queued=1)
+    admission.acquire(0)
+    threading.Timer(0.02, admission.release).start()
+    assert admission.acquire(5) is None
+    assert admission.stats()['in_flight'] == 1
+
+def test_zero_in_flight_disables_admission_control():
+    assert not AdmissionController(max_in_flight=0).enabled
+
+@pytest.fixture
+def full_server(monkeypatch):
+    import app
+
+    # One slot, already taken, and no queue: every request is over capacity
+    admission = AdmissionController(max_in_flight=1, max_queued=0)
+    admission.acquire(0)
+    monkeypatch.setattr(app, 'admission', admission)
+    return app.app.test_client()
+
+def test_recommend_over_capacity_is_degraded(full_server):
+    response = full_server.post('/recommend', json=FARM)
+
+    assert response.status_code == 200
+    assert response.headers['X-Degraded'] == QUEUE_FULL
+    assert 'X-Model-Version' not in response.headers
+    recommendations = response.get_json()
+    assert recommendations and all('name' in crop for crop in recommendations)
+
+def test_batch_over_capacity_is_degraded(full_server):
+    response = full_server.post('/recommend/batch', json={'farms': [FARM, 'not a farm']})
+
+    assert response.headers['X-Degraded'] == QUEUE_FULL
+    body = response.get_json()
+    assert body['degraded'] is True
+    assert 'recommendations' in body['results'][0]
+    assert 'error' in body['results'][1]
+
+def test_similar_farms_over_capacity_is_refused(full_server):
+    response = full_server.post('/similar-farms', json=FARM)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
@@ -0,0 +1,101 @@
+"""
+Parity of the vectorized analyze_crop_data with the original per-crop
+implementation (kept in benchmarks/analyzer_parity.py).
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.analyzer_parity import reference_analyze_crop_data, reference_analyze_crop_frame
+from benchmarks.generate_dataset import generate_frame
+from ml.data_analyzer import CATEGORY_COLUMNS, analyze_crop_data, analyze_crop_frame
+
+def as_categories(frame):
+    return frame.astype({column: 'category' for column in CATEGORY_COLUMNS})
+
+def is_integer(value):
+    return isinstance(value, (int, np.integer))
+
+def assert_same_insights(expected, actual):
+    assert list(expected) == list(actual)
+    for crop, fields in expected.items():
+        assert fields.keys() == actual[crop].keys(), crop
+        for key, value in fields.items():
+            other = actual[crop][key]
+            if isinstance(value, float) and math.isnan(value):
+                assert isinstance(other, float) and math.isnan(other), f"{crop}.{key}: {other!r}"
+            else:
+                # Integers stay integers, so the JSON artifact renders 60 and not 60.0
+                assert value == other and is_integer(value) == is_integer(other), \
+                    f"{crop}.{key}: reference={value!r} vectorized={other!r}"
+
+@pytest.fixture
+def frame():
+    return generate_frame(600, seed=7)
+
+def test_generated_frame(frame):
+    assert_same_insights(reference_analyze_crop_frame(frame), analyze_crop_frame(as_categories(frame)))
+
+def blank_cells(frame, columns, seed=3):
+    rng = np.random.default_rng(seed)
+    frame = frame.astype({column: object for column in columns if frame[column].dtype == bool})
+    for column in columns:
+        frame.loc[rng.random(len(frame)) < 0.1, column] = np.nan
+    return frame
+
+def test_missing_values(frame):
+    frame = blank_cells(frame, ('Yield_tons_per_hectare', 'Rainfall_mm', 'Temperature_Celsius', 'Days_to_Harvest',
+                                'Region', 'Soil_Type', 'Weather_Condition', 'Fertilizer_Used', 'Irrigation_Used'))
+    assert_same_insights(reference_analyze_crop_frame(frame), analyze_crop_frame(as_categories(frame)))
+
+def test_blank_categories_from_csv(frame, tmp_path):
+    # One blank cell used to make analyze_crop_data return no insights at all
+    frame = blank_cells(frame, ('Weather_Condition', 'Fertilizer_Used'))
+    csv_path = tmp_path / 'crop_yield.csv'
+    frame.to_csv(csv_path, index=False)
+
+    actual = analyze_crop_data(str(csv_path))
+    assert len(actual) == 6
+    assert_same_insights(reference_analyze_crop_data(csv_path), actual)
+
+def test_crop_without_rainfall(frame):
+    frame.loc[frame['Crop'] == 'Wheat', 'Rainfall_mm'] = np.nan
+    assert_same_insights(reference_analyze_crop_frame(frame), analyze_crop_frame(as_categories(frame)))
+
+def test_single_row_crop(frame):
+    single = frame.iloc[[0]].assign(Crop='Sorghum')
+    frame = pd.concat([frame, single], ignore_index=True)
+
+    expected = reference_analyze_crop_frame(frame)
+    assert expected['sorghum']['total_samples'] == 1
+    assert_same_insights(expected, analyze_crop_frame(as_categories(frame)))
+
+def test_crop_without_high_yield_rows(frame):
+    # All-NaN yields leave no high-yield rows, so the crop is left out
+    frame.loc[frame['Crop'] == 'Rice', 'Yield_tons_per_hectare'] = np.nan
+
+    expected = reference_analyze_crop_frame(frame)
+    assert 'rice' not in expected
+    assert_same_insights(expected, analyze_crop_frame(as_categories(frame)))
+
+def test_unused_crop_category(frame):
+    # A category with no rows (e.g. left over from filtering) is not a crop
+    data = as_categories(frame)
+    data['Crop'] = data['Crop'].cat.add_categories(['Sorghum'])
+
+    actual = analyze_crop_frame(data)
+    assert 'sorghum' not in actual
+    assert_same_insights(reference_analyze_crop_frame(frame), actual)
+
+def test_empty_frame(frame):
+    empty = frame.iloc[:0]
+    assert reference_analyze_crop_frame(empty) == {}
+    assert analyze_crop_frame(as_categories(empty)) == {}
+
+def test_from_csv(frame, tmp_path):
+    csv_path = tmp_path / 'crop_yield.csv'
+    frame.to_csv(csv_path, index=False)
+    assert_same_insights(reference_analyze_crop_data(csv_path), analyze_crop_data(str(csv_path)))
@@ -0,0 +1,89 @@
+"""
+MicroBatcher: a batch runs when it is full or when its leader's wait ends.
+"""
+
+import threading
+import time
+
+import pytest
+
+from ml.batcher import MicroBatcher
+
+class Recorder:
+    """run_batch that records every batch it is given and doubles each item."""
+
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.delay = delay
+
+    def __call__(self, key, items):
+        self.batches.append((key, list(items)))
+        time.sleep(self.delay)
+        return [item * 2 for item in items]
+
+def submit_concurrently(batcher, key, items):
+    results = [None] * len(items)
+
+    def worker(position, item):
+        results[position] = batcher.submit(key, item)
+
+    threads = [threading.Thread(target=worker, args=(position, item)) for position, item in enumerate(items)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+def test_flushes_when_full():
+    run_batch = Recorder()
+    # A wait far longer than the test: only a full batch can run this fast
+    batcher = MicroBatcher(run_batch, max_batch_size=4, max_wait_ms=10_000)
+
+    started = time.perf_counter()
+    results = submit_concurrently(batcher, 'bundle', [1, 2, 3, 4])
+
+    assert time.perf_counter() - started < 5
+    assert results == [2, 4, 6, 8]
+    assert [sorted(items) for _, items in run_batch.batches] == [[1, 2, 3, 4]]
+    assert batcher.stats()['batch_size_buckets']['4'] == 1
+
+def test_flushes_on_timeout():
+    run_batch = Recorder()
+    batcher = MicroBatcher(run_batch, max_batch_size=32, max_wait_ms=20)
+
+    started = time.perf_counter()
+    assert batcher.submit('bundle', 5) == 10
+    elapsed = time.perf_counter() - started
+
+    assert 0.015 <= elapsed < 1
+    assert run_batch.batches == [('bundle', [5])]
+
+def test_keys_are_batched_separately():
+    run_batch = Recorder()
+    batcher = MicroBatcher(run_batch, max_batch_size=2, max_wait_ms=10_000)
+
+    threads = [threading.Thread(target=batcher.submit, args=(key, 1)) for key in ('a', 'b', 'a', 'b')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert sorted(key for key, _ in run_batch.batches) == ['a', 'b']
+    assert all(len(items) == 2 for _, items in run_batch.batches)
+
+def test_errors_reach_every_caller():
+    def failing(key, items):
+        raise ValueError("model failed")
+
+    batcher = MicroBatcher(failing, max_batch_size=8, max_wait_ms=5)
+    with pytest.raises(ValueError, match="model failed"):
+        batcher.submit('bundle', 1)
+    assert batcher.stats()['errors'] == 1
+
+def test_wrong_result_count_is_an_error():
+    batcher = MicroBatcher(lambda key, items: [], max_batch_size=8, max_wait_ms=5)
+    with pytest.raises(RuntimeError, match="0 results for 1 requests"):
+        batcher.submit('bundle', 1)
+
+def test_batch_size_one_disables_batching():
+    assert not MicroBatcher(Recorder(), max_batch_size=1).enabled
@@ -0,0 +1,60 @@
+"""
+CategoryEncoder: alias spellings, the counted fallback for unknown values
+and batch encoding.
+"""
+
+import numpy as np
+from sklearn.preprocessing import LabelEncoder
+
+from ml.encoding import FALLBACK_CODE, CategoryEncoder
+
+def fitted(*classes):
+    return LabelEncoder().fit(list(classes))
+
+def make_encoder():
+    return CategoryEncoder({
+        'Region': fitted('East', 'North', 'South', 'West'),
+        'Soil_Type': fitted('Clay', 'Loam', 'Sandy'),
+        'Weather_Condition': fitted('Cloudy', 'Rainy', 'Sunny')
+    })
+
+def test_codes_match_label_encoder():
+    encoder = make_encoder()
+    assert encoder.encode_row('South', 'Loam', 'Sunny') == (2, 1, 2)
+
+def test_aliases_encode_like_the_trained_spelling():
+    encoder = make_encoder()
+    # Trained on North/Loam/Sandy; the other spelling of each group resolves to it
+    assert encoder.encode('Region', 'Northern') == encoder.encode('Region', 'North')
+    assert encoder.encode('Soil_Type', 'Loamy') == encoder.encode('Soil_Type', 'Loam')
+    assert encoder.encode('Soil_Type', 'Sand') == encoder.encode('Soil_Type', 'Sandy')
+    assert encoder.stats()['Region'] == 0
+
+def test_unknown_values_fall_back_and_are_counted():
+    encoder = make_encoder()
+    assert encoder.encode('Region', 'Atlantis') == FALLBACK_CODE
+    assert encoder.encode('Region', None) == FALLBACK_CODE
+    assert encoder.encode_row('Atlantis', 'Mud', 'Sunny') == (FALLBACK_CODE, FALLBACK_CODE, 2)
+
+    counts = encoder.stats()
+    assert counts['Region'] == 3
+    assert counts['Soil_Type'] == 1
+    assert counts['Weather_Condition'] == 0
+
+def test_batch_matches_single_values():
+    encoder = make_encoder()
+    values = ['West', 'Northern', 'Atlantis', 'East', 'West', None]
+
+    codes = encoder.encode_batch('Region', values)
+    assert codes.tolist() == [make_encoder().encode('Region', value) for value in values]
+    assert encoder.stats()['Region'] == 2
+
+def test_batch_with_unknown_code_is_not_counted():
+    encoder = make_encoder()
+    codes = encoder.encode_batch('Soil_Type', ['Clay', 'Mud'], unknown_code=-1)
+    assert codes.tolist() == [0, -1]
+    assert encoder.stats()['Soil_Type'] == 0
+
+def test_empty_batch():
+    codes = make_encoder().encode_batch('Region', [])
+    assert codes.dtype == np.int64 and codes.size == 0
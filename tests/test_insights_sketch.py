@@ -0,0 +1,71 @@
+"""
+The incremental insights sketch against analyze_crop_frame: exact fields
+must match, the optimal ranges must stay within the documented bound.
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+from benchmarks.generate_dataset import generate_frame
+from benchmarks.insights_sketch import TOLERANCES
+from ml.data_analyzer import analyze_crop_frame
+from ml.insights_sketch import InsightsSketch
+
+def assert_matches_analyzer(expected, actual):
+    assert list(expected) == list(actual)
+    for crop, fields in expected.items():
+        for key, value in fields.items():
+            other = actual[crop][key]
+            if key == 'high_yield_samples':
+                continue
+            if isinstance(value, (float, np.floating)) and math.isnan(value):
+                assert math.isnan(other), f"{crop}.{key}: {other!r}"
+            elif key in TOLERANCES:
+                assert abs(other - value) <= TOLERANCES[key] + 1e-9, f"{crop}.{key}: exact={value} sketch={other}"
+            else:
+                assert other == value, f"{crop}.{key}: exact={value!r} sketch={other!r}"
+
+@pytest.fixture
+def frame():
+    # Enough rows that neighbouring high-yield values are closer than a histogram bin
+    return generate_frame(200_000, seed=11)
+
+def test_matches_analyzer(frame):
+    assert_matches_analyzer(analyze_crop_frame(frame), InsightsSketch().update(frame).insights())
+
+def test_missing_values(frame):
+    rng = np.random.default_rng(5)
+    frame = frame.astype({'Fertilizer_Used': object, 'Irrigation_Used': object})
+    for column in ('Yield_tons_per_hectare', 'Rainfall_mm', 'Temperature_Celsius', 'Days_to_Harvest',
+                   'Region', 'Soil_Type', 'Weather_Condition', 'Fertilizer_Used', 'Irrigation_Used'):
+        frame.loc[rng.random(len(frame)) < 0.1, column] = np.nan
+
+    expected = analyze_crop_frame(frame)
+    actual = InsightsSketch().update(frame).insights()
+    for fields in actual.values():
+        assert not math.isnan(fields['avg_harvest_days'])
+    assert_matches_analyzer(expected, actual)
+
+def test_crop_without_harvest_days(frame):
+    frame.loc[frame['Crop'] == 'Wheat', 'Days_to_Harvest'] = np.nan
+    actual = InsightsSketch().update(frame).insights()
+    assert math.isnan(actual['wheat']['avg_harvest_days'])
+    assert_matches_analyzer(analyze_crop_frame(frame), actual)
+
+def test_merged_batches_match_one_pass(frame):
+    frame.loc[::7, 'Soil_Type'] = np.nan
+    frame.loc[::5, 'Days_to_Harvest'] = np.nan
+
+    merged = InsightsSketch()
+    for start in range(0, len(frame), 50_000):
+        merged.merge(InsightsSketch().update(frame.iloc[start:start + 50_000]))
+    assert merged.insights() == InsightsSketch().update(frame).insights()
+
+def test_save_and_load(frame, tmp_path):
+    frame.loc[::9, 'Region'] = np.nan
+    sketch = InsightsSketch().update(frame)
+    path = tmp_path / 'crop_yield.sketch.npz'
+    sketch.save(path)
+    assert InsightsSketch.load(path).insights() == sketch.insights()
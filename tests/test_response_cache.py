@@ -0,0 +1,68 @@
+"""
+RecommendationCache: TTL expiry, LRU eviction and copy-on-read.
+"""
+
+import time
+
+from ml.response_cache import RecommendationCache
+
+FEATURES = {
+    'Region': 1, 'Soil_Type': 2, 'Weather_Condition': 0,
+    'Fertilizer_Used': 1, 'Irrigation_Used': 0,
+    'Rainfall_mm': 500.0, 'Temperature_Celsius': 25.0
+}
+
+def test_hit_and_miss():
+    cache = RecommendationCache()
+    key = cache.make_key('v1', FEATURES)
+    assert cache.get(key) is None
+
+    cache.put(key, [{'name': 'Rice'}])
+    assert cache.get(key) == [{'name': 'Rice'}]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_key_depends_on_model_version():
+    cache = RecommendationCache()
+    cache.put(cache.make_key('v1', FEATURES), ['v1 answer'])
+    assert cache.get(cache.make_key('v2', FEATURES)) is None
+
+def test_entries_expire_after_ttl():
+    cache = RecommendationCache(ttl_seconds=0.05)
+    cache.put('key', 'value')
+    assert cache.get('key') == 'value'
+
+    time.sleep(0.1)
+    assert cache.get('key') is None
+    assert cache.expirations == 1
+    assert cache.stats()['entries'] == 0
+
+def test_least_recently_used_is_evicted():
+    cache = RecommendationCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    # Reading 'a' makes 'b' the least recently used
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.evictions == 1
+
+def test_callers_get_their_own_copy():
+    cache = RecommendationCache()
+    value = [{'name': 'Rice'}]
+    cache.put('key', value)
+    value[0]['name'] = 'changed'
+    cache.get('key')[0]['name'] = 'changed again'
+    assert cache.get('key') == [{'name': 'Rice'}]
+
+def test_disabled_cache_stores_nothing():
+    cache = RecommendationCache(max_entries=0)
+    assert not cache.enabled
+    cache.put('key', 'value')
+    assert cache.get('key') is None
+
+def test_quantize():
+    cache = RecommendationCache(rainfall_precision=0, temperature_precision=1)
+    assert cache.quantize(512.4, 25.26) == (512.0, 25.3)